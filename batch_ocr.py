@@ -4,15 +4,25 @@ Batch OCR processing with concurrent requests and benchmarking
 Supports PDF and image files
 """
 import argparse
+import asyncio
 import base64
+import copy
+import difflib
+import glob
+import gzip
+import hashlib
 import json
 import time
 import os
+import queue
+import random
+import threading
 from pathlib import Path
 from io import BytesIO
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import requests
+import aiohttp
 from PIL import Image
 try:
     import pdf2image
@@ -21,26 +31,351 @@ except ImportError:
     PDF_SUPPORT = False
     print("Warning: pdf2image not installed. PDF support disabled.")
     print("Install with: pip install pdf2image")
+try:
+    import numpy as np
+except ImportError:
+    np = None  # only needed for --skip-blank / --dedupe
 
 # Configuration - Get from environment variable
 RUNPOD_API_KEY = os.environ.get("RUNPOD_API_KEY", "")
 ENDPOINT_ID = os.environ.get("RUNPOD_ENDPOINT_ID", "qc12vfvnrfq554")
-RUNPOD_URL = f"https://api.runpod.ai/v2/{ENDPOINT_ID}/run"
-STATUS_URL = f"https://api.runpod.ai/v2/{ENDPOINT_ID}/status"
+# Override to point at a local stand-in for the /run and /status endpoints
+RUNPOD_API_BASE = os.environ.get("RUNPOD_API_BASE", "https://api.runpod.ai/v2")
+
+# PDF rasterization: pages per pdftoppm call, parallel calls and pages buffered ahead
+DEFAULT_DPI = 200
+RASTER_CHUNK_PAGES = 8
+RASTER_WORKERS = 2
+MAX_BUFFERED_PAGES = 32
+
+# Multi-page jobs must stay under RunPod's /run request size limit (10MB)
+MAX_PAYLOAD_BYTES = 9_000_000
+PAYLOAD_OVERHEAD_BYTES = 4096
+
+# Streaming output (--stream-output): the JSONL file is flushed every N records or T seconds
+RESULT_FLUSH_EVERY = 64
+RESULT_FLUSH_INTERVAL = 2.0
+
+# Corpus mode: results.jsonl is fsynced (and the manifest updated) every N completions or T seconds
+MANIFEST_SYNC_EVERY = 64
+MANIFEST_SYNC_INTERVAL = 2.0
+
+# Status polling: start fast, back off while a job sits in the queue
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+POLL_BACKOFF = 1.5
 
-if not RUNPOD_API_KEY:
-    print("Error: RUNPOD_API_KEY environment variable not set!")
-    print("Set it with: export RUNPOD_API_KEY=your_key_here")
-    exit(1)
+# Transient HTTP errors (throttling, 5xx, dropped connections) are retried with
+# full-jitter exponential backoff: sleep uniform(0, min(max, base * 2^attempt))
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# Jobs that time out (a stuck worker hit the execution timeout) are resubmitted this often
+JOB_TIMEOUT_RETRIES = 1
 
-def image_to_base64(image):
+# Hedging: a job still unfinished past this percentile of recent job latencies
+# gets a duplicate submission; hedges are at most HEDGE_BUDGET of the jobs in
+# flight (but one is always allowed)
+HEDGE_PERCENTILE = 95
+HEDGE_BUDGET = 0.05
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 2.0
+HEDGE_DEFAULT_DELAY = 60.0  # until HEDGE_MIN_SAMPLES jobs of that size have completed
+HEDGE_WINDOW = 256
+
+# Circuit breaker: pause submissions while this share of recent submissions fail
+BREAKER_ERROR_RATE = 0.5
+BREAKER_WINDOW = 50
+BREAKER_MIN_REQUESTS = 10
+BREAKER_COOLDOWN = 10.0
+
+# Upload encoding: lossless PNG by default; JPEG/WebP are much smaller for scans
+IMAGE_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+DEFAULT_ENCODING = {"format": "png", "quality": 85, "grayscale": False, "max_dimension": None, "scale": 1.0}
+
+# Settings compared by --benchmark-encoding (the first entry is the baseline)
+BENCHMARK_ENCODINGS = [
+    {"format": "png"},
+    {"format": "png", "grayscale": True},
+    {"format": "jpeg", "quality": 90},
+    {"format": "jpeg", "quality": 75},
+    {"format": "jpeg", "quality": 75, "grayscale": True},
+    {"format": "webp", "quality": 80},
+    {"format": "webp", "quality": 80, "grayscale": True},
+    {"format": "jpeg", "quality": 85, "grayscale": True, "scale": 0.75},
+]
+
+def image_to_base64(image, image_format="png", quality=85):
     """Convert PIL Image to base64 string"""
     buffered = BytesIO()
-    image.save(buffered, format="PNG")
+    if image_format == "png":
+        image.save(buffered, format="PNG")
+    else:
+        image.save(buffered, format=IMAGE_FORMATS[image_format], quality=quality)
     return base64.b64encode(buffered.getvalue()).decode()
 
-def extract_images(file_path):
-    """Extract images from PDF or load image file"""
+def encode_page(image, encoding=None):
+    """Prepare a page for upload and return its job input entry.
+
+    Applies grayscale conversion, downscaling (encoding["scale"], e.g.
+    target DPI / render DPI, and/or a max_dimension cap) and the chosen
+    format. Downscaled pages are sent as {"data": ..., "scale": ...} so the
+    worker reports coordinates in the original page's pixels.
+    """
+    encoding = {**DEFAULT_ENCODING, **(encoding or {})}
+    if encoding["grayscale"] and image.mode != "L":
+        image = image.convert("L")
+
+    scale = encoding["scale"] or 1.0
+    if encoding["max_dimension"]:
+        scale = min(scale, encoding["max_dimension"] / max(image.size))
+    if scale < 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        original_width = image.width
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        image_base64 = image_to_base64(image, encoding["format"], encoding["quality"])
+        return {"data": image_base64, "scale": original_width / size[0]}
+
+    return image_to_base64(image, encoding["format"], encoding["quality"])
+
+# Page pre-filter (--skip-blank / --dedupe): same ink and hash thresholds as the worker
+BLANK_INK_RATIO = 0.00001
+DUPLICATE_MAX_DISTANCE = 0.02
+DEDUPE_WINDOW = 2048
+
+def page_signature(image):
+    """Return (ink_ratio, hash_bits) of a page, as computed by the worker.
+
+    Both come from a copy shrunk to 512 px. Ink is the share of pixels much
+    darker than the paper; the hash is a mean hash on a 32-column grid.
+    """
+    width, height = image.size
+    ratio = min(1.0, 512 / max(width, height))
+    small = image.resize((max(1, round(width * ratio)), max(1, round(height * ratio))),
+                         Image.Resampling.BOX).convert("L")
+    pixels = np.asarray(small, dtype=np.int16)
+    ink = float(np.mean(pixels < np.percentile(pixels, 95) - 64))
+    grid = np.asarray(small.resize((32, max(1, round(32 * height / width))), Image.Resampling.BOX), dtype=np.float32)
+    return ink, grid < grid.mean()
+
+class PageIndex:
+    """Near-identical page lookup by perceptual hash (see the worker's PageIndex).
+
+    Hashes are split into one band more than the allowed differing bits, so
+    a match shares at least one band exactly. remove() drops a page again.
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self._bands = {}
+        self._hashes = {}
+
+    def match(self, key, bits):
+        """Return the key of an earlier matching page, or index this one and return None"""
+        allowed = int(bits.size * self.max_distance)
+        bands = [(bits.shape, band, chunk.tobytes())
+                 for band, chunk in enumerate(np.array_split(bits.ravel(), min(bits.size, allowed + 1)))]
+        compared = set()
+        for band in bands:
+            for other in self._bands.get(band, ()):
+                if other not in compared:
+                    compared.add(other)
+                    if np.count_nonzero(self._hashes[other][0] != bits) <= allowed:
+                        return other
+        for band in bands:
+            self._bands.setdefault(band, []).append(key)
+        self._hashes[key] = (bits, bands)
+        return None
+
+    def remove(self, key):
+        _, bands = self._hashes.pop(key)
+        for band in bands:
+            self._bands[band].remove(key)
+            if not self._bands[band]:
+                del self._bands[band]
+
+def _scale_coords(obj, fx, fy):
+    """Scale every bbox, image_bbox and polygon in a page result, in place"""
+    if isinstance(obj, list):
+        for item in obj:
+            _scale_coords(item, fx, fy)
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            if value is None:
+                continue
+            if key in ("bbox", "image_bbox"):
+                obj[key] = [value[0] * fx, value[1] * fy, value[2] * fx, value[3] * fy]
+            elif key == "polygon":
+                obj[key] = [[x * fx, y * fy] for x, y in value]
+            elif isinstance(value, (list, dict)):
+                _scale_coords(value, fx, fy)
+
+class PageFilter:
+    """Skips uploads of blank pages and of near-identical pages within a run.
+
+    Blank pages get an empty result right away. A duplicate gets a copy of its
+    original's result, marked "duplicate_of", once the original finishes. Only
+    the last `window` distinct pages are kept for matching, so memory stays
+    bounded on long corpus runs.
+    """
+
+    def __init__(self, skip_blank=True, dedupe=False, blank_ink_ratio=BLANK_INK_RATIO,
+                 max_distance=DUPLICATE_MAX_DISTANCE, window=DEDUPE_WINDOW):
+        self.blank_ink_ratio = blank_ink_ratio if skip_blank else 0
+        self.index = PageIndex(max_distance) if dedupe else None
+        self.window = window
+        self._order = deque()
+        self._sizes = {}
+        self._records = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def check(self, page_num, image):
+        """Return ("blank", None) or ("duplicate", original page) to skip a page, else None.
+
+        Runs on the encoder threads.
+        """
+        ink, bits = page_signature(image)
+        if ink < self.blank_ink_ratio:
+            return "blank", None
+        if self.index is None:
+            return None
+        with self._lock:
+            original = self.index.match(page_num, bits)
+            self._sizes[page_num] = image.size
+            if original is None:
+                self._order.append(page_num)
+                if len(self._order) > self.window:
+                    evicted = self._order.popleft()
+                    self.index.remove(evicted)
+                    self._records.pop(evicted, None)
+                    self._sizes.pop(evicted, None)
+        return None if original is None else ("duplicate", original)
+
+    def skip_record(self, page_num, kind, original):
+        """Record for a skipped page, or None while its original is still in flight"""
+        if kind == "blank":
+            return {"page": page_num, "blank": True,
+                    "result": {"success": True, "results": [{"text_lines": [], "blank": True}]}}
+        with self._lock:
+            record = self._records.get(original)
+            if record is None:
+                self._waiting.setdefault(original, []).append(page_num)
+                return None
+        return self._copy(page_num, original, record)
+
+    def finished(self, record):
+        """Note a finished page; returns the records of duplicates that waited for it"""
+        page_num = record["page"]
+        with self._lock:
+            if page_num in self._sizes and "duplicate_of" not in record:
+                self._records[page_num] = record
+            waiting = self._waiting.pop(page_num, [])
+        return [self._copy(duplicate, page_num, record) for duplicate in waiting]
+
+    def _copy(self, page_num, original, record):
+        if "error" in record:
+            return {"page": page_num, "duplicate_of": original,
+                    "error": f"duplicate of {original}, which failed: {record['error']}"}
+        result = copy.deepcopy(record["result"])
+        with self._lock:
+            original_size, size = self._sizes.get(original), self._sizes.pop(page_num, None)
+        if original_size and size and original_size != size:
+            _scale_coords(result.get("results", []), size[0] / original_size[0], size[1] / original_size[1])
+        for page_result in result.get("results", []):
+            page_result["duplicate_of"] = original
+        return {"page": page_num, "job_id": record.get("job_id"), "duplicate_of": original, "result": result}
+
+def prepare_page(page_num, image, encoding=None, page_filter=None):
+    """Encode a page for upload, or return page_filter's skip verdict (a tuple)"""
+    if page_filter is not None:
+        verdict = page_filter.check(page_num, image)
+        if verdict is not None:
+            return verdict
+    return encode_page(image, encoding)
+
+def entry_size(entry):
+    """Approximate JSON size of one job image entry"""
+    return len(entry["data"]) + 32 if isinstance(entry, dict) else len(entry)
+
+_RASTER_DONE = object()
+
+def _page_runs(page_nums, chunk_pages):
+    """Group ascending page numbers into (first, last) runs of consecutive pages, chunk_pages at most"""
+    runs = []
+    for page in page_nums:
+        if runs and page == runs[-1][1] + 1 and page - runs[-1][0] < chunk_pages:
+            runs[-1][1] = page
+        else:
+            runs.append([page, page])
+    return [tuple(run) for run in runs]
+
+def iter_pdf_pages(file_path, page_count, dpi=DEFAULT_DPI, chunk_pages=RASTER_CHUNK_PAGES,
+                   workers=RASTER_WORKERS, max_buffered=MAX_BUFFERED_PAGES, skip_pages=()):
+    """Rasterize a PDF in page-range chunks on worker threads.
+
+    Yields (page_num, image) roughly in page order. At most max_buffered
+    rendered pages wait for the consumer (plus the chunks being rendered),
+    so memory stays bounded regardless of document length. Pages in
+    skip_pages (e.g. already done on a resumed run) are never rendered.
+    """
+    pages = queue.Queue(maxsize=max_buffered)
+    ranges = queue.Queue()
+    for run in _page_runs([page for page in range(1, page_count + 1) if page not in skip_pages], chunk_pages):
+        ranges.put(run)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def rasterize():
+        try:
+            while not stop.is_set():
+                try:
+                    first, last = ranges.get_nowait()
+                except queue.Empty:
+                    return
+                # pdftoppm runs in a subprocess, so threads render in parallel
+                images = pdf2image.convert_from_path(str(file_path), dpi=dpi, first_page=first, last_page=last)
+                for offset in range(len(images)):
+                    if not put((first + offset, images[offset])):
+                        return
+                    images[offset] = None
+        except Exception as e:
+            put(e)
+        finally:
+            put(_RASTER_DONE)
+
+    threads = [threading.Thread(target=rasterize, name=f"raster-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        finished = 0
+        while finished < len(threads):
+            item = pages.get()
+            if item is _RASTER_DONE:
+                finished += 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+
+def extract_images(file_path, dpi=DEFAULT_DPI, raster_workers=RASTER_WORKERS, max_buffered=MAX_BUFFERED_PAGES,
+                   skip_pages=()):
+    """Open a PDF or image file; returns (page_count, iterator of (page_num, image)).
+
+    Pages in skip_pages are left out of the iterator without being loaded.
+    """
     file_path = Path(file_path)
 
     if not file_path.exists():
@@ -48,176 +383,1065 @@ def extract_images(file_path):
 
     suffix = file_path.suffix.lower()
 
-    # PDF handling
+    # PDF handling - pages are rasterized lazily while earlier ones are being submitted
     if suffix == '.pdf':
         if not PDF_SUPPORT:
             raise RuntimeError("PDF support not available. Install pdf2image: pip install pdf2image")
-        print(f"📄 Converting PDF to images...")
-        images = pdf2image.convert_from_path(str(file_path))
-        print(f"✓ Extracted {len(images)} pages from PDF")
-        return images
+        page_count = pdf2image.pdfinfo_from_path(str(file_path))["Pages"]
+        pending = sum(1 for page in range(1, page_count + 1) if page not in skip_pages)
+        print(f"📄 Streaming {pending} of {page_count} PDF pages at {dpi} DPI ({raster_workers} rasterizer threads)")
+        return page_count, iter_pdf_pages(file_path, page_count, dpi=dpi, workers=raster_workers,
+                                          max_buffered=max_buffered, skip_pages=skip_pages)
 
     # Image handling
     elif suffix in ['.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.webp']:
-        print(f"🖼️  Loading image file...")
-        img = Image.open(file_path).convert("RGB")
-        print(f"✓ Loaded image: {img.size}")
-        return [img]
+        def load():
+            if 1 in skip_pages:
+                return
+            print(f"🖼️  Loading image file...")
+            img = Image.open(file_path).convert("RGB")
+            print(f"✓ Loaded image: {img.size}")
+            yield 1, img
+        return 1, load()
 
     else:
         raise ValueError(f"Unsupported file type: {suffix}. Supported: PDF, PNG, JPG, JPEG, TIFF, BMP, WEBP")
 
-def submit_ocr_job(image_base64, page_num, languages=["en"]):
-    """Submit OCR job to RunPod"""
-    response = requests.post(
-        RUNPOD_URL,
-        headers={
-            "Authorization": f"Bearer {RUNPOD_API_KEY}",
-            "Content-Type": "application/json"
-        },
-        json={
-            "input": {
-                "images": [image_base64],
-                "languages": languages
-            }
-        },
-        timeout=30
-    )
+def is_transient(error):
+    """Whether a failed request is worth retrying: throttling, 5xx, timeouts and dropped connections"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRYABLE_STATUS
+    return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+def _retry_after(error):
+    try:
+        return float(error.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return 0.0
+
+class RetryPolicy:
+    """Full-jitter exponential backoff for transient request errors, and resubmission of timed-out jobs"""
 
-    result = response.json()
+    def __init__(self, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 job_timeouts=JOB_TIMEOUT_RETRIES):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.job_timeouts = job_timeouts
+        self.retries = 0
+        self.resubmits = 0
+
+    def delay(self, attempt, retry_after=0.0):
+        """Seconds to sleep before retry number attempt + 1, honouring a server's Retry-After"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(backoff, min(retry_after, self.max_delay))
+
+class CircuitBreaker:
+    """Pauses job submission while the endpoint's recent submit error rate is too high.
+
+    Outcomes of the last `window` submissions are kept. Once at least
+    min_requests are in and error_rate of them failed, the breaker opens:
+    submissions wait, and one probe submission is let through every cooldown
+    seconds. Only a successful probe closes it again. error_rate=0 disables
+    it.
+    """
+
+    def __init__(self, error_rate=BREAKER_ERROR_RATE, window=BREAKER_WINDOW, min_requests=BREAKER_MIN_REQUESTS,
+                 cooldown=BREAKER_COOLDOWN):
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self.probe_at = None
+        self.trips = 0
+
+    async def acquire(self):
+        """Wait until a submission may go out; returns True if it is the half-open probe"""
+        while self.opened_at is not None:
+            next_probe = (self.probe_at or self.opened_at) + self.cooldown
+            now = time.monotonic()
+            if now >= next_probe:
+                self.probe_at = now
+                return True
+            await asyncio.sleep(min(next_probe - now, 0.5))
+        return False
+
+    def record(self, ok, probe=False):
+        """Record a submission's outcome; while open only the probe's outcome counts"""
+        if not self.error_rate:
+            return
+        if self.opened_at is not None:
+            if probe and ok:
+                print(f"  ▶️  Circuit closed: probe submission succeeded after "
+                      f"{time.monotonic() - self.opened_at:.1f}s")
+                self.opened_at = self.probe_at = None
+                self.outcomes.clear()
+            return
+        self.outcomes.append(ok)
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= self.min_requests and failures >= self.error_rate * len(self.outcomes):
+            self.opened_at = time.monotonic()
+            self.trips += 1
+            print(f"  ⏸️  Circuit open: {failures}/{len(self.outcomes)} recent submissions failed - "
+                  f"pausing submissions, probing every {self.cooldown:g}s")
+
+class Hedger:
+    """Decides when a slow job gets a duplicate submission.
+
+    Latencies of completed jobs are kept per pack size. A job is hedged once
+    it has run past the given percentile of its size's latencies (never
+    before min_delay; default_delay until min_samples are known), while
+    running hedges stay under budget of the jobs in flight, with at least one
+    allowed. percentile=0 disables hedging.
+    """
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET, min_samples=HEDGE_MIN_SAMPLES,
+                 min_delay=HEDGE_MIN_DELAY, default_delay=HEDGE_DEFAULT_DELAY, window=HEDGE_WINDOW):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.window = window
+        self.latencies = {}
+        self.in_flight = 0
+        self.hedging = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def delay(self, pack_size):
+        """Seconds after submission at which a job of pack_size pages is hedged, or None"""
+        if not self.percentile:
+            return None
+        samples = self.latencies.get(pack_size, ())
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(samples)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))])
+
+    def allow(self):
+        return self.hedging < max(1, self.budget * self.in_flight)
+
+    def observe(self, pack_size, latency):
+        self.latencies.setdefault(pack_size, deque(maxlen=self.window)).append(latency)
+
+class RunPodClient:
+    """Pooled async HTTP client for a RunPod serverless endpoint.
+
+    Requests are retried on transient errors (see RetryPolicy). Submissions
+    to /run are gated by the circuit breaker and only their outcomes feed
+    it, so healthy status polls cannot hide a failing /run. The hedger is
+    used by run_job.
+    """
+
+    def __init__(self, api_key=RUNPOD_API_KEY, endpoint_id=ENDPOINT_ID, api_base=RUNPOD_API_BASE,
+                 max_connections=64, timeout=30, retry=None, breaker=None, hedger=None):
+        self.base_url = f"{api_base.rstrip('/')}/{endpoint_id}"
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedger = hedger or Hedger()
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, headers=self.headers, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def request(self, method, path, payload=None, gated=False):
+        """Send a request, retrying transient errors; gated requests wait for the circuit breaker"""
+        for attempt in range(self.retry.attempts + 1):
+            probe = gated and await self.breaker.acquire()
+            try:
+                async with self.session.request(method, f"{self.base_url}/{path}", json=payload) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+            except Exception as e:
+                transient = is_transient(e)
+                if gated:
+                    # Any response other than throttling/5xx means submissions get through
+                    self.breaker.record(not transient, probe)
+                if not transient or attempt == self.retry.attempts:
+                    raise
+                self.retry.retries += 1
+                await asyncio.sleep(self.retry.delay(attempt, _retry_after(e)))
+            else:
+                if gated:
+                    self.breaker.record(True, probe)
+                return result
+
+    async def post(self, path, payload):
+        return await self.request("POST", path, payload, gated=True)
+
+    async def get(self, path):
+        return await self.request("GET", path)
+
+    async def cancel(self, job_id):
+        """Best-effort cancel of a job nobody is waiting for any more (single attempt)"""
+        try:
+            async with self.session.post(f"{self.base_url}/cancel/{job_id}") as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+async def submit_ocr_job(client, images_base64, pages, languages=["en"], options=None):
+    """Submit OCR job for one or more pages to RunPod"""
+    result = await client.post("run", {
+        "input": {
+            "images": images_base64,
+            "languages": languages,
+            **(options or {})
+        }
+    })
     return {
-        "page": page_num,
+        "pages": pages,
         "job_id": result["id"],
         "status": result["status"],
         "submit_time": time.time()
     }
 
-def check_job_status(job_id):
+def pack_pages(encoded_pages, pages_per_job, max_payload_bytes=MAX_PAYLOAD_BYTES):
+    """Group (page_num, image_base64) pairs into jobs bounded by page count and payload size"""
+    packs = []
+    current = []
+    size = PAYLOAD_OVERHEAD_BYTES
+    for page_num, image_base64 in encoded_pages:
+        page_size = entry_size(image_base64) + 4
+        if current and (len(current) >= pages_per_job or size + page_size > max_payload_bytes):
+            packs.append(current)
+            current = []
+            size = PAYLOAD_OVERHEAD_BYTES
+        current.append((page_num, image_base64))
+        size += page_size
+    if current:
+        packs.append(current)
+    return packs
+
+def _page_span(pages):
+    return f"Page {pages[0]}" if len(pages) == 1 else f"Pages {pages[0]}-{pages[-1]}"
+
+def decode_output(output):
+    """Undo the response envelope and expand lean/columnar pages to text_lines.
+
+    A worker in HANDLER_MODE=stream returns the list of streamed items
+    ({"index": i, ...page} or an error); they are flattened into one
+    {"success": true, "results": [...]} response in page order.
+    """
+    if isinstance(output, list):
+        output = _flatten_stream(output)
+    if not isinstance(output, dict):
+        return output
+
+    if "encoding" in output and "payload" in output:
+        raw = base64.b64decode(output["payload"])
+        if output["encoding"] == "gzip+json":
+            output = json.loads(gzip.decompress(raw))
+        elif output["encoding"] == "msgpack":
+            import msgpack
+            output = msgpack.unpackb(raw, raw=False)
+        else:
+            raise ValueError(f"Unknown response encoding: {output['encoding']}")
+
+    if output.get("format") == "columnar":
+        for page in output.get("results", []):
+            if "text" not in page:
+                continue
+            regions = page.pop("region", None)
+            page["text_lines"] = [
+                {"text": text, "confidence": confidence, "bbox": bbox}
+                for text, confidence, bbox in zip(page.pop("text"), page.pop("confidence"), page.pop("bbox"))
+            ]
+            if regions is not None:
+                for line, region in zip(page["text_lines"], regions):
+                    if region is not None:
+                        line["region"] = region
+        # Pages are row-shaped now; a stale label would make them fail to decode again
+        output.pop("format")
+
+    return output
+
+def _flatten_stream(items):
+    errors = [item for item in items if not isinstance(item, dict) or "index" not in item]
+    if errors:
+        return errors[0] if isinstance(errors[0], dict) else {"success": False, "error": str(errors[0])}
+    results = [{key: value for key, value in item.items() if key != "index"}
+               for item in sorted(items, key=lambda item: item["index"])]
+    output = {"success": True, "results": results}
+    if any("text" in page and "text_lines" not in page for page in results):
+        output["format"] = "columnar"
+    return output
+
+async def check_job_status(client, job_id):
     """Check status of a job"""
-    response = requests.get(
-        f"{STATUS_URL}/{job_id}",
-        headers={"Authorization": f"Bearer {RUNPOD_API_KEY}"},
-        timeout=30
-    )
-    return response.json()
-
-def wait_for_job(job_id, max_wait=300, poll_interval=2):
-    """Wait for job to complete"""
+    return await client.get(f"status/{job_id}")
+
+async def wait_for_job(client, job_id, max_wait=300):
+    """Poll a job with adaptive backoff until it completes; a job that times out is cancelled"""
     start = time.time()
+    interval = MIN_POLL_INTERVAL
 
     while time.time() - start < max_wait:
-        result = check_job_status(job_id)
+        try:
+            result = await check_job_status(client, job_id)
+        except Exception as e:
+            # Still unreachable after the client's retries: the job may well be running, keep waiting
+            if not is_transient(e):
+                raise
+            await asyncio.sleep(MAX_POLL_INTERVAL)
+            continue
         status = result.get("status")
 
         if status == "COMPLETED":
             return result
-        elif status == "FAILED":
-            raise RuntimeError(f"Job failed: {result.get('error', 'Unknown error')}")
+        elif status in ("FAILED", "CANCELLED", "TIMED_OUT"):
+            error = TimeoutError if status == "TIMED_OUT" else RuntimeError
+            raise error(f"Job {status.lower()}: {result.get('error', 'Unknown error')}")
 
-        time.sleep(poll_interval)
+        # Running jobs are close to done; queued jobs can wait longer between polls
+        if status == "IN_PROGRESS":
+            interval = MIN_POLL_INTERVAL
+        else:
+            interval = min(interval * POLL_BACKOFF, MAX_POLL_INTERVAL)
+        await asyncio.sleep(interval)
 
+    await client.cancel(job_id)
     raise TimeoutError(f"Job {job_id} did not complete within {max_wait}s")
 
-def process_single_page(page_num, image, languages, stats):
-    """Process a single page"""
+async def _outlives_hedge_delay(hedger, tasks, pack_size, started):
+    """Wait until the job finishes (False) or runs past the hedger's delay (True).
+
+    The delay is re-read while waiting, as it drops once latency samples come in.
+    """
+    while True:
+        delay = hedger.delay(pack_size)
+        if delay is None:
+            return False
+        remaining = started + delay - time.time()
+        if remaining <= 0:
+            return True
+        done, _ = await asyncio.wait(tasks, timeout=min(remaining, MAX_POLL_INTERVAL))
+        if done:
+            return False
+
+async def run_job(client, images_base64, pages, languages, options=None, on_submit=None):
+    """Submit a job and wait for it; returns (job_id, status result, submit seconds).
+
+    A job still unfinished past client.hedger's latency percentile is
+    submitted a second time. Whichever copy completes first wins and the
+    other is cancelled; the job only fails if both copies fail. A job that
+    times out is resubmitted up to client.retry.job_timeouts times.
+    """
+    for attempt in range(client.retry.job_timeouts + 1):
+        try:
+            return await _run_hedged(client, images_base64, pages, languages, options, on_submit)
+        except TimeoutError as e:
+            if attempt == client.retry.job_timeouts:
+                raise
+            client.retry.resubmits += 1
+            print(f"  ↻ {_page_span(pages)}: {e} - resubmitting")
+
+async def _run_hedged(client, images_base64, pages, languages, options=None, on_submit=None):
+    hedger = client.hedger
+    submit_start = time.time()
+    job_info = await submit_ocr_job(client, images_base64, pages, languages, options)
+    submit_time = time.time() - submit_start
+    job_id = job_info["job_id"]
+    print(f"  ✓ {_page_span(pages)}: Job {job_id} submitted")
+    if on_submit is not None:
+        on_submit(pages, job_id)
+
+    tasks = {asyncio.ensure_future(wait_for_job(client, job_id)): job_id}
+    hedger.in_flight += 1
+    hedged = False
     try:
-        # Convert to base64
-        convert_start = time.time()
-        img_base64 = image_to_base64(image)
-        convert_time = time.time() - convert_start
-
-        print(f"  Page {page_num}: Submitting job... (conversion: {convert_time:.2f}s)")
-
-        # Submit job
-        submit_start = time.time()
-        job_info = submit_ocr_job(img_base64, page_num, languages)
-        submit_time = time.time() - submit_start
-
-        print(f"  ✓ Page {page_num}: Job {job_info['job_id']} submitted")
-
-        # Return job info without waiting
-        return {
-            "page": page_num,
-            "job_id": job_info["job_id"],
-            "convert_time": convert_time,
-            "submit_time": submit_time,
-            "submit_timestamp": time.time()
-        }
+        if await _outlives_hedge_delay(hedger, tasks, len(pages), submit_start):
+            # Over budget: wait for a running hedge to finish (or this job to)
+            while not hedger.allow():
+                done, _ = await asyncio.wait(tasks, timeout=MAX_POLL_INTERVAL)
+                if done:
+                    break
+            else:
+                hedger.hedges += 1
+                hedger.hedging += 1
+                hedged = True
+                try:
+                    hedge_id = (await submit_ocr_job(client, images_base64, pages, languages, options))["job_id"]
+                    print(f"  ⑂ {_page_span(pages)}: Job {job_id} slower than p{hedger.percentile:g} "
+                          f"({time.time() - submit_start:.1f}s) - hedged with job {hedge_id}")
+                    tasks[asyncio.ensure_future(wait_for_job(client, hedge_id))] = hedge_id
+                except Exception as e:
+                    print(f"  ⚠️  {_page_span(pages)}: Hedge submission failed - {e}")
+
+        error = None
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                winner_id = tasks.pop(task)
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                hedger.observe(len(pages), time.time() - submit_start)
+                if winner_id != job_id:
+                    hedger.wins += 1
+                return winner_id, task.result(), submit_time
+        raise error
+    finally:
+        hedger.in_flight -= 1
+        if hedged:
+            hedger.hedging -= 1
+        for task, loser_id in tasks.items():
+            task.cancel()
+            print(f"  ✂️  {_page_span(pages)}: Cancelling job {loser_id}")
+            await client.cancel(loser_id)
+
+async def run_pack(client, pack, convert_time, languages, stats, options=None, on_submit=None):
+    """Submit one packed job and split its results into per-page records.
+
+    A pack that fails is split in half and each half retried, down to
+    single pages, so one bad page only fails itself. on_submit(pages, job_id)
+    is called once the job has been accepted.
+    """
+    pages = [page_num for page_num, _ in pack]
+    job_id = None
+    try:
+        start = time.time()
+        job_id, result, submit_time = await run_job(client, [image_base64 for _, image_base64 in pack], pages,
+                                                    languages, options, on_submit)
+        wait_time = time.time() - start - submit_time
+        output = decode_output(result.get("output"))
+
+        if len(pack) > 1:
+            if not output or not output.get("success"):
+                raise RuntimeError((output or {}).get("error", "job returned no output"))
+            if len(output.get("results", [])) != len(pack):
+                raise RuntimeError(f"expected {len(pack)} results, got {len(output.get('results', []))}")
 
     except Exception as e:
-        print(f"  ✗ Page {page_num}: Submission error - {e}")
-        return {
-            "page": page_num,
-            "error": str(e),
-            "submit_time": 0,
-            "convert_time": 0
-        }
+        if len(pack) > 1:
+            half = len(pack) // 2
+            print(f"  ↻ {_page_span(pages)}: {e} - retrying as {half}+{len(pack) - half} page jobs")
+            share = convert_time / len(pack)
+            left, right = await asyncio.gather(
+                run_pack(client, pack[:half], share * half, languages, stats, options, on_submit),
+                run_pack(client, pack[half:], share * (len(pack) - half), languages, stats, options, on_submit)
+            )
+            return left + right
 
-def wait_for_results(job_submissions, stats):
-    """Wait for all submitted jobs to complete"""
-    results = []
-    
-    print(f"\n⏳ Waiting for {len(job_submissions)} jobs to complete...\n")
-    
-    for submission in job_submissions:
-        if "error" in submission:
-            results.append(submission)
+        print(f"  ✗ {_page_span(pages)}: Error - {e}")
+        stats["failed"] += 1
+        record = {"page": pages[0], "error": str(e)}
+        if job_id is not None:
+            record["job_id"] = job_id
+        return [record]
+
+    total_time = convert_time + submit_time + wait_time
+    print(f"  ✓ {_page_span(pages)}: Complete (OCR: {wait_time:.2f}s, Total: {total_time:.2f}s)")
+
+    # Update stats
+    stats["total_conversion_time"] += convert_time
+    stats["total_submit_time"] += submit_time
+    stats["total_wait_time"] += wait_time * len(pack)
+    stats["total_processing_time"] += total_time * len(pack)
+    stats["completed"] += len(pack)
+
+    timings = {
+        "conversion": convert_time / len(pack),
+        "submit": submit_time,
+        "ocr": wait_time,
+        "total": total_time,
+        "pack_size": len(pack)
+    }
+    if len(pack) == 1:
+        return [{"page": pages[0], "job_id": job_id, "result": output, "timings": timings}]
+
+    # Split the packed response back into one single-page result per page
+    shared = {key: value for key, value in output.items() if key != "results"}
+    return [
+        {"page": page_num, "job_id": job_id, "result": {**shared, "results": [page_result]}, "timings": timings}
+        for page_num, page_result in zip(pages, output["results"])
+    ]
+
+async def process_pages(client, encoder, pages, languages, stats, options=None,
+                        max_payload_bytes=MAX_PAYLOAD_BYTES, encoding=None, on_submit=None, page_filter=None):
+    """Encode, submit and wait for a group of pages.
+
+    With a page_filter, blank and duplicate pages are not uploaded; records of
+    duplicates whose original is still in flight come from page_filter.finished.
+    """
+    loop = asyncio.get_running_loop()
+
+    # Convert to base64 off the event loop
+    convert_start = time.time()
+    encoded = await asyncio.gather(*[
+        loop.run_in_executor(encoder, prepare_page, page_num, image, encoding, page_filter) for page_num, image in pages
+    ], return_exceptions=True)
+    convert_time = time.time() - convert_start
+
+    # Drop the rendered pages as soon as they are encoded
+    for i, (page_num, image) in enumerate(pages):
+        image.close()
+        pages[i] = (page_num, None)
+
+    records = []
+    encoded_pages = []
+    for (page_num, _), image_base64 in zip(pages, encoded):
+        if isinstance(image_base64, Exception):
+            print(f"  ✗ Page {page_num}: Conversion error - {image_base64}")
             stats["failed"] += 1
-            continue
-            
-        page_num = submission["page"]
-        job_id = submission["job_id"]
-        
+            records.append({"page": page_num, "error": str(image_base64)})
+        elif isinstance(image_base64, tuple):
+            kind, original = image_base64
+            print(f"  ⏭️  Page {page_num}: " + ("blank" if kind == "blank" else f"duplicate of {original}"))
+            stats["skipped"] += 1
+            record = page_filter.skip_record(page_num, kind, original)
+            if record is not None:
+                records.append(record)
+        else:
+            encoded_pages.append((page_num, image_base64))
+    del encoded
+
+    packs = pack_pages(encoded_pages, len(pages), max_payload_bytes)
+    share = convert_time / max(1, len(encoded_pages))
+    for pack_records in await asyncio.gather(*[
+        run_pack(client, pack, share * len(pack), languages, stats, options, on_submit) for pack in packs
+    ]):
+        records.extend(pack_records)
+    return records
+
+def _take(page_iter, count):
+    """Pull up to count (page_num, image) pairs from a page iterator"""
+    group = []
+    for page in page_iter:
+        group.append(page)
+        if len(group) >= count:
+            break
+    return group
+
+async def run_pages(pages, languages, stats, options=None, max_workers=5, max_in_flight=32, client=None,
+                    pages_per_job=1, max_payload_bytes=MAX_PAYLOAD_BYTES, encoding=None,
+                    on_submit=None, on_result=None, collect=True, page_filter=None, client_options=None):
+    """Submit and collect pages concurrently; returns results in completion order.
+
+    pages is an iterable of (page_num, image). It is only advanced when an
+    in-flight slot is free, so a lazy page source (see iter_pdf_pages) is
+    never read further ahead than max_in_flight jobs. With pages_per_job > 1
+    pages are packed into multi-page jobs that also stay under
+    max_payload_bytes. on_result(record) is called for each finished page;
+    with collect=False records are not kept in memory. page_filter (see
+    PageFilter) skips uploading blank and duplicate pages. client_options
+    (retry, breaker, hedger) configure the RunPodClient created when no
+    client is given.
+    """
+    loop = asyncio.get_running_loop()
+    results = []
+    in_flight = asyncio.Semaphore(max_in_flight)
+    page_iter = iter(pages)
+    tasks = set()
+
+    def finished(task):
+        tasks.discard(task)
+        in_flight.release()
+        records = list(task.result())
+        for record in records:
+            if page_filter is not None:
+                records.extend(page_filter.finished(record))
+            if on_result is not None:
+                on_result(record)
+            if collect:
+                results.append(record)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as encoder, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-reader") as reader:
+        async with (client or RunPodClient(max_connections=max_in_flight, **(client_options or {}))) as client:
+            while True:
+                await in_flight.acquire()
+                group = await loop.run_in_executor(reader, _take, page_iter, pages_per_job)
+                if not group:
+                    in_flight.release()
+                    break
+                task = asyncio.ensure_future(process_pages(client, encoder, group, languages, stats, options,
+                                                           max_payload_bytes, encoding, on_submit, page_filter))
+                tasks.add(task)
+                task.add_done_callback(finished)
+
+            while tasks:
+                await asyncio.wait(set(tasks))
+
+    return results
+
+def _page_text(record):
+    result = record.get("result") or {}
+    if "error" in record or not result.get("success"):
+        return None
+    return "\n".join(line["text"] for line in result["results"][0].get("text_lines", []))
+
+def _encoding_label(encoding):
+    label = encoding["format"]
+    if encoding.get("quality") and encoding["format"] != "png":
+        label += f" q{encoding['quality']}"
+    if encoding.get("grayscale"):
+        label += " gray"
+    if encoding.get("scale", 1.0) != 1.0:
+        label += f" x{encoding['scale']:g}"
+    return label
+
+def benchmark_encodings(sample_pages, languages, options=None, encodings=BENCHMARK_ENCODINGS, max_in_flight=8):
+    """Compare upload encodings on sample pages: bytes/page, encode time and text drift.
+
+    Drift is 1 - difflib ratio between a page's text and its text under the
+    first (baseline) encoding, averaged over pages.
+    """
+    options = {**(options or {}), "use_cache": False}
+    report = []
+    baseline_text = {}
+
+    for encoding in encodings:
+        encoding = {**DEFAULT_ENCODING, **encoding}
+        label = _encoding_label(encoding)
+
+        sizes, encode_times = [], []
+        for _, image in sample_pages:
+            start = time.time()
+            entry = encode_page(image, encoding)
+            encode_times.append(time.time() - start)
+            sizes.append(entry_size(entry))
+
+        stats = {"completed": 0, "failed": 0, "total_conversion_time": 0, "total_submit_time": 0,
+                 "total_wait_time": 0, "total_processing_time": 0}
+        records = asyncio.run(run_pages([(page_num, image.copy()) for page_num, image in sample_pages],
+                                        languages, stats, options, max_in_flight=max_in_flight,
+                                        encoding=encoding))
+        texts = {record["page"]: _page_text(record) for record in records}
+
+        if not baseline_text:
+            baseline_text = texts
+        drifts = [
+            1 - difflib.SequenceMatcher(None, baseline_text[page], text).ratio()
+            for page, text in texts.items()
+            if text is not None and baseline_text.get(page) is not None
+        ]
+
+        report.append({
+            "encoding": encoding,
+            "label": label,
+            "avg_bytes_per_page": sum(sizes) / len(sizes),
+            "avg_encode_time": sum(encode_times) / len(encode_times),
+            "avg_text_drift": sum(drifts) / len(drifts) if drifts else None,
+            "failed_pages": stats["failed"]
+        })
+
+    print("\n" + "=" * 72)
+    print("📐 ENCODING BENCHMARK")
+    print("=" * 72)
+    print(f"{'Encoding':<26}{'KB/page':>10}{'Encode ms':>12}{'Text drift':>12}{'Failed':>8}")
+    for row in report:
+        drift = f"{row['avg_text_drift']:.4f}" if row["avg_text_drift"] is not None else "n/a"
+        print(f"{row['label']:<26}{row['avg_bytes_per_page'] / 1024:>10.1f}"
+              f"{row['avg_encode_time'] * 1000:>12.1f}{drift:>12}{row['failed_pages']:>8}")
+    print("=" * 72)
+    return report
+
+SUPPORTED_SUFFIXES = ['.pdf', '.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.webp']
+
+def expand_inputs(patterns):
+    """Resolve files, directories (recursively) and glob patterns to a sorted file list"""
+    files = set()
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = path.rglob("*")
+        elif path.exists():
+            candidates = [path]
+        else:
+            candidates = (Path(match) for match in glob.glob(pattern, recursive=True))
+        files.update(p for p in candidates if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES)
+    return sorted(files)
+
+class ResultWriter:
+    """Appends one compact JSON line per finished page and remembers its byte offset.
+
+    Lines are flushed every RESULT_FLUSH_EVERY records or RESULT_FLUSH_INTERVAL
+    seconds, so memory stays flat and a crash loses at most that much. The
+    offsets let the page-ordered views be written afterwards without loading
+    the whole file (see iter_records).
+    """
+
+    def __init__(self, path, flush_every=RESULT_FLUSH_EVERY, flush_interval=RESULT_FLUSH_INTERVAL):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.offsets = {}
+        self._file = open(self.path, "ab")
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, record):
+        self.offsets[record["page"]] = self._file.tell()
+        self._file.write((json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+        self._pending += 1
+        if self._pending >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def ordered_offsets(self):
+        return [self.offsets[page] for page in sorted(self.offsets)]
+
+    def close(self):
+        self._file.close()
+
+def iter_records(path, offsets):
+    """Yield the JSONL records at the given byte offsets, one at a time"""
+    with open(path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield json.loads(f.readline())
+
+def write_text_view(path, records, label=lambda record: f"Page {record['page']}"):
+    """Write the recognized text of successful records, one section per page"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            if "error" in record or not record.get("result", {}).get("success"):
+                continue
+            f.write(f"\n{'='*60}\n")
+            f.write(f"{label(record)}\n")
+            f.write(f"{'='*60}\n\n")
+            for text_line in record["result"]["results"][0].get("text_lines", []):
+                f.write(f"{text_line['text']}\n")
+
+def write_json_view(path, header, records):
+    """Write {**header, "results": [...]} with records streamed in, one per line"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, indent=2, ensure_ascii=False)[:-2] + ',\n  "results": [')
+        for i, record in enumerate(records):
+            f.write(("\n    " if i == 0 else ",\n    ") + json.dumps(record, ensure_ascii=False))
+        f.write("\n  ]\n}\n")
+
+def file_sha256(path):
+    """Content hash of a file, used to identify it across renames and restarts"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class CorpusManifest:
+    """Append-only record of (file hash, page) -> job id, status and result offset.
+
+    manifest.jsonl gets one line per state change ("submitted", "completed",
+    "failed"); the latest line for a page wins when the manifest is replayed.
+    Page results are appended to results.jsonl and the manifest stores their
+    byte offset, so a restarted run skips completed pages and resumes polling
+    jobs that were still in flight.
+
+    Results are fsynced in batches, every sync_every completions or
+    sync_interval seconds, and "completed" lines are held back until their
+    results are durable. A crash loses at most one batch, whose pages are
+    still "submitted" and get polled again on restart.
+    """
+
+    def __init__(self, output_dir, sync_every=MANIFEST_SYNC_EVERY, sync_interval=MANIFEST_SYNC_INTERVAL):
+        self.path = Path(output_dir) / "manifest.jsonl"
+        self.results_path = Path(output_dir) / "results.jsonl"
+        self.state = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave a torn last line; everything before it is intact
+                        continue
+                    self.state[(entry["file_hash"], entry["page"])] = entry
+        self._manifest = open(self.path, "a", encoding="utf-8")
+        self._results = open(self.results_path, "ab")
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._unsynced = []
+        self._completions = 0
+        self._last_sync = time.monotonic()
+
+    def status(self, file_hash, page):
+        entry = self.state.get((file_hash, page))
+        return entry["status"] if entry else None
+
+    def completed_pages(self, file_hash):
+        return {page for (h, page), entry in self.state.items() if h == file_hash and entry["status"] == "completed"}
+
+    def in_flight(self):
+        """Manifest entries of pages that were submitted but never finished"""
+        return [entry for entry in self.state.values() if entry["status"] == "submitted"]
+
+    def _append(self, entry):
+        self.state[(entry["file_hash"], entry["page"])] = entry
+        self._manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._manifest.flush()
+
+    def sync(self):
+        """Make pending results durable, then write the manifest lines that point at them"""
+        self._last_sync = time.monotonic()
+        if not self._unsynced:
+            return
+        self._results.flush()
+        os.fsync(self._results.fileno())
+        self._manifest.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self._unsynced))
+        self._manifest.flush()
+        self._unsynced = []
+        self._completions = 0
+
+    def record_submit(self, file, file_hash, page, job_id, pack_index):
+        self._append({"file": file, "file_hash": file_hash, "page": page, "job_id": job_id,
+                      "pack_index": pack_index, "status": "submitted", "time": time.time()})
+
+    def record_result(self, file, file_hash, page, record):
+        status = "failed" if "error" in record else "completed"
+        entry = {"file": file, "file_hash": file_hash, "page": page, "job_id": record.get("job_id"),
+                 "status": status, "time": time.time()}
+        if status == "completed":
+            # Results must be durable before the manifest points at them (see sync)
+            entry["offset"] = self._results.tell()
+            line = {**record, "file": file, "file_hash": file_hash, "page": page}
+            self._results.write((json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.state[(file_hash, page)] = entry
+            self._unsynced.append(entry)
+            self._completions += 1
+            if self._completions >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self.sync()
+        else:
+            entry["error"] = record["error"]
+            self._append(entry)
+
+    def close(self):
+        self.sync()
+        self._manifest.close()
+        self._results.close()
+
+async def resume_jobs(client, manifest, stats):
+    """Poll jobs a previous run left in flight and record their results"""
+    by_job = {}
+    for entry in manifest.in_flight():
+        by_job.setdefault(entry["job_id"], []).append(entry)
+    if not by_job:
+        return
+
+    print(f"\n↻ Resuming {len(by_job)} job(s) left in flight by a previous run...\n")
+
+    async def resume(job_id, entries):
         try:
-            wait_start = time.time()
-            result = wait_for_job(job_id)
-            wait_time = time.time() - wait_start
-            
-            total_time = time.time() - submission["submit_timestamp"]
-            
-            print(f"  ✓ Page {page_num}: Complete (OCR: {wait_time:.2f}s, Total: {total_time:.2f}s)")
-            
-            # Update stats
-            stats["total_conversion_time"] += submission["convert_time"]
-            stats["total_submit_time"] += submission["submit_time"]
-            stats["total_wait_time"] += wait_time
-            stats["total_processing_time"] += total_time
-            stats["completed"] += 1
-            
-            results.append({
-                "page": page_num,
-                "job_id": job_id,
-                "result": result.get("output"),
-                "timings": {
-                    "conversion": submission["convert_time"],
-                    "submit": submission["submit_time"],
-                    "ocr": wait_time,
-                    "total": total_time
-                }
-            })
-            
+            result = await wait_for_job(client, job_id)
+            output = decode_output(result.get("output"))
+            if not output or not output.get("success"):
+                raise RuntimeError((output or {}).get("error", "job returned no output"))
+            shared = {key: value for key, value in output.items() if key != "results"}
+            for entry in entries:
+                page_result = output["results"][entry["pack_index"]]
+                record = {"page": entry["page"], "job_id": job_id, "result": {**shared, "results": [page_result]}}
+                manifest.record_result(entry["file"], entry["file_hash"], entry["page"], record)
+                stats["total_pages"] += 1
+                stats["completed"] += 1
+            print(f"  ✓ Job {job_id}: recovered {len(entries)} page(s)")
         except Exception as e:
-            print(f"  ✗ Page {page_num}: Error - {e}")
-            stats["failed"] += 1
-            results.append({
-                "page": page_num,
-                "job_id": job_id,
-                "error": str(e)
-            })
-    
-    return results
+            # Leave these pages to be resubmitted by the main pass
+            print(f"  ✗ Job {job_id}: could not be resumed - {e}")
+            for entry in entries:
+                manifest.record_result(entry["file"], entry["file_hash"], entry["page"],
+                                       {"page": entry["page"], "job_id": job_id, "error": str(e)})
+
+    await asyncio.gather(*[resume(job_id, entries) for job_id, entries in by_job.items()])
+
+def iter_corpus_pages(files, manifest, page_index, dpi=DEFAULT_DPI, raster_workers=RASTER_WORKERS):
+    """Yield (page_id, image) for every page of the corpus not yet completed.
+
+    page_index maps each yielded page_id ("<file>#<page>") back to
+    (file, file_hash, page) for the manifest callbacks.
+    """
+    for path in files:
+        file_hash = file_sha256(path)
+        done = manifest.completed_pages(file_hash)
+        page_count, pages = extract_images(path, dpi=dpi, raster_workers=raster_workers, skip_pages=done)
+        if len(done) >= page_count:
+            print(f"⏭️  {path}: all {page_count} page(s) already done")
+            continue
+        for page, image in pages:
+            page_id = f"{path}#{page}"
+            page_index[page_id] = (str(path), file_hash, page)
+            yield page_id, image
+
+def finalize_corpus(manifest, output_dir):
+    """Write text.txt and results.json ordered by file and page from the manifest's offsets"""
+    completed = sorted((entry["file"], entry["page"], entry["offset"]) for entry in manifest.state.values()
+                       if entry["status"] == "completed")
+    offsets = [offset for _, _, offset in completed]
+    write_text_view(Path(output_dir) / "text.txt", iter_records(manifest.results_path, offsets),
+                    label=lambda record: f"{record['file']} - Page {record['page']}")
+    write_json_view(Path(output_dir) / "results.json", {"files": len({file for file, _, _ in completed}),
+                                                         "pages": len(completed)},
+                    iter_records(manifest.results_path, offsets))
+    print(f"✓ Page-ordered views: {Path(output_dir) / 'text.txt'}, {Path(output_dir) / 'results.json'}")
+
+def run_corpus(args, languages, options, encoding, output_dir, page_filter=None, client_options=None):
+    """Resumable, checkpointed run over many files (see CorpusManifest)"""
+    files = expand_inputs(args.inputs)
+    if not files:
+        raise FileNotFoundError(f"No supported files matched: {' '.join(args.inputs)}")
+
+    manifest = CorpusManifest(output_dir)
+    page_index = {}
+    stats = {"total_pages": 0, "completed": 0, "failed": 0, "skipped": 0, "total_conversion_time": 0,
+             "total_submit_time": 0, "total_wait_time": 0, "total_processing_time": 0}
+    print(f"📚 Corpus: {len(files)} file(s), manifest {manifest.path}")
+
+    def on_submit(page_ids, job_id):
+        for pack_index, page_id in enumerate(page_ids):
+            file, file_hash, page = page_index[page_id]
+            manifest.record_submit(file, file_hash, page, job_id, pack_index)
+
+    def on_result(record):
+        file, file_hash, page = page_index.pop(record["page"])
+        stats["total_pages"] += 1
+        manifest.record_result(file, file_hash, page, record)
+
+    async def run():
+        async with RunPodClient(max_connections=args.max_in_flight, **(client_options or {})) as client:
+            await resume_jobs(client, manifest, stats)
+        pages = iter_corpus_pages(files, manifest, page_index, dpi=args.dpi, raster_workers=args.raster_workers)
+        await run_pages(pages, languages, stats, options, max_workers=args.max_workers,
+                        max_in_flight=args.max_in_flight, pages_per_job=args.pages_per_job,
+                        max_payload_bytes=args.max_payload_bytes, encoding=encoding,
+                        on_submit=on_submit, on_result=on_result, collect=False, page_filter=page_filter,
+                        client_options=client_options)
+
+    start_time = time.time()
+    try:
+        asyncio.run(run())
+    finally:
+        manifest.close()
+    if args.finalize:
+        finalize_corpus(manifest, output_dir)
+    total_time = time.time() - start_time
+
+    print("\n" + "=" * 60)
+    print("📈 CORPUS SUMMARY")
+    print("=" * 60)
+    print(f"Files:                {len(files)}")
+    print(f"Pages processed:      {stats['total_pages']}")
+    print(f"Completed:            {stats['completed']}")
+    print(f"Failed:               {stats['failed']}")
+    print(f"Skipped (blank/dup):  {stats['skipped']}")
+    if client_options:
+        print(f"Resilience:           {resilience_summary(client_options)}")
+    print(f"Total time:           {total_time:.2f}s")
+    print("=" * 60)
+    print(f"\n✓ Results appended to: {manifest.results_path}")
+    print(f"  Manifest:            {manifest.path}")
+    print("  Re-run the same command to retry failed pages and resume interrupted runs.")
+    print("=" * 60)
+
+def resilience_options(args):
+    """RunPodClient retry/breaker/hedger settings from the command line, shared by every client of a run"""
+    return {
+        "retry": RetryPolicy(args.retries),
+        "breaker": CircuitBreaker(args.breaker_error_rate, cooldown=args.breaker_cooldown),
+        "hedger": Hedger(args.hedge_percentile, args.hedge_budget)
+    }
+
+def resilience_summary(client_options):
+    retry, breaker, hedger = client_options["retry"], client_options["breaker"], client_options["hedger"]
+    return (f"{retry.retries} retries, {retry.resubmits} timed-out job(s) resubmitted, "
+            f"{hedger.hedges} hedged ({hedger.wins} won by the hedge), circuit opened {breaker.trips}x")
 
 def main():
     parser = argparse.ArgumentParser(description="Batch OCR processing with SuryaOCR")
-    parser.add_argument("input_file", help="Path to PDF or image file")
+    parser.add_argument("inputs", nargs="+", metavar="input_file",
+                        help="Path to PDF or image file (with --corpus: files, directories or globs)")
+    parser.add_argument("--corpus", action="store_true",
+                        help="Resumable run over many inputs, checkpointed to a manifest in --output-dir")
     parser.add_argument("--output-dir", default="ocr_output", help="Output directory (default: ocr_output)")
     parser.add_argument("--languages", default="en", help="Comma-separated language codes (default: en)")
-    parser.add_argument("--max-workers", type=int, default=5, help="Max concurrent requests (default: 5)")
+    parser.add_argument("--max-workers", type=int, default=5, help="Threads used to encode pages (default: 5)")
+    parser.add_argument("--max-in-flight", type=int, default=32,
+                        help="Max jobs submitted but not yet completed (default: 32)")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI,
+                        help=f"PDF rasterization resolution (default: {DEFAULT_DPI})")
+    parser.add_argument("--raster-workers", type=int, default=RASTER_WORKERS,
+                        help=f"Parallel PDF rasterizer threads (default: {RASTER_WORKERS})")
+    parser.add_argument("--pages-per-job", type=int, default=1,
+                        help="Pack up to this many pages into one job (default: 1)")
+    parser.add_argument("--max-payload-bytes", type=int, default=MAX_PAYLOAD_BYTES,
+                        help=f"Max request size of a packed job (default: {MAX_PAYLOAD_BYTES})")
+    parser.add_argument("--image-format", choices=list(IMAGE_FORMATS), default="png",
+                        help="Upload encoding (default: png)")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG/WebP quality (default: 85)")
+    parser.add_argument("--grayscale", action="store_true", help="Upload pages as grayscale")
+    parser.add_argument("--max-dimension", type=int, default=None,
+                        help="Downscale pages so their longest side is at most this many pixels")
+    parser.add_argument("--target-dpi", type=int, default=None,
+                        help="Downscale rendered PDF pages from --dpi to this resolution before upload")
+    parser.add_argument("--benchmark-encoding", type=int, default=0, metavar="N",
+                        help="Compare upload encodings on the first N pages instead of a normal run")
+    parser.add_argument("--output-format", choices=["full", "lean", "columnar"], default="full",
+                        help="Response layout requested from the worker (default: full)")
+    parser.add_argument("--envelope", choices=["none", "gzip", "msgpack"], default="none",
+                        help="Compress the worker response (default: none)")
+    parser.add_argument("--stream-output", action="store_true",
+                        help="Append each page to results_<time>.jsonl as it completes instead of holding all in memory")
+    parser.add_argument("--finalize", action="store_true",
+                        help="With --corpus: also write page-ordered text.txt and results.json views of the corpus")
+    parser.add_argument("--skip-blank", action="store_true",
+                        help="Do not upload blank pages; they get empty text_lines and \"blank\": true")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Upload near-identical pages once per run; copies get \"duplicate_of\"")
+    parser.add_argument("--blank-ink-ratio", type=float, default=BLANK_INK_RATIO,
+                        help=f"Pages with less ink coverage are blank (default: {BLANK_INK_RATIO})")
+    parser.add_argument("--duplicate-max-distance", type=float, default=DUPLICATE_MAX_DISTANCE,
+                        help=f"Max share of differing hash bits for duplicates (default: {DUPLICATE_MAX_DISTANCE})")
+    parser.add_argument("--retries", type=int, default=RETRY_ATTEMPTS,
+                        help=f"Retries of a request on throttling, 5xx or connection errors (default: {RETRY_ATTEMPTS})")
+    parser.add_argument("--hedge-percentile", type=float, default=HEDGE_PERCENTILE,
+                        help=f"Resubmit jobs slower than this latency percentile; 0 disables (default: {HEDGE_PERCENTILE})")
+    parser.add_argument("--hedge-budget", type=float, default=HEDGE_BUDGET,
+                        help=f"Max share of jobs that may be hedged (default: {HEDGE_BUDGET})")
+    parser.add_argument("--breaker-error-rate", type=float, default=BREAKER_ERROR_RATE,
+                        help=f"Pause submissions when this share of recent requests fail; 0 disables "
+                             f"(default: {BREAKER_ERROR_RATE})")
+    parser.add_argument("--breaker-cooldown", type=float, default=BREAKER_COOLDOWN,
+                        help=f"Seconds between probe submissions while paused (default: {BREAKER_COOLDOWN})")
 
     args = parser.parse_args()
+    if not args.corpus and len(args.inputs) != 1:
+        parser.error("multiple inputs require --corpus")
+    if (args.skip_blank or args.dedupe) and np is None:
+        parser.error("--skip-blank and --dedupe require numpy (pip install numpy)")
+    args.input_file = args.inputs[0]
+
+    if not RUNPOD_API_KEY:
+        print("Error: RUNPOD_API_KEY environment variable not set!")
+        print("Set it with: export RUNPOD_API_KEY=your_key_here")
+        exit(1)
 
     # Parse languages
     languages = [lang.strip() for lang in args.languages.split(",")]
+    options = {"output_format": args.output_format, "envelope": args.envelope}
+    client_options = resilience_options(args)
+    page_filter = None
+    if args.skip_blank or args.dedupe:
+        page_filter = PageFilter(args.skip_blank, args.dedupe, args.blank_ink_ratio, args.duplicate_max_distance)
+    encoding = {
+        "format": args.image_format,
+        "quality": args.quality,
+        "grayscale": args.grayscale,
+        "max_dimension": args.max_dimension,
+        "scale": min(1.0, args.target_dpi / args.dpi) if args.target_dpi else 1.0
+    }
 
     # Create output directory
     output_dir = Path(args.output_dir)
@@ -226,24 +1450,44 @@ def main():
     print("=" * 60)
     print("🚀 SuryaOCR Batch Processing")
     print("=" * 60)
-    print(f"Input file: {args.input_file}")
+    print(f"Input: {' '.join(args.inputs)}")
     print(f"Output dir: {output_dir}")
     print(f"Languages: {languages}")
     print(f"Max workers: {args.max_workers}")
+    print(f"Max in flight: {args.max_in_flight}")
+    print(f"Pages per job: {args.pages_per_job}")
+    print(f"Encoding: {_encoding_label(encoding)}")
     print("=" * 60)
 
-    # Extract images
+    if args.corpus:
+        run_corpus(args, languages, options, encoding, output_dir, page_filter, client_options)
+        return
+
+    # Open the input; PDF pages are rasterized while earlier pages are in flight
     start_time = time.time()
-    images = extract_images(args.input_file)
+    page_count, pages = extract_images(args.input_file, dpi=args.dpi, raster_workers=args.raster_workers,
+                                       max_buffered=max(MAX_BUFFERED_PAGES, args.pages_per_job))
     extraction_time = time.time() - start_time
 
-    print(f"\n📊 Processing {len(images)} page(s) with {args.max_workers} concurrent workers...\n")
+    if args.benchmark_encoding:
+        sample_pages = _take(pages, args.benchmark_encoding)
+        report = benchmark_encodings(sample_pages, languages, options, max_in_flight=args.max_in_flight)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        report_file = output_dir / f"encoding_benchmark_{timestamp}.json"
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump({"input_file": str(args.input_file), "dpi": args.dpi, "pages": len(sample_pages),
+                       "results": report}, f, indent=2)
+        print(f"\n✓ Benchmark saved to: {report_file}")
+        return
+
+    print(f"\n📊 Processing {page_count} page(s) with {args.max_workers} concurrent workers...\n")
 
     # Statistics
     stats = {
-        "total_pages": len(images),
+        "total_pages": page_count,
         "completed": 0,
         "failed": 0,
+        "skipped": 0,
         "total_conversion_time": 0,
         "total_submit_time": 0,
         "total_wait_time": 0,
@@ -251,67 +1495,60 @@ def main():
         "extraction_time": extraction_time
     }
 
-    # Phase 1: Submit all jobs concurrently
-    print("📤 Phase 1: Submitting all jobs concurrently...\n")
-    job_submissions = []
-    process_start = time.time()
-
-    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
-        futures = {
-            executor.submit(process_single_page, i+1, img, languages, stats): i+1
-            for i, img in enumerate(images)
-        }
-
-        for future in as_completed(futures):
-            submission = future.result()
-            job_submissions.append(submission)
-
-    submission_time = time.time() - process_start
-    print(f"\n✓ All jobs submitted in {submission_time:.2f}s")
-
-    # Phase 2: Wait for all results
-    results = wait_for_results(job_submissions, stats)
+    # Submit and collect concurrently; results arrive in completion order
+    print(f"📤 Submitting pages (up to {args.max_in_flight} in flight)...\n")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_options = dict(max_workers=args.max_workers, max_in_flight=args.max_in_flight,
+                       pages_per_job=args.pages_per_job, max_payload_bytes=args.max_payload_bytes,
+                       encoding=encoding, page_filter=page_filter, client_options=client_options)
+    if args.stream_output:
+        # Records go to disk as they complete; the views below are read back by offset
+        writer = ResultWriter(output_dir / f"results_{timestamp}.jsonl")
+        try:
+            asyncio.run(run_pages(pages, languages, stats, options, on_result=writer.write, collect=False,
+                                  **run_options))
+        finally:
+            writer.close()
+        ordered = lambda: iter_records(writer.path, writer.ordered_offsets())
+    else:
+        results = asyncio.run(run_pages(pages, languages, stats, options, **run_options))
+        results.sort(key=lambda x: x["page"])
+        ordered = lambda: iter(results)
 
     total_time = time.time() - start_time
 
-    # Sort results by page number
-    results.sort(key=lambda x: x["page"])
-
-    # Save results
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Save page-ordered views
     results_file = output_dir / f"results_{timestamp}.json"
 
-    output_data = {
+    header = {
         "metadata": {
             "input_file": str(args.input_file),
             "timestamp": timestamp,
             "languages": languages,
-            "total_pages": len(images),
-            "max_workers": args.max_workers
+            "total_pages": page_count,
+            "dpi": args.dpi,
+            "max_workers": args.max_workers,
+            "max_in_flight": args.max_in_flight,
+            "pages_per_job": args.pages_per_job,
+            "encoding": encoding
         },
         "statistics": {
             **stats,
+            "retries": client_options["retry"].retries,
+            "resubmitted_jobs": client_options["retry"].resubmits,
+            "hedged_jobs": client_options["hedger"].hedges,
+            "hedge_wins": client_options["hedger"].wins,
+            "breaker_trips": client_options["breaker"].trips,
             "total_time": total_time,
-            "avg_time_per_page": stats["total_processing_time"] / len(images) if images else 0,
-            "pages_per_second": len(images) / total_time if total_time > 0 else 0
-        },
-        "results": results
+            "avg_time_per_page": stats["total_processing_time"] / page_count if page_count else 0,
+            "pages_per_second": page_count / total_time if total_time > 0 else 0
+        }
     }
-
-    with open(results_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=2, ensure_ascii=False)
+    write_json_view(results_file, header, ordered())
 
     # Save text output
     text_file = output_dir / f"text_{timestamp}.txt"
-    with open(text_file, 'w', encoding='utf-8') as f:
-        for result in results:
-            if "error" not in result and result.get("result", {}).get("success"):
-                f.write(f"\n{'='*60}\n")
-                f.write(f"Page {result['page']}\n")
-                f.write(f"{'='*60}\n\n")
-
-                for text_line in result["result"]["results"][0].get("text_lines", []):
-                    f.write(f"{text_line['text']}\n")
+    write_text_view(text_file, ordered())
 
     # Print summary
     print("\n" + "=" * 60)
@@ -320,16 +1557,20 @@ def main():
     print(f"Total pages:          {stats['total_pages']}")
     print(f"Completed:            {stats['completed']}")
     print(f"Failed:               {stats['failed']}")
+    print(f"Skipped (blank/dup):  {stats['skipped']}")
+    print(f"Resilience:           {resilience_summary(client_options)}")
     print(f"")
-    print(f"Image extraction:     {stats['extraction_time']:.2f}s")
+    print(f"Input setup:          {stats['extraction_time']:.2f}s")
     print(f"Total processing:     {total_time:.2f}s")
-    print(f"Avg time per page:    {stats['total_processing_time'] / len(images):.2f}s")
-    print(f"Pages per second:     {len(images) / total_time:.2f}")
+    print(f"Avg time per page:    {stats['total_processing_time'] / max(1, page_count):.2f}s")
+    print(f"Pages per second:     {page_count / total_time:.2f}")
     print(f"")
-    print(f"Avg conversion time:  {stats['total_conversion_time'] / len(images):.2f}s")
-    print(f"Avg OCR time:         {stats['total_wait_time'] / len(images):.2f}s")
+    print(f"Avg conversion time:  {stats['total_conversion_time'] / max(1, page_count):.2f}s")
+    print(f"Avg OCR time:         {stats['total_wait_time'] / max(1, page_count):.2f}s")
     print("=" * 60)
     print(f"\n✓ Results saved to:")
+    if args.stream_output:
+        print(f"  JSONL: {writer.path}")
     print(f"  JSON: {results_file}")
     print(f"  Text: {text_file}")
     print("=" * 60)
@@ -0,0 +1,688 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the SuryaOCR worker
+Runs handler_final.handler in-process with stub predictors (no GPU, no RunPod
+endpoint needed) and, optionally, batch_ocr end-to-end against a local
+stand-in for the RunPod /run and /status endpoints.
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import difflib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import handler_final
+
+# Default sweep: pages per job x page size (pixels, roughly 100/200/300 DPI letter)
+DEFAULT_JOB_SIZES = [1, 8, 32]
+DEFAULT_IMAGE_SIZES = [(850, 1100), (1700, 2200), (2550, 3300)]
+
+# Relative slowdown of a percentile that --compare reports as a regression
+DEFAULT_TOLERANCE = 0.15
+
+
+class StubFoundationPredictor:
+    """Stands in for surya's FoundationPredictor (only its load time matters)"""
+
+    def __init__(self, load_latency=0.0):
+        time.sleep(load_latency)
+
+
+class StubDetectionPredictor:
+    """Returns lines_per_page evenly spaced line boxes per image after a simulated delay.
+
+    With oom_pixels set, calls over that many pixels raise a CUDA-style
+    out-of-memory error, to exercise the handler's batch back-off.
+    """
+
+    def __init__(self, lines_per_page=40, latency_per_call=0.005, latency_per_image=0.01, load_latency=0.0,
+                 oom_pixels=0):
+        self.lines_per_page = lines_per_page
+        self.latency_per_call = latency_per_call
+        self.latency_per_image = latency_per_image
+        self.oom_pixels = oom_pixels
+        time.sleep(load_latency)
+
+    def __call__(self, images, batch_size=None, include_maps=False):
+        pixels = sum(image.size[0] * image.size[1] for image in images)
+        if self.oom_pixels and pixels > self.oom_pixels:
+            raise RuntimeError(f"CUDA out of memory (stub: {pixels} px > {self.oom_pixels} px)")
+        time.sleep(self.latency_per_call + self.latency_per_image * len(images))
+        results = []
+        for image in images:
+            width, height = image.size
+            line_height = height / (self.lines_per_page + 1)
+            boxes = []
+            for i in range(self.lines_per_page):
+                top = line_height * (i + 0.5)
+                bbox = [width * 0.05, top, width * 0.95, top + line_height * 0.8]
+                polygon = [[bbox[0], bbox[1]], [bbox[2], bbox[1]], [bbox[2], bbox[3]], [bbox[0], bbox[3]]]
+                boxes.append(SimpleNamespace(bbox=bbox, polygon=polygon, confidence=0.99))
+            results.append(SimpleNamespace(bboxes=boxes, image_bbox=[0, 0, width, height]))
+        return results
+
+
+class StubRecognitionPredictor:
+    """Returns one synthetic text line per requested polygon after a simulated delay.
+
+    With oom_lines set, calls that recognize more than that many lines at
+    once (min(recognition_batch_size, lines)) raise a CUDA-style
+    out-of-memory error.
+    """
+
+    def __init__(self, foundation_predictor=None, latency_per_call=0.005, latency_per_line=0.0005,
+                 load_latency=0.0, oom_lines=0):
+        self.latency_per_call = latency_per_call
+        self.latency_per_line = latency_per_line
+        self.oom_lines = oom_lines
+        time.sleep(load_latency)
+
+    def __call__(self, images, det_predictor=None, polygons=None, bboxes=None, **kwargs):
+        if polygons is None:
+            polygons = [[box.polygon for box in pred.bboxes] for pred in det_predictor(images)]
+        line_count = sum(len(page) for page in polygons)
+        batch_size = min(kwargs.get("recognition_batch_size") or line_count, line_count)
+        if self.oom_lines and batch_size > self.oom_lines:
+            raise RuntimeError(f"CUDA out of memory (stub: {batch_size} lines > {self.oom_lines} lines)")
+        time.sleep(self.latency_per_call + self.latency_per_line * line_count)
+        results = []
+        for image, page_polygons in zip(images, polygons):
+            lines = []
+            for i, polygon in enumerate(page_polygons):
+                xs = [x for x, _ in polygon]
+                ys = [y for _, y in polygon]
+                lines.append(SimpleNamespace(
+                    text=f"Line {i} of a {image.size[0]}x{image.size[1]} page",
+                    confidence=0.97,
+                    bbox=[min(xs), min(ys), max(xs), max(ys)],
+                    polygon=polygon
+                ))
+            results.append(SimpleNamespace(text_lines=lines, image_bbox=[0, 0, image.size[0], image.size[1]]))
+        return results
+
+
+class StubLayoutPredictor:
+    """Returns a header block, a text block and a table block per image"""
+
+    def __init__(self, latency_per_image=0.01, load_latency=0.0):
+        self.latency_per_image = latency_per_image
+        time.sleep(load_latency)
+
+    def __call__(self, images, batch_size=None, top_k=5):
+        time.sleep(self.latency_per_image * len(images))
+        results = []
+        for image in images:
+            width, height = image.size
+            blocks = []
+            for position, (label, top, bottom) in enumerate([("SectionHeader", 0.05, 0.1), ("Text", 0.1, 0.6),
+                                                              ("Table", 0.6, 0.9)]):
+                bbox = [width * 0.05, height * top, width * 0.95, height * bottom]
+                polygon = [[bbox[0], bbox[1]], [bbox[2], bbox[1]], [bbox[2], bbox[3]], [bbox[0], bbox[3]]]
+                blocks.append(SimpleNamespace(label=label, position=position, confidence=0.95,
+                                              bbox=bbox, polygon=polygon))
+            results.append(SimpleNamespace(bboxes=blocks, image_bbox=[0, 0, width, height]))
+        return results
+
+
+class StubTableRecPredictor:
+    """Returns a 3x3 grid of cells per (table) image"""
+
+    def __init__(self, latency_per_image=0.01, load_latency=0.0):
+        self.latency_per_image = latency_per_image
+        time.sleep(load_latency)
+
+    def __call__(self, images, batch_size=None):
+        time.sleep(self.latency_per_image * len(images))
+        results = []
+        for image in images:
+            width, height = image.size
+            cells, rows, cols = [], [], []
+            for i in range(3):
+                rows.append(SimpleNamespace(row_id=i, is_header=i == 0, bbox=[0, height * i / 3, width,
+                                                                                height * (i + 1) / 3]))
+                cols.append(SimpleNamespace(col_id=i, is_header=False, bbox=[width * i / 3, 0,
+                                                                              width * (i + 1) / 3, height]))
+            for row in range(3):
+                for col in range(3):
+                    bbox = [width * col / 3, height * row / 3, width * (col + 1) / 3, height * (row + 1) / 3]
+                    polygon = [[bbox[0], bbox[1]], [bbox[2], bbox[1]], [bbox[2], bbox[3]], [bbox[0], bbox[3]]]
+                    cells.append(SimpleNamespace(row_id=row, col_id=col, rowspan=1, colspan=1,
+                                                 is_header=row == 0, bbox=bbox, polygon=polygon))
+            results.append(SimpleNamespace(cells=cells, rows=rows, cols=cols, image_bbox=[0, 0, width, height]))
+        return results
+
+
+def install_stub_models(lines_per_page=40, detection_latency=0.01, recognition_latency=0.0005, load_latency=0.0,
+                        oom_pixels=0, oom_lines=0):
+    """Replace the handler's Surya model loaders with stubs (per-image / per-line latency in seconds).
+
+    Stubs are loaded through the handler's model registry on first use (or by
+    boot()), each sleeping load_latency seconds, so load concurrency and boot
+    timing can be measured without a GPU.
+    """
+    get_model = handler_final.get_model
+    handler_final.MODELS.clear()
+    handler_final.MODEL_LOAD_TIMINGS.clear()
+    handler_final._SURYA_CONFIGURED = True  # no surya settings to apply
+    handler_final.MODEL_LOADERS.update({
+        "foundation": lambda: StubFoundationPredictor(load_latency),
+        "recognition": lambda: StubRecognitionPredictor(
+            get_model("foundation"), latency_per_line=recognition_latency, load_latency=load_latency,
+            oom_lines=oom_lines),
+        "detection": lambda: StubDetectionPredictor(
+            lines_per_page=lines_per_page, latency_per_image=detection_latency, load_latency=load_latency,
+            oom_pixels=oom_pixels),
+        "layout": lambda: StubLayoutPredictor(detection_latency, load_latency),
+        "table": lambda: StubTableRecPredictor(detection_latency, load_latency),
+    })
+
+
+def make_page(size, seed=0):
+    """Synthetic scan: white page with dark text-like strokes, PNG encoded as base64"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    page = np.full((height, width), 255, dtype=np.uint8)
+    line_height = max(8, height // 45)
+    for top in range(line_height, height - line_height, line_height * 2):
+        strokes = rng.random((line_height, width)) < 0.25
+        page[top:top + line_height][strokes] = 30
+    buffered = BytesIO()
+    Image.fromarray(page).convert("RGB").save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def percentiles(values):
+    """p50/p95/p99/mean of a list of seconds"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "mean": sum(ordered) / len(ordered)}
+
+
+def bench_handler(job_sizes, image_sizes, iterations, quiet=True, operation="ocr"):
+    """Run the handler in-process for every (job size, image size) combination"""
+    results = []
+    for image_size in image_sizes:
+        # A handful of distinct pages so the result cache does not short-circuit work
+        pages = [make_page(image_size, seed=i) for i in range(4)]
+        for job_size in job_sizes:
+            samples = {"decode": [], "inference": [], "serialization": [], "end_to_end": []}
+            pages_done = 0
+            total_time = 0.0
+            for iteration in range(iterations):
+                job = {"id": f"bench-{iteration}", "input": {
+                    "images": [pages[i % len(pages)] for i in range(job_size)],
+                    "operation": operation,
+                    "use_cache": False,
+                    "return_timings": True
+                }}
+                with open(os.devnull, "w") as devnull, \
+                        (contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext()):
+                    start = time.perf_counter()
+                    response = handler_final.handler(job)
+                    body = json.dumps(response)
+                    elapsed = time.perf_counter() - start
+                if not response.get("success"):
+                    raise RuntimeError(f"Handler failed: {response.get('error')}")
+
+                timings = response["timings"]
+                samples["decode"].append(timings["decode"])
+                samples["inference"].append(timings["detect"] + timings["recognize"])
+                samples["serialization"].append(timings["format"] + (elapsed - timings["wall"]))
+                samples["end_to_end"].append(elapsed)
+                pages_done += job_size
+                total_time += elapsed
+                del body
+
+            row = {
+                "job_size": job_size,
+                "image_size": list(image_size),
+                "iterations": iterations,
+                "pages_per_second": pages_done / total_time if total_time else 0,
+                **{stage: percentiles(values) for stage, values in samples.items()}
+            }
+            results.append(row)
+            print(f"  {job_size:>4} page(s) @ {image_size[0]}x{image_size[1]}: "
+                  f"e2e p50 {row['end_to_end']['p50'] * 1000:8.1f}ms  "
+                  f"p95 {row['end_to_end']['p95'] * 1000:8.1f}ms  "
+                  f"{row['pages_per_second']:7.1f} pages/s")
+    return results
+
+
+def bench_cpu_quantization(sample_paths, repeats=1):
+    """Real Surya models on CPU, fp32 vs int8: throughput and text agreement with fp32.
+
+    Needs surya-ocr and torch installed and DEVICE=cpu. Each sample is decoded
+    the way the worker decodes it and OCR'd `repeats` times per mode.
+    """
+    if handler_final.DEVICE != "cpu":
+        raise SystemExit("--cpu-quantization compares CPU backends; run it with DEVICE=cpu")
+    images = []
+    for path in sample_paths:
+        with open(path, "rb") as f:
+            images.append(handler_final.decode_image(f.read())[0])
+    int8_models = handler_final.CPU_INT8_MODELS or ["foundation", "detection"]
+
+    runs = {}
+    for mode, quantized in (("fp32", []), ("int8", int8_models)):
+        handler_final.MODELS.clear()
+        handler_final.MODEL_LOAD_TIMINGS.clear()
+        handler_final.CPU_INT8_MODELS = list(quantized)
+        handler_final.preload_models(["ocr"])
+        handler_final.predict_pages(images[:1])  # warmup
+        start = time.perf_counter()
+        for _ in range(repeats):
+            pages = handler_final.predict_pages(images)
+        elapsed = time.perf_counter() - start
+        runs[mode] = {
+            "pages_per_second": len(images) * repeats / elapsed,
+            "seconds_per_page": elapsed / (len(images) * repeats),
+            "load_seconds": sum(handler_final.MODEL_LOAD_TIMINGS.values()),
+            "texts": ["\n".join(line["text"] for line in page["text_lines"]) for page in pages]
+        }
+        print(f"  {mode}: {runs[mode]['pages_per_second']:.2f} pages/s "
+              f"({runs[mode]['seconds_per_page']:.2f}s/page, load {runs[mode]['load_seconds']:.1f}s)")
+
+    similarity = [difflib.SequenceMatcher(None, fp32, int8).ratio()
+                  for fp32, int8 in zip(runs["fp32"].pop("texts"), runs["int8"].pop("texts"))]
+    result = {
+        "samples": [str(path) for path in sample_paths],
+        "threads": handler_final.CPU_THREADS,
+        "int8_models": int8_models,
+        **runs,
+        "speedup": runs["int8"]["pages_per_second"] / runs["fp32"]["pages_per_second"],
+        "text_similarity": {"mean": sum(similarity) / len(similarity), "min": min(similarity),
+                            "per_sample": similarity}
+    }
+    print(f"  int8 speedup: {result['speedup']:.2f}x, text similarity to fp32: "
+          f"mean {result['text_similarity']['mean']:.3f}, min {result['text_similarity']['min']:.3f}")
+    return result
+
+
+class LocalRunPodServer:
+    """Local stand-in for a RunPod serverless endpoint.
+
+    Serves POST /v2/<endpoint>/run and GET /v2/<endpoint>/status/<id> (plus
+    /cancel/<id>) and runs jobs through `handler` on a worker pool, so
+    batch_ocr can be exercised end-to-end without a paid endpoint. queue_delay
+    is an optional (min, max) range of seconds a job waits before running.
+
+    Faults can be injected to exercise the client's resilience: error_rate
+    and throttle_rate are the shares of /run and /status requests answered
+    with 503 and 429 (Retry-After: 1), stall_rate is the share of jobs that
+    hang IN_PROGRESS on their worker until cancelled or, like RunPod's
+    execution timeout, TIMED_OUT after stall_seconds, and outage is a
+    (start, end) window in seconds after the first request in which every
+    request gets a 503. Injected faults are counted in `faults`, cancelled jobs in
+    `cancelled`.
+    """
+
+    def __init__(self, handler=None, workers=1, queue_delay=(0.0, 0.0), host="127.0.0.1", port=0,
+                 error_rate=0.0, throttle_rate=0.0, stall_rate=0.0, stall_seconds=30.0, outage=None):
+        self.handler = handler or handler_final.handler
+        self.queue_delay = queue_delay
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.outage = outage
+        self.faults = {"errors": 0, "throttled": 0, "stalled": 0, "outage": 0}
+        self.cancelled = 0
+        self.started = None
+        self.closed = threading.Event()
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="standin-worker")
+        self.httpd = ThreadingHTTPServer((host, port), self._request_handler())
+        self.thread = None
+
+    @property
+    def api_base(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="standin-http", daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run_job(self, job_id, payload):
+        time.sleep(random.uniform(*self.queue_delay))
+        with self.lock:
+            if self.jobs[job_id]["status"] == "CANCELLED":
+                return
+            self.jobs[job_id]["status"] = "IN_PROGRESS"
+            stall = random.random() < self.stall_rate
+            if stall:
+                self.faults["stalled"] += 1
+        if stall:
+            # A stuck worker: holds its slot until the job is cancelled or times out
+            deadline = time.monotonic() + self.stall_seconds
+            while not self.closed.wait(0.05):
+                with self.lock:
+                    if self.jobs[job_id]["status"] == "CANCELLED":
+                        return
+                    if time.monotonic() >= deadline:
+                        self.jobs[job_id].update(status="TIMED_OUT", error="Execution timeout exceeded")
+                        return
+            return
+        try:
+            output = self.handler({"id": job_id, **payload})
+            update = {"status": "COMPLETED", "output": output}
+        except Exception as e:
+            update = {"status": "FAILED", "error": str(e)}
+        with self.lock:
+            if self.jobs[job_id]["status"] != "CANCELLED":
+                self.jobs[job_id].update(update)
+
+    def _fault(self):
+        """HTTP status to answer the current request with instead of serving it, or None"""
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+            if self.outage and self.outage[0] <= time.monotonic() - self.started < self.outage[1]:
+                self.faults["outage"] += 1
+                return 503
+            roll = random.random()
+            if roll < self.error_rate:
+                self.faults["errors"] += 1
+                return 503
+            if roll < self.error_rate + self.throttle_rate:
+                self.faults["throttled"] += 1
+                return 429
+        return None
+
+    def _request_handler(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, status=200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _inject_fault(self):
+                status = server._fault()
+                if status is not None:
+                    self._send({"error": "injected fault"}, status)
+                return status is not None
+
+            def do_POST(self):
+                parts = self.path.strip("/").split("/")
+                if parts[-1] == "run":
+                    length = int(self.headers.get("Content-Length", 0))
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    if self._inject_fault():
+                        return
+                    job_id = str(uuid.uuid4())
+                    with server.lock:
+                        server.jobs[job_id] = {"id": job_id, "status": "IN_QUEUE"}
+                    server.pool.submit(server._run_job, job_id, payload)
+                    self._send({"id": job_id, "status": "IN_QUEUE"})
+                elif len(parts) >= 2 and parts[-2] == "cancel":
+                    with server.lock:
+                        job = server.jobs.get(parts[-1])
+                        if job and job["status"] in ("IN_QUEUE", "IN_PROGRESS"):
+                            job["status"] = "CANCELLED"
+                            server.cancelled += 1
+                    self._send({"id": parts[-1], "status": "CANCELLED"} if job else {"error": "not found"},
+                               200 if job else 404)
+                else:
+                    self._send({"error": "not found"}, 404)
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) >= 2 and parts[-2] == "status":
+                    if self._inject_fault():
+                        return
+                    with server.lock:
+                        job = dict(server.jobs.get(parts[-1], {}))
+                    if job:
+                        self._send(job)
+                    else:
+                        self._send({"error": "not found"}, 404)
+                else:
+                    self._send({"error": "not found"}, 404)
+
+        return RequestHandler
+
+
+def bench_http(page_count, image_size, workers, max_in_flight, pages_per_job, faults=None):
+    """Run batch_ocr's async client against the local stand-in; returns throughput stats.
+
+    faults are LocalRunPodServer fault-injection settings (error_rate,
+    throttle_rate, stall_rate, outage). Hedge and breaker delays are scaled
+    down to the stand-in's stub latencies.
+    """
+    with LocalRunPodServer(workers=workers, **(faults or {})) as server:
+        os.environ["RUNPOD_API_BASE"] = server.api_base
+        os.environ.setdefault("RUNPOD_API_KEY", "local-benchmark")
+        import batch_ocr
+
+        pages = [(i + 1, Image.open(BytesIO(base64.b64decode(make_page(image_size, seed=i)))).convert("RGB"))
+                 for i in range(page_count)]
+        stats = {"completed": 0, "failed": 0, "total_conversion_time": 0, "total_submit_time": 0,
+                 "total_wait_time": 0, "total_processing_time": 0}
+        client = batch_ocr.RunPodClient(api_key="local-benchmark", endpoint_id="local", api_base=server.api_base,
+                                        max_connections=max_in_flight,
+                                        breaker=batch_ocr.CircuitBreaker(cooldown=1.0),
+                                        hedger=batch_ocr.Hedger(min_delay=0.5, default_delay=5.0))
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            records = asyncio.run(batch_ocr.run_pages(pages, ["en"], stats, {"use_cache": False},
+                                                      max_in_flight=max_in_flight, client=client,
+                                                      pages_per_job=pages_per_job))
+            elapsed = time.perf_counter() - start
+
+    latencies = [record["timings"]["total"] for record in records if "timings" in record]
+    return {
+        "pages": page_count,
+        "image_size": list(image_size),
+        "pages_per_job": pages_per_job,
+        "completed": stats["completed"],
+        "failed": stats["failed"],
+        "elapsed": elapsed,
+        "pages_per_second": page_count / elapsed if elapsed else 0,
+        "page_latency": percentiles(latencies),
+        "faults": server.faults,
+        "resilience": {"retries": client.retry.retries, "resubmitted_jobs": client.retry.resubmits,
+                       "hedged_jobs": client.hedger.hedges,
+                       "hedge_wins": client.hedger.wins, "cancelled_jobs": server.cancelled,
+                       "breaker_trips": client.breaker.trips}
+    }
+
+
+def compare(current, baseline, tolerance):
+    """List end-to-end percentiles and throughput that regressed beyond tolerance"""
+    regressions = []
+    if baseline.get("config", {}).get("operation", "ocr") != current["config"]["operation"]:
+        return [f"baseline measured operation {baseline['config'].get('operation', 'ocr')!r}, "
+                f"not {current['config']['operation']!r}"]
+    previous = {(row["job_size"], tuple(row["image_size"])): row for row in baseline.get("handler", [])}
+    for row in current["handler"]:
+        key = (row["job_size"], tuple(row["image_size"]))
+        if key not in previous:
+            continue
+        old = previous[key]
+        for q in ("p50", "p95", "p99"):
+            if old["end_to_end"][q] and row["end_to_end"][q] > old["end_to_end"][q] * (1 + tolerance):
+                regressions.append(f"{key[0]} page(s) @ {key[1][0]}x{key[1][1]} end_to_end {q}: "
+                                   f"{old['end_to_end'][q] * 1000:.1f}ms -> {row['end_to_end'][q] * 1000:.1f}ms")
+        if old["pages_per_second"] and row["pages_per_second"] < old["pages_per_second"] * (1 - tolerance):
+            regressions.append(f"{key[0]} page(s) @ {key[1][0]}x{key[1][1]} pages/s: "
+                               f"{old['pages_per_second']:.1f} -> {row['pages_per_second']:.1f}")
+    return regressions
+
+
+def _parse_sizes(value):
+    return [tuple(int(v) for v in size.split("x")) for size in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline SuryaOCR worker benchmark with stub predictors")
+    parser.add_argument("--job-sizes", default=",".join(map(str, DEFAULT_JOB_SIZES)),
+                        help="Comma-separated pages per job (default: 1,8,32)")
+    parser.add_argument("--image-sizes", default=",".join(f"{w}x{h}" for w, h in DEFAULT_IMAGE_SIZES),
+                        help="Comma-separated WIDTHxHEIGHT page sizes (default: 850x1100,1700x2200,2550x3300)")
+    parser.add_argument("--iterations", type=int, default=10, help="Jobs per combination (default: 10)")
+    parser.add_argument("--lines-per-page", type=int, default=40, help="Text lines the stub detector finds")
+    parser.add_argument("--detection-latency", type=float, default=0.01,
+                        help="Stub detection seconds per image (default: 0.01)")
+    parser.add_argument("--recognition-latency", type=float, default=0.0005,
+                        help="Stub recognition seconds per line (default: 0.0005)")
+    parser.add_argument("--operation", default="ocr", choices=sorted(handler_final.OPERATIONS),
+                        help="Handler operation to benchmark (default: ocr)")
+    parser.add_argument("--load-latency", type=float, default=0.0,
+                        help="Stub seconds to load each model (default: 0)")
+    parser.add_argument("--boot", action="store_true",
+                        help="Measure worker boot (concurrent model load + warmup) before the sweep")
+    parser.add_argument("--oom-pixels", type=int, default=0,
+                        help="Stub detection raises out-of-memory above this many pixels per call")
+    parser.add_argument("--oom-lines", type=int, default=0,
+                        help="Stub recognition raises out-of-memory when recognizing more than this many lines at once")
+    parser.add_argument("--http", action="store_true",
+                        help="Also run batch_ocr end-to-end against a local /run + /status stand-in")
+    parser.add_argument("--http-pages", type=int, default=64, help="Pages for the --http run (default: 64)")
+    parser.add_argument("--http-workers", type=int, default=1, help="Stand-in worker threads (default: 1)")
+    parser.add_argument("--pages-per-job", type=int, default=1, help="batch_ocr packing for the --http run")
+    parser.add_argument("--http-error-rate", type=float, default=0.0,
+                        help="Share of stand-in /run and /status requests answered with 503 (default: 0)")
+    parser.add_argument("--http-throttle-rate", type=float, default=0.0,
+                        help="Share of stand-in /run and /status requests answered with 429 (default: 0)")
+    parser.add_argument("--http-stall-rate", type=float, default=0.0,
+                        help="Share of stand-in jobs that hang until cancelled (default: 0)")
+    parser.add_argument("--http-outage", metavar="START,END",
+                        help="Seconds after the first request during which the stand-in answers everything with 503")
+    parser.add_argument("--output", help="Write results as a JSON baseline to this file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed relative slowdown for --compare (default: {DEFAULT_TOLERANCE})")
+    parser.add_argument("--cpu-quantization", nargs="+", metavar="SAMPLE",
+                        help="Instead of the stub sweep, compare fp32 and int8 real Surya models on CPU "
+                             "over these sample images (needs DEVICE=cpu and surya-ocr)")
+    parser.add_argument("--repeats", type=int, default=1, help="Passes over the samples per mode (default: 1)")
+    parser.add_argument("--verbose", action="store_true", help="Show handler logs")
+    args = parser.parse_args()
+
+    # Every pass must reach the predictors: the line memo would answer repeated crops
+    # (and let an int8 pass reuse fp32 text)
+    handler_final.LINE_MEMO = None
+
+    if args.cpu_quantization:
+        print(f"🧪 CPU fp32 vs int8 on {len(args.cpu_quantization)} sample(s), {handler_final.CPU_THREADS} threads")
+        report = {"timestamp": datetime.now().isoformat(timespec="seconds"),
+                  "cpu_quantization": bench_cpu_quantization(args.cpu_quantization, args.repeats)}
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"\n✓ Results saved to: {args.output}")
+        return
+
+    job_sizes = [int(v) for v in args.job_sizes.split(",")]
+    image_sizes = _parse_sizes(args.image_sizes)
+    install_stub_models(args.lines_per_page, args.detection_latency, args.recognition_latency,
+                        load_latency=args.load_latency, oom_pixels=args.oom_pixels, oom_lines=args.oom_lines)
+
+    print("=" * 60)
+    print("🧪 SuryaOCR Offline Benchmark (stub predictors)")
+    print("=" * 60)
+    print(f"Job sizes: {job_sizes}")
+    print(f"Image sizes: {[f'{w}x{h}' for w, h in image_sizes]}")
+    print(f"Iterations: {args.iterations}")
+    print("=" * 60)
+
+    boot_report = None
+    if args.boot:
+        print("\n🚀 Worker boot (concurrent model load + warmup)...")
+        boot_report = handler_final.boot([args.operation])
+        print(f"  Model load: {boot_report['load_wall']:.2f}s wall vs "
+              f"{sum(boot_report['models'].values()):.2f}s if loaded one after another\n")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "operation": args.operation,
+            "lines_per_page": args.lines_per_page,
+            "detection_latency": args.detection_latency,
+            "recognition_latency": args.recognition_latency,
+            "pipeline_chunk_size": handler_final.PIPELINE_CHUNK_SIZE,
+            "decode_workers": handler_final.DECODE_WORKERS
+        },
+        "handler": bench_handler(job_sizes, image_sizes, args.iterations, quiet=not args.verbose,
+                                 operation=args.operation)
+    }
+    if boot_report is not None:
+        report["boot"] = boot_report
+    report["batching"] = {batcher.name: {"batch_size": batcher.batch_size, "budget": batcher.budget,
+                                         "ooms": batcher.ooms}
+                          for batcher in (handler_final.DETECTION_BATCHER, handler_final.RECOGNITION_BATCHER)}
+    if any(state["ooms"] for state in report["batching"].values()):
+        print(f"  Out-of-memory back-off: {report['batching']}")
+
+    if args.http:
+        print(f"\n🌐 batch_ocr -> local stand-in ({args.http_pages} pages)...")
+        faults = {"error_rate": args.http_error_rate, "throttle_rate": args.http_throttle_rate,
+                  "stall_rate": args.http_stall_rate,
+                  "outage": tuple(float(v) for v in args.http_outage.split(",")) if args.http_outage else None}
+        report["http"] = bench_http(args.http_pages, image_sizes[0], args.http_workers,
+                                    max_in_flight=32, pages_per_job=args.pages_per_job, faults=faults)
+        http = report["http"]
+        print(f"  {http['completed']}/{http['pages']} pages in {http['elapsed']:.2f}s "
+              f"({http['pages_per_second']:.1f} pages/s, p95 page latency "
+              f"{http['page_latency']['p95'] or 0:.2f}s)")
+        if any(http["faults"].values()):
+            print(f"  Injected faults: {http['faults']}")
+            print(f"  Client: {http['resilience']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Results saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regression(s) vs {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n✓ No regressions vs {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
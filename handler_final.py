@@ -1,129 +1,2035 @@
-import runpod
+import asyncio
 import base64
+import copy
+import gzip
+import hashlib
 import io
+import ipaddress
+import json
+import math
 import sys
 import os
-import torch
+import queue
+import socket
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
 from PIL import Image
+import numpy as np
 
-print("Starting SuryaOCR Handler...", flush=True)
+_BOOT_START = time.perf_counter()
+
+# Execution device: "cuda", "cpu" or "auto" (cuda when available). CPU workers pin
+# OMP/MKL/torch threads to CPU_THREADS and int8-quantize the Linear layers of
+# CPU_INT8_MODELS (comma-separated, empty = keep fp32)
+DEVICE = os.getenv('DEVICE', 'auto')
+CPU_THREADS = int(os.getenv('CPU_THREADS', len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity')
+                            else os.cpu_count() or 4))
+CPU_INT8_MODELS = [m.strip() for m in os.getenv('CPU_INT8_MODELS', 'foundation,detection,layout,table').split(',')
+                   if m.strip()]
+if DEVICE == 'cpu':
+    # Must be in the environment before torch creates its thread pools
+    os.environ['OMP_NUM_THREADS'] = str(CPU_THREADS)
+    os.environ['MKL_NUM_THREADS'] = str(CPU_THREADS)
+
+try:
+    import torch
+except ImportError:
+    # Allows CPU-only tooling (stub predictors, local tests) to import the handler
+    torch = None
+
+if DEVICE == 'auto':
+    DEVICE = 'cuda' if torch is not None and torch.cuda.is_available() else 'cpu'
+os.environ.setdefault('TORCH_DEVICE', DEVICE)  # read by surya's settings
+
+print(f"Starting SuryaOCR Handler (device={DEVICE})...", flush=True)
 print(f"ENV: RECOGNITION_BATCH_SIZE={os.getenv('RECOGNITION_BATCH_SIZE', 'not set')}", flush=True)
 print(f"ENV: DETECTOR_BATCH_SIZE={os.getenv('DETECTOR_BATCH_SIZE', 'not set')}", flush=True)
 
 # Enable PyTorch optimizations
-torch.set_float32_matmul_precision('high')
-torch.backends.cudnn.benchmark = True
-torch.backends.cuda.matmul.allow_tf32 = True
+if torch is not None and DEVICE == 'cuda':
+    torch.set_float32_matmul_precision('high')
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+elif torch is not None:
+    torch.set_num_threads(CPU_THREADS)
+    try:
+        torch.set_num_interop_threads(max(1, CPU_THREADS // 4))
+    except RuntimeError:
+        pass  # already set (handler imported after torch did parallel work)
+
+# Model registry: each predictor is loaded on first use and then stays resident,
+# so workers only pay load time and memory for the operations they serve
+MODELS = {}
+MODEL_NAMES = ("foundation", "recognition", "detection", "layout", "table")
+_MODEL_LOCKS = {name: threading.Lock() for name in MODEL_NAMES}
+_SETTINGS_LOCK = threading.Lock()
+_SURYA_CONFIGURED = False
+
+# Result cache: in-memory LRU (byte budget) + optional on-disk tier
+OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', '')
+
+# Line memo (opt-in): text of recognized line crops, keyed by a hash of the crop's
+# exact grayscale pixels; LRU bounded by entry count (0 = off)
+LINE_MEMO_MAX_ENTRIES = int(os.getenv('LINE_MEMO_MAX_ENTRIES', 0))
+
+# Image decoding: thread pool size, downscale target and hard rejection limits
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', min(16, os.cpu_count() or 4)))
+DECODE_TARGET_PIXELS = int(os.getenv('DECODE_TARGET_PIXELS', 36_000_000))
+DECODE_MAX_PIXELS = int(os.getenv('DECODE_MAX_PIXELS', 250_000_000))
+DECODE_MAX_BYTES = int(os.getenv('DECODE_MAX_BYTES', 64 * 1024 * 1024))
+Image.MAX_IMAGE_PIXELS = None  # enforced in decode_image via DECODE_MAX_PIXELS
+# Page pre-filter (both opt-in): with SKIP_BLANK_PAGES=on (or "skip_blank": true)
+# pages with less ink than BLANK_INK_RATIO (share of dark pixels) get empty results
+# without running the models; with DEDUPE_PAGES=on (or "dedupe": true) pages whose
+# perceptual hashes differ in at most DUPLICATE_MAX_DISTANCE of their bits are
+# processed once per job
+SKIP_BLANK_PAGES = os.getenv('SKIP_BLANK_PAGES', 'off') == 'on'
+BLANK_INK_RATIO = float(os.getenv('BLANK_INK_RATIO', 0.00001))
+DEDUPE_PAGES = os.getenv('DEDUPE_PAGES', 'off') == 'on'
+DUPLICATE_MAX_DISTANCE = float(os.getenv('DUPLICATE_MAX_DISTANCE', 0.02))
+DECODE_POOL = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+
+# Image references: {"url": ...} fetched over a pooled HTTP session, {"path": ...}
+# read from an allowlisted directory (e.g. a RunPod network volume). URLs may only
+# point at FETCH_URL_HOSTS (comma-separated, ".example.com" matches subdomains) or,
+# without an allowlist, at public addresses: never at private, loopback or link-local
+# ones such as the 169.254.169.254 metadata service
+FETCH_CONNECT_TIMEOUT = float(os.getenv('FETCH_CONNECT_TIMEOUT', 5))
+FETCH_READ_TIMEOUT = float(os.getenv('FETCH_READ_TIMEOUT', 30))
+FETCH_POOL_SIZE = int(os.getenv('FETCH_POOL_SIZE', 32))
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', DECODE_MAX_BYTES))
+FETCH_MAX_REDIRECTS = int(os.getenv('FETCH_MAX_REDIRECTS', 3))
+FETCH_URL_HOSTS = [h.strip().lower() for h in os.getenv('FETCH_URL_HOSTS', '').split(',') if h.strip()]
+FETCH_PATH_ROOTS = [p for p in os.getenv('FETCH_PATH_ROOTS', '/runpod-volume').split(':') if p]
+_HTTP_SESSION = None
+_HTTP_SESSION_LOCK = threading.Lock()
+
+# Handler mode: "sync" (one job at a time), "batch" (cross-job micro-batching)
+# or "stream" (generator handler yielding pages as each sub-batch finishes)
+HANDLER_MODE = os.getenv('HANDLER_MODE', 'sync')
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 8))
+
+# Boot: models of these operations are loaded at process start (comma-separated,
+# "none" = load lazily on first job), then a warmup page is run before accepting jobs
+PRELOAD_OPERATIONS = [op.strip() for op in os.getenv('PRELOAD_OPERATIONS', 'ocr').split(',')
+                      if op.strip() and op.strip() != 'none']
+WARMUP = os.getenv('WARMUP', '1') != '0'
+
+# In-job stage pipeline: images per chunk and chunks buffered between stages
+PIPELINE_CHUNK_SIZE = int(os.getenv('PIPELINE_CHUNK_SIZE', 16))
+PIPELINE_QUEUE_DEPTH = int(os.getenv('PIPELINE_QUEUE_DEPTH', 2))
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', 32))
+MICROBATCH_MAX_BATCH = int(os.getenv('MICROBATCH_MAX_BATCH', 64))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv('MICROBATCH_MAX_WAIT_MS', 50))
+
+# Adaptive batching: predictor batch sizes are ceilings (halved and remembered
+# on CUDA OOM); each predictor call is capped at a budget of decoded pixels
+# (detection) or text lines (recognition), so huge jobs are split
+def _batch_size(name, gpu_default, cpu_default):
+    # CPU workers read CPU_<name>, since the image sets GPU-sized values for <name>
+    if DEVICE == 'cpu':
+        return int(os.getenv(f'CPU_{name}', cpu_default))
+    return int(os.getenv(name, gpu_default))
+
+
+RECOGNITION_BATCH_SIZE = _batch_size('RECOGNITION_BATCH_SIZE', 1024, 32)
+DETECTOR_BATCH_SIZE = _batch_size('DETECTOR_BATCH_SIZE', 128, 4)
+LAYOUT_BATCH_SIZE = _batch_size('LAYOUT_BATCH_SIZE', 32, 4)
+TABLE_REC_BATCH_SIZE = _batch_size('TABLE_REC_BATCH_SIZE', 64, 8)
+DETECT_PIXEL_BUDGET = int(os.getenv('DETECT_PIXEL_BUDGET', 400_000_000))
+RECOGNITION_LINE_BUDGET = int(os.getenv('RECOGNITION_LINE_BUDGET', 8192))
+# Limits lowered after out-of-memory double back (up to the values above) after this many successful calls
+OOM_RECOVERY_CALLS = int(os.getenv('OOM_RECOVERY_CALLS', 100))
+
+# Tiling: with TILING=on (or "tiling": true in the job input) large pages are
+# decoded at full resolution instead of being shrunk to DECODE_TARGET_PIXELS;
+# pages above TILE_MIN_PIXELS are detected as overlapping TILE_SIZE tiles
+TILING = os.getenv('TILING', 'off') == 'on'
+TILE_SIZE = int(os.getenv('TILE_SIZE', 2048))
+TILE_OVERLAP = int(os.getenv('TILE_OVERLAP', 256))
+TILE_MIN_PIXELS = int(os.getenv('TILE_MIN_PIXELS', DECODE_TARGET_PIXELS or 36_000_000))
+
+# Telemetry: log verbosity (per-image lines are "debug"), Prometheus text file
+# rewritten after every job, and interval (s) of aggregated JSON log lines
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LOG_LEVEL = LOG_LEVELS.get(os.getenv('LOG_LEVEL', 'info').lower(), 20)
+METRICS_PROM_FILE = os.getenv('METRICS_PROM_FILE', '')
+METRICS_LOG_INTERVAL = float(os.getenv('METRICS_LOG_INTERVAL', 0))
+
+
+def log(message, level="info"):
+    if LOG_LEVELS[level] >= LOG_LEVEL:
+        # One write per line so lines from concurrent threads do not interleave
+        print(message + "\n", end="", flush=True)
+
+
+class Metrics:
+    """Process-wide counters and latency histograms.
 
-# Global model instances
-FOUNDATION_PREDICTOR = None
-RECOGNITION_PREDICTOR = None
-DETECTION_PREDICTOR = None
+    Exported as Prometheus text exposition (METRICS_PROM_FILE, e.g. for a
+    node-exporter textfile collector) and/or as a JSON log line every
+    METRICS_LOG_INTERVAL seconds.
+    """
 
-def initialize_models():
-    global FOUNDATION_PREDICTOR, RECOGNITION_PREDICTOR, DETECTION_PREDICTOR
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    HELP = {
+        "ocr_jobs_total": ("counter", "Jobs handled, by status"),
+        "ocr_images_total": ("counter", "Input images, by cache outcome"),
+        "ocr_pixels_total": ("counter", "Pixels of decoded images sent to the models"),
+        "ocr_lines_total": ("counter", "Text lines recognized"),
+        "ocr_stage_seconds": ("histogram", "Per-job time spent in each stage"),
+        "ocr_job_seconds": ("histogram", "End-to-end handler time per job"),
+        "ocr_model_load_seconds": ("histogram", "Model load time, by model"),
+        "ocr_line_memo_total": ("counter", "Text lines by line memo outcome (hit = not sent to recognition)"),
+        "ocr_line_memo_hit_ratio": ("gauge", "Share of text lines served by the line memo since start"),
+        "ocr_pages_skipped_total": ("counter", "Pages answered without the models, by reason"),
+        "ocr_tiles_total": ("counter", "Detection tiles cut from pages above TILE_MIN_PIXELS"),
+        "ocr_oom_retries_total": ("counter", "Predictor calls retried after out-of-memory, by stage"),
+        "ocr_batch_size": ("gauge", "Current predictor batch size ceiling, by stage"),
+        "ocr_ready_seconds": ("gauge", "Process start to ready to accept jobs, by phase"),
+    }
 
-    if FOUNDATION_PREDICTOR is None:
-        print("Loading SuryaOCR models... This takes 2-3 seconds with pre-cached models.", flush=True)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._last_log = time.monotonic()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.setdefault(key, {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += seconds
+            hist["count"] += 1
+
+    def record_job(self, status, ocr_job=None, timings=None, elapsed=None):
+        """Fold one finished job into the aggregates and export them"""
+        self.inc("ocr_jobs_total", status=status)
+        if ocr_job is not None:
+            self.inc("ocr_images_total", ocr_job.hits, cache="hit")
+            self.inc("ocr_images_total", ocr_job.misses, cache="miss")
+            self.inc("ocr_pixels_total", ocr_job.counts["pixels"])
+            self.inc("ocr_lines_total", ocr_job.counts["lines"])
+            self.inc("ocr_pages_skipped_total", ocr_job.counts["blank"], reason="blank")
+            self.inc("ocr_pages_skipped_total", ocr_job.counts["duplicates"], reason="duplicate")
+        for stage, seconds in (timings or {}).items():
+            if stage != "wall" and seconds:
+                self.observe("ocr_stage_seconds", seconds, stage=stage)
+        if elapsed is not None:
+            self.observe("ocr_job_seconds", elapsed)
+        self.export()
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in self.HELP.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind in ("counter", "gauge"):
+                    for (key_name, labels), value in self._counters.items():
+                        if key_name == name:
+                            lines.append(f"{name}{_prom_labels(labels)} {value}")
+                    continue
+                for (key_name, labels), hist in self._histograms.items():
+                    if key_name != name:
+                        continue
+                    for bound, count in zip(self.BUCKETS, hist["buckets"]):
+                        lines.append(f"{name}_bucket{_prom_labels(labels + (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_prom_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+                    lines.append(f"{name}_sum{_prom_labels(labels)} {hist['sum']:.6f}")
+                    lines.append(f"{name}_count{_prom_labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            counters = {name + _prom_labels(labels): value for (name, labels), value in self._counters.items()}
+            histograms = {name + _prom_labels(labels): {
+                "count": hist["count"],
+                "sum": round(hist["sum"], 4),
+                "mean": round(hist["sum"] / hist["count"], 4) if hist["count"] else None
+            } for (name, labels), hist in self._histograms.items()}
+        return {"counters": counters, "histograms": histograms}
+
+    def export(self):
+        if METRICS_PROM_FILE:
+            try:
+                tmp = f"{METRICS_PROM_FILE}.tmp"
+                with open(tmp, "w") as f:
+                    f.write(self.render_prometheus())
+                os.replace(tmp, METRICS_PROM_FILE)
+            except OSError as e:
+                log(f"✗ Metrics export failed: {e}", "warning")
+        if METRICS_LOG_INTERVAL and time.monotonic() - self._last_log >= METRICS_LOG_INTERVAL:
+            self._last_log = time.monotonic()
+            print(json.dumps({"metrics": self.snapshot()}, separators=(",", ":")), flush=True)
+
+
+def _prom_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+METRICS = Metrics()
+MODEL_LOAD_TIMINGS = {}
+
+
+def _is_oom(e):
+    return isinstance(e, MemoryError) or (isinstance(e, RuntimeError) and "out of memory" in str(e).lower())
+
+
+def _release_cuda_memory():
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class AdaptiveBatcher:
+    """Runs a predictor over items in sub-batches bounded by a cost budget.
+
+    Items are grouped so each call stays under `budget` (pixels or lines).
+    On out-of-memory the batch size ceiling is halved so later jobs do not
+    hit the same OOM. By default the batch size counts items: the failed
+    sub-batch is retried in halves and the budget is halved too, and a single
+    item fails at once. With lines=True the batch size counts cost units
+    inside items (recognition lines within pages): the same sub-batch is
+    retried at the lower batch size, even a single page, and it is only split
+    into halves once the batch size is down to 1. After OOM_RECOVERY_CALLS
+    successful calls the limits double again, up to their configured values.
+    """
+
+    def __init__(self, name, batch_size, budget, lines=False):
+        self.name = name
+        self.lines = lines
+        self.max_batch_size = self.batch_size = max(1, batch_size)
+        self.max_budget = self.budget = max(1, budget)
+        self.ooms = 0
+        self._successes = 0
+        self._lock = threading.Lock()
+        METRICS.set("ocr_batch_size", self.batch_size, stage=name)
+
+    def run(self, items, costs, fn):
+        """Call fn(sub_items, batch_size) per sub-batch; returns one result per item"""
+        results = []
+        for start, end in self._groups(costs):
+            results.extend(self._call(items[start:end], costs[start:end], fn))
+        return results
+
+    def _groups(self, costs):
+        start, total = 0, 0
+        for i, cost in enumerate(costs):
+            if i > start and total + cost > self.budget:
+                yield start, i
+                start, total = i, 0
+            total += cost
+        if start < len(costs):
+            yield start, len(costs)
+
+    def _call(self, items, costs, fn):
+        batch_size = self.batch_size
         try:
-            # Set batch sizes programmatically (fallback + override)
-            from surya import settings
-            settings.RECOGNITION_BATCH_SIZE = int(os.getenv('RECOGNITION_BATCH_SIZE', 1024))
-            settings.DETECTOR_BATCH_SIZE = int(os.getenv('DETECTOR_BATCH_SIZE', 128))
-            print(f"✓ Batch sizes set: RECOGNITION={settings.RECOGNITION_BATCH_SIZE}, DETECTOR={settings.DETECTOR_BATCH_SIZE}", flush=True)
-
-            from surya.foundation import FoundationPredictor
-            from surya.recognition import RecognitionPredictor
-            from surya.detection import DetectionPredictor
-            
-            print("✓ Loading Foundation model...", flush=True)
-            FOUNDATION_PREDICTOR = FoundationPredictor()
-            
-            print("✓ Loading Recognition model...", flush=True)
-            RECOGNITION_PREDICTOR = RecognitionPredictor(FOUNDATION_PREDICTOR)
-            
-            print("✓ Loading Detection model...", flush=True)
-            DETECTION_PREDICTOR = DetectionPredictor()
-            
-            print("✓ All models loaded successfully!", flush=True)
+            results = fn(items, batch_size)
         except Exception as e:
-            print(f"✗ Model loading failed: {e}", flush=True)
-            raise
-    
-    return RECOGNITION_PREDICTOR, DETECTION_PREDICTOR
+            # Predictors run min(batch_size, <items or lines in the call>) at once
+            effective = min(batch_size, sum(costs) if self.lines else len(items))
+            split = effective == 1 or not self.lines
+            if not _is_oom(e) or (len(items) == 1 and split):
+                raise
+            _release_cuda_memory()
+            with self._lock:
+                self.ooms += 1
+                self._successes = 0
+                # Another thread may already have lowered the ceiling further
+                self.batch_size = max(1, min(self.batch_size, effective // 2))
+                if split:
+                    self.budget = max(1, self.budget // 2)
+            METRICS.inc("ocr_oom_retries_total", stage=self.name)
+            METRICS.set("ocr_batch_size", self.batch_size, stage=self.name)
+            log(f"✗ {self.name} out of memory on {len(items)} item(s) at batch size {effective}, "
+                f"retrying {'in halves' if split else 'at ' + str(self.batch_size)}", "warning")
+            if not split:
+                return self._call(items, costs, fn)
+            mid = len(items) // 2
+            return self._call(items[:mid], costs[:mid], fn) + self._call(items[mid:], costs[mid:], fn)
+
+        self._recover()
+        return results
+
+    def _recover(self):
+        """Double lowered limits back towards their configured values after a run of successful calls"""
+        if self.batch_size == self.max_batch_size and self.budget == self.max_budget:
+            return
+        with self._lock:
+            self._successes += 1
+            if self._successes < OOM_RECOVERY_CALLS:
+                return
+            self._successes = 0
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+            self.budget = min(self.max_budget, self.budget * 2)
+        METRICS.set("ocr_batch_size", self.batch_size, stage=self.name)
+        log(f"✓ {self.name} batch size back up to {self.batch_size} after {OOM_RECOVERY_CALLS} calls "
+            f"without out-of-memory", "info")
+
+
+DETECTION_BATCHER = AdaptiveBatcher("detection", DETECTOR_BATCH_SIZE, DETECT_PIXEL_BUDGET)
+RECOGNITION_BATCHER = AdaptiveBatcher("recognition", RECOGNITION_BATCH_SIZE, RECOGNITION_LINE_BUDGET, lines=True)
+LAYOUT_BATCHER = AdaptiveBatcher("layout", LAYOUT_BATCH_SIZE, DETECT_PIXEL_BUDGET)
+TABLE_BATCHER = AdaptiveBatcher("table", TABLE_REC_BATCH_SIZE, DETECT_PIXEL_BUDGET)
+
+
+class ResultCache:
+    """Content-addressed cache of formatted page results"""
+
+    def __init__(self, max_bytes, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _remember(self, key, payload):
+        """Insert a serialized entry into the memory tier, evicting LRU entries"""
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = payload
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get(self, key):
+        """Return the cached page result for key, or None"""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+        if payload is None and self.cache_dir is not None:
+            path = self._disk_path(key)
+            try:
+                payload = path.read_bytes()
+            except OSError:
+                return None
+            self._remember(key, payload)
+        if payload is None:
+            return None
+        return json.loads(payload)
+
+    def put(self, key, result):
+        """Store a page result in memory and, if configured, on disk"""
+        payload = json.dumps(result, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        self._remember(key, payload)
+        if self.cache_dir is not None:
+            path = self._disk_path(key)
+            try:
+                path.parent.mkdir(exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_bytes(payload)
+                os.replace(tmp, path)
+            except OSError as e:
+                log(f"✗ Cache write failed for {key[:12]}: {e}", "warning")
+
+
+RESULT_CACHE = ResultCache(OCR_CACHE_MAX_BYTES, OCR_CACHE_DIR or None)
+CACHE_SIGNATURE = None
+
+
+def cache_key(img_bytes, extra=""):
+    """Hash image bytes together with the settings that affect OCR output"""
+    digest = hashlib.sha256()
+    digest.update((CACHE_SIGNATURE or "").encode("utf-8"))
+    digest.update(extra.encode("utf-8"))
+    digest.update(img_bytes.getbuffer() if isinstance(img_bytes, io.BytesIO) else img_bytes)
+    return digest.hexdigest()
+
+
+class LineMemo:
+    """LRU of recognized (text, confidence) per normalized line crop.
+
+    Running headers, footers, page numbers and form labels repeat across
+    thousands of pages; their crops hash the same, so they are recognized once.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """Return {key: (text, confidence)} for the keys that are known"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = value
+        return found
+
+    def put(self, key, text, confidence):
+        with self._lock:
+            self._entries[key] = (text, confidence)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            total = self.hits + self.misses
+            ratio = self.hits / total if total else 0.0
+        METRICS.inc("ocr_line_memo_total", hits, outcome="hit")
+        METRICS.inc("ocr_line_memo_total", misses, outcome="miss")
+        METRICS.set("ocr_line_memo_hit_ratio", round(ratio, 4))
+
+
+LINE_MEMO = LineMemo(LINE_MEMO_MAX_ENTRIES) if LINE_MEMO_MAX_ENTRIES > 0 else None
+
+
+def line_crop_key(img, polygon):
+    """Hash of a line crop's exact grayscale pixels at native size.
+
+    Only pixel-identical crops share a key (a line rendered the same way at
+    another position), so lines that merely look alike, such as different
+    page numbers or amounts, never reuse each other's text.
+    """
+    xs = [x for x, _ in polygon]
+    ys = [y for _, y in polygon]
+    crop = img.crop((int(min(xs)), int(min(ys)), int(math.ceil(max(xs))), int(math.ceil(max(ys)))))
+    width, height = crop.size
+    if not width or not height:
+        return None
+    return hashlib.blake2b(f"{width}x{height}".encode() + crop.convert("L").tobytes(), digest_size=16).hexdigest()
+
+
+def _surya_version():
+    try:
+        from importlib.metadata import version
+        return version("surya-ocr")
+    except Exception:
+        return "unknown"
+
+def _configure_surya():
+    """Apply batch size settings and compute the cache signature (once)"""
+    global _SURYA_CONFIGURED, CACHE_SIGNATURE
+
+    with _SETTINGS_LOCK:
+        if _SURYA_CONFIGURED:
+            return
+        # Set batch sizes programmatically (fallback + override)
+        from surya import settings
+        settings.RECOGNITION_BATCH_SIZE = RECOGNITION_BATCH_SIZE
+        settings.DETECTOR_BATCH_SIZE = DETECTOR_BATCH_SIZE
+        print(f"✓ Batch sizes set: RECOGNITION={settings.RECOGNITION_BATCH_SIZE}, DETECTOR={settings.DETECTOR_BATCH_SIZE}", flush=True)
+
+        CACHE_SIGNATURE = (
+            f"surya={_surya_version()};"
+            f"rec_bs={settings.RECOGNITION_BATCH_SIZE};"
+            f"det_bs={settings.DETECTOR_BATCH_SIZE};"
+            f"target_px={DECODE_TARGET_PIXELS};"
+            f"device={DEVICE};"
+            f"int8={','.join(CPU_INT8_MODELS) if DEVICE == 'cpu' else ''};"
+            f"ns={os.getenv('OCR_CACHE_NAMESPACE', '')}"
+        )
+        _SURYA_CONFIGURED = True
+
+
+def _load_foundation():
+    from surya.foundation import FoundationPredictor
+    return FoundationPredictor()
+
+
+def _load_recognition():
+    from surya.recognition import RecognitionPredictor
+    return RecognitionPredictor(get_model("foundation"))
+
+
+def _load_detection():
+    from surya.detection import DetectionPredictor
+    return DetectionPredictor()
+
+
+def _load_layout():
+    # Layout runs on its own foundation checkpoint, separate from recognition's
+    from surya.foundation import FoundationPredictor
+    from surya.layout import LayoutPredictor
+    from surya.settings import settings
+    return LayoutPredictor(FoundationPredictor(checkpoint=settings.LAYOUT_MODEL_CHECKPOINT))
+
+
+def _load_table():
+    from surya.table_rec import TableRecPredictor
+    return TableRecPredictor()
+
+
+# Models that must be loaded before (and are passed to) another model
+MODEL_DEPENDENCIES = {"recognition": ("foundation",)}
+
+MODEL_LOADERS = {
+    "foundation": _load_foundation,
+    "recognition": _load_recognition,
+    "detection": _load_detection,
+    "layout": _load_layout,
+    "table": _load_table,
+}
+
+
+def get_model(name):
+    """Return a resident predictor, loading it on first use"""
+    model = MODELS.get(name)
+    if model is not None:
+        return model
+    for dependency in MODEL_DEPENDENCIES.get(name, ()):
+        get_model(dependency)
+    with _MODEL_LOCKS[name]:
+        if name not in MODELS:
+            _configure_surya()
+            log(f"✓ Loading {name} model...")
+            try:
+                MODELS[name] = _timed_load(name, lambda: _maybe_quantize(name, MODEL_LOADERS[name]()))
+            except Exception as e:
+                log(f"✗ Loading {name} model failed: {e}", "error")
+                raise
+            log(f"✓ {name.capitalize()} model loaded in {MODEL_LOAD_TIMINGS[name]:.2f}s")
+            METRICS.export()
+        return MODELS[name]
+
+
+def initialize_models(operation="ocr", models=None):
+    """Load (once) every model the operation needs, or just the given models"""
+    for name in models or OPERATIONS[operation].models:
+        get_model(name)
+
+
+def _maybe_quantize(name, predictor):
+    """On CPU, replace the Linear layers of predictor.model with dynamic int8 ones"""
+    model = getattr(predictor, "model", None)
+    if DEVICE != "cpu" or name not in CPU_INT8_MODELS or torch is None or not isinstance(model, torch.nn.Module):
+        return predictor
+    try:
+        predictor.model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        log(f"✓ {name.capitalize()} model quantized to int8")
+    except Exception as e:
+        log(f"✗ int8 quantization of {name} failed, keeping fp32: {e}", "warning")
+    return predictor
+
+
+def _timed_load(name, factory, *args):
+    """Construct a predictor, recording its load time"""
+    started = time.perf_counter()
+    predictor = factory(*args)
+    MODEL_LOAD_TIMINGS[name] = time.perf_counter() - started
+    METRICS.observe("ocr_model_load_seconds", MODEL_LOAD_TIMINGS[name], model=name)
+    return predictor
+
+
+def _http_session():
+    global _HTTP_SESSION
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=FETCH_POOL_SIZE, pool_maxsize=FETCH_POOL_SIZE, max_retries=2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _HTTP_SESSION = session
+    return _HTTP_SESSION
+
+
+def check_url(url):
+    """Refuse URLs outside FETCH_URL_HOSTS or, without an allowlist, on non-public addresses"""
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"unsupported URL: {url[:32]}")
+    host = parts.hostname.lower()
+    if FETCH_URL_HOSTS:
+        if not any(host == allowed or allowed.startswith(".") and host.endswith(allowed)
+                   for allowed in FETCH_URL_HOSTS):
+            raise ValueError(f"host is not in FETCH_URL_HOSTS: {host}")
+        return
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    for *_, sockaddr in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP):
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if not address.is_global:
+            raise ValueError(f"refusing to fetch from non-public address {address} ({host})")
+
+
+def fetch_url(url):
+    """Download an image into a BytesIO, streaming it and enforcing FETCH_MAX_BYTES.
+
+    Redirects are followed by hand so every hop passes check_url.
+    """
+    session = _http_session()
+    for _ in range(FETCH_MAX_REDIRECTS + 1):
+        check_url(url)
+        response = session.get(url, stream=True, allow_redirects=False,
+                               timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT))
+        if not response.is_redirect:
+            break
+        url = urllib.parse.urljoin(url, response.headers["Location"])
+        response.close()
+    else:
+        raise ValueError(f"more than {FETCH_MAX_REDIRECTS} redirects")
+
+    with response:
+        response.raise_for_status()
+        declared = int(response.headers.get("Content-Length") or 0)
+        if FETCH_MAX_BYTES and declared > FETCH_MAX_BYTES:
+            raise ValueError(f"payload exceeds {FETCH_MAX_BYTES} bytes")
+        # Decoded in place (see decode_image), so the body is held in memory once
+        buffer = io.BytesIO()
+        for block in response.iter_content(chunk_size=256 * 1024):
+            buffer.write(block)
+            if FETCH_MAX_BYTES and buffer.tell() > FETCH_MAX_BYTES:
+                raise ValueError(f"payload exceeds {FETCH_MAX_BYTES} bytes")
+    buffer.seek(0)
+    return buffer
+
+
+def read_path(path):
+    """Read an image from a local path under one of FETCH_PATH_ROOTS"""
+    real = os.path.realpath(path)
+    if not any(real == root or real.startswith(root.rstrip("/") + "/")
+               for root in map(os.path.realpath, FETCH_PATH_ROOTS)):
+        raise ValueError(f"path is outside the allowed roots: {path}")
+    if FETCH_MAX_BYTES and os.path.getsize(real) > FETCH_MAX_BYTES:
+        raise ValueError(f"payload exceeds {FETCH_MAX_BYTES} bytes")
+    with open(real, "rb") as f:
+        return f.read()
+
+
+def read_image_source(source):
+    """Return the encoded image bytes of a job input entry (a BytesIO for URLs).
+
+    Entries are base64 strings (optionally data URLs) or dicts with one of
+    "data" (base64), "url" or "path". Dict entries may also carry "scale"
+    (original size / uploaded size) when the client downscaled the page
+    before upload, so results are reported in original page coordinates.
+    """
+    if isinstance(source, dict):
+        if "url" in source:
+            return fetch_url(source["url"])
+        if "path" in source:
+            return read_path(source["path"])
+        if "data" not in source:
+            raise ValueError("image entry needs one of 'data', 'url' or 'path'")
+        source = source["data"]
+    if not isinstance(source, str):
+        raise ValueError(f"unsupported image entry of type {type(source).__name__}")
+
+    # Remove data URL prefix if present
+    if source.startswith("data:"):
+        source = source.split(",")[1]
+
+    # Reject oversized payloads before allocating the decoded buffer
+    if DECODE_MAX_BYTES and len(source) * 3 // 4 > DECODE_MAX_BYTES:
+        raise ValueError(f"payload exceeds {DECODE_MAX_BYTES} bytes")
+
+    return base64.b64decode(source)
+
+
+def decode_image(img_bytes, target_pixels=DECODE_TARGET_PIXELS):
+    """Decode image bytes (or a BytesIO) to RGB (see prepare_image)"""
+    if not isinstance(img_bytes, io.BytesIO):
+        img_bytes = io.BytesIO(img_bytes)
+    return prepare_image(Image.open(img_bytes), target_pixels)
+
+
+def prepare_image(img, target_pixels=DECODE_TARGET_PIXELS):
+    """Convert a PIL image to RGB, shrinking scans above target_pixels before full decode.
+
+    Returns (image, (sx, sy)) where the scale factors map decoded coordinates
+    back to the original image. target_pixels=0 keeps full resolution (tiling).
+    """
+    width, height = img.size
+    pixels = width * height
+    if DECODE_MAX_PIXELS and pixels > DECODE_MAX_PIXELS:
+        raise ValueError(f"image is {width}x{height} ({pixels} px), limit is {DECODE_MAX_PIXELS} px")
+
+    if target_pixels and pixels > target_pixels:
+        ratio = math.sqrt(target_pixels / pixels)
+        target = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+        if img.format == "JPEG":
+            # DCT-domain downscale: only decodes the coefficients needed for target
+            img.draft("RGB", target)
+        # reducing_gap does a cheap integer reduce() before the final resample
+        img = img.resize(target, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    scale = (width / img.size[0], height / img.size[1])
+    return img.convert("RGB"), scale
+
+
+def _map_coords(obj, fx, fy):
+    """Apply fx/fy to every bbox, image_bbox and polygon in a result, in place"""
+    if isinstance(obj, list):
+        for item in obj:
+            _map_coords(item, fx, fy)
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            if value is None:
+                continue
+            if key in ("bbox", "image_bbox"):
+                obj[key] = [fx(value[0]), fy(value[1]), fx(value[2]), fy(value[3])]
+            elif key == "polygon":
+                obj[key] = [[fx(x), fy(y)] for x, y in value]
+            elif isinstance(value, (list, dict)):
+                _map_coords(value, fx, fy)
+    return obj
+
+
+def page_signature(img):
+    """Return (ink_ratio, hash_bits) of a decoded page.
+
+    Both come from a copy shrunk to 512 px, which also averages away scanner
+    speckle. Ink is the share of pixels much darker than the paper (its 95th
+    percentile brightness). The hash is a mean hash on a 32-column grid whose
+    rows follow the aspect ratio.
+    """
+    width, height = img.size
+    ratio = min(1.0, 512 / max(width, height))
+    small = img.resize((max(1, round(width * ratio)), max(1, round(height * ratio))),
+                       Image.Resampling.BOX).convert("L")
+    pixels = np.asarray(small, dtype=np.int16)
+    ink = float(np.mean(pixels < np.percentile(pixels, 95) - 64))
+    grid = np.asarray(small.resize((32, max(1, round(32 * height / width))), Image.Resampling.BOX), dtype=np.float32)
+    return ink, grid < grid.mean()
+
+
+class PageIndex:
+    """Finds near-identical pages by perceptual hash.
+
+    Hashes match when their grids have the same shape and differ in at most
+    max_distance of their bits. Each hash is split into one band more than
+    the allowed differing bits, so a match shares at least one band exactly
+    and only pages sharing a band are compared.
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self._bands = {}
+        self._hashes = {}  # key -> (bits, bands)
+
+    def match(self, key, bits):
+        """Return the key of an earlier matching page, or index this one and return None"""
+        allowed = int(bits.size * self.max_distance)
+        bands = [(bits.shape, band, chunk.tobytes())
+                 for band, chunk in enumerate(np.array_split(bits.ravel(), min(bits.size, allowed + 1)))]
+        compared = set()
+        for band in bands:
+            for other in self._bands.get(band, ()):
+                if other not in compared:
+                    compared.add(other)
+                    if np.count_nonzero(self._hashes[other][0] != bits) <= allowed:
+                        return other
+        for band in bands:
+            self._bands.setdefault(band, []).append(key)
+        self._hashes[key] = (bits, bands)
+        return None
+
+    def __contains__(self, key):
+        return key in self._hashes
+
+    def remove(self, key):
+        _, bands = self._hashes.pop(key)
+        for band in bands:
+            self._bands[band].remove(key)
+            if not self._bands[band]:
+                del self._bands[band]
+
+
+def rescale_page_result(result, scale):
+    """Map bboxes/polygons of a page result from decoded to original coordinates"""
+    sx, sy = scale
+    if sx == 1 and sy == 1:
+        return result
+    return _map_coords(result, lambda x: x * sx, lambda y: y * sy)
+
+
+def format_prediction(pred):
+    """Convert a Surya OCR result into the JSON page result"""
+    text_lines = []
+    for line in pred.text_lines:
+        text_lines.append({
+            "text": line.text,
+            "confidence": line.confidence,
+            "bbox": line.bbox,
+            "polygon": line.polygon
+        })
+
+    return {
+        "text_lines": text_lines,
+        "page": getattr(pred, 'page', 0),
+        "image_bbox": getattr(pred, 'image_bbox', None)
+    }
+
+
+def format_detection(pred):
+    """Convert a Surya detection result (line boxes, no text) into a JSON page result"""
+    return {
+        "bboxes": [{
+            "bbox": box.bbox,
+            "polygon": box.polygon,
+            "confidence": getattr(box, 'confidence', None)
+        } for box in pred.bboxes],
+        "image_bbox": getattr(pred, 'image_bbox', None)
+    }
+
+
+def format_layout(pred):
+    """Convert a Surya layout result into a JSON page result; position is the reading order"""
+    return {
+        "layout": [{
+            "label": box.label,
+            "position": getattr(box, 'position', None),
+            "confidence": getattr(box, 'confidence', None),
+            "bbox": box.bbox,
+            "polygon": box.polygon
+        } for box in pred.bboxes],
+        "image_bbox": getattr(pred, 'image_bbox', None)
+    }
+
+
+def format_table(pred):
+    """Convert a Surya table recognition result into cells, rows and columns"""
+    return {
+        "cells": [{
+            "row_id": cell.row_id,
+            "col_id": cell.col_id,
+            "rowspan": getattr(cell, 'rowspan', 1),
+            "colspan": getattr(cell, 'colspan', 1),
+            "is_header": getattr(cell, 'is_header', False),
+            "bbox": cell.bbox,
+            "polygon": cell.polygon
+        } for cell in pred.cells],
+        "rows": [{"row_id": row.row_id, "is_header": getattr(row, 'is_header', False), "bbox": row.bbox}
+                 for row in pred.rows],
+        "cols": [{"col_id": col.col_id, "is_header": getattr(col, 'is_header', False), "bbox": col.bbox}
+                 for col in pred.cols],
+        "image_bbox": getattr(pred, 'image_bbox', None)
+    }
+
+
+def _pixels(images):
+    return [img.size[0] * img.size[1] for img in images]
+
+
+def detect_pages(images):
+    """Run text detection and return the raw Surya predictions"""
+    detection_predictor = get_model("detection")
+
+    def run(batch, batch_size):
+        return detection_predictor(batch, batch_size=min(batch_size, len(batch)))
+
+    return DETECTION_BATCHER.run(images, _pixels(images), run)
+
+
+def detect_lines(images, known=None):
+    """Return the line polygons of each image.
+
+    Images whose entry in known is not None keep those polygons; detection
+    only runs on the rest.
+    """
+    polygons = list(known) if known is not None else [None] * len(images)
+    missing = [i for i, page_polygons in enumerate(polygons) if page_polygons is None]
+    tiled = [i for i in missing if _needs_tiling(images[i])]
+    whole = [i for i in missing if i not in tiled]
+    if whole:
+        predictions = detect_pages([images[i] for i in whole])
+        for i, pred in zip(whole, predictions):
+            polygons[i] = [box.polygon for box in pred.bboxes]
+    for i in tiled:
+        polygons[i] = detect_tiled(images[i])
+    return polygons
+
+
+def _needs_tiling(img):
+    """Large pages of jobs with tiling on; OCRJob marks their images, as micro-batches mix jobs"""
+    if not img.info.get("tiling"):
+        return False
+    width, height = img.size
+    return TILE_SIZE > 0 and width * height > TILE_MIN_PIXELS and max(width, height) > TILE_SIZE
+
+
+def _tile_starts(length):
+    if length <= TILE_SIZE:
+        return [0]
+    step = max(1, TILE_SIZE - TILE_OVERLAP)
+    return list(range(0, length - TILE_SIZE, step)) + [length - TILE_SIZE]
+
+
+def tile_boxes(size):
+    """Overlapping (left, top, right, bottom) tiles covering an image of the given size"""
+    width, height = size
+    return [(x, y, min(x + TILE_SIZE, width), min(y + TILE_SIZE, height))
+            for y in _tile_starts(height) for x in _tile_starts(width)]
+
+
+def detect_tiled(img):
+    """Detect lines of a large page tile by tile; returns polygons in page coordinates.
+
+    Tiles are cropped per detection call, so at most DETECT_PIXEL_BUDGET
+    pixels of crops exist at a time, and all tiles of the page share batches.
+    """
+    detection_predictor = get_model("detection")
+    boxes = tile_boxes(img.size)
+    METRICS.inc("ocr_tiles_total", len(boxes))
+
+    def run(batch, batch_size):
+        crops = [img.crop(box) for box in batch]
+        return detection_predictor(crops, batch_size=min(batch_size, len(crops)))
+
+    predictions = DETECTION_BATCHER.run(boxes, [(r - l) * (b - t) for l, t, r, b in boxes], run)
+    lines = []
+    for tile, ((left, top, _, _), pred) in enumerate(zip(boxes, predictions)):
+        for box in pred.bboxes:
+            polygon = [[x + left, y + top] for x, y in box.polygon]
+            xs, ys = [x for x, _ in polygon], [y for _, y in polygon]
+            lines.append((tile, [min(xs), min(ys), max(xs), max(ys)], polygon))
+    log(f"✓ Tiled detection: {img.size} in {len(boxes)} tiles, {len(lines)} line pieces", "debug")
+    return merge_tile_lines(lines)
+
+
+def merge_tile_lines(lines):
+    """Merge line pieces detected by neighbouring tiles into single lines.
+
+    lines is a list of (tile, bbox, polygon) in page coordinates. Pieces from
+    different tiles are the same line when they overlap horizontally and share
+    at least half of the shorter piece's height: a line inside a seam is seen
+    whole by both tiles, a line crossing a seam is cut into pieces that overlap
+    in the seam. Merged lines become the polygon of the union bbox.
+    """
+    parent = list(range(len(lines)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Sweep by top edge: only pieces starting above the bottom of piece i can overlap it
+    order = sorted(range(len(lines)), key=lambda i: lines[i][1][1])
+    for pos, i in enumerate(order):
+        tile_i, (x0, y0, x1, y1), _ = lines[i]
+        for j in order[pos + 1:]:
+            tile_j, (u0, v0, u1, v1), _ = lines[j]
+            if v0 >= y1:
+                break
+            if tile_j == tile_i or min(x1, u1) <= max(x0, u0):
+                continue
+            shared = min(y1, v1) - max(y0, v0)
+            if shared >= 0.5 * min(y1 - y0, v1 - v0):
+                parent[find(j)] = find(i)
+
+    groups = {}
+    for i in order:
+        groups.setdefault(find(i), []).append(i)
+    merged = []
+    for members in groups.values():
+        if len(members) == 1:
+            merged.append(lines[members[0]][2])
+            continue
+        x0 = min(lines[i][1][0] for i in members)
+        y0 = min(lines[i][1][1] for i in members)
+        x1 = max(lines[i][1][2] for i in members)
+        y1 = max(lines[i][1][3] for i in members)
+        merged.append([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    return merged
+
+
+def layout_pages(images):
+    """Run layout analysis (blocks, labels and reading order)"""
+    layout_predictor = get_model("layout")
+
+    def run(batch, batch_size):
+        return layout_predictor(batch, batch_size=min(batch_size, len(batch)))
+
+    return LAYOUT_BATCHER.run(images, _pixels(images), run)
+
+
+def recognize_tables(images):
+    """Run table structure recognition on images that each contain one table"""
+    table_predictor = get_model("table")
+
+    def run(batch, batch_size):
+        return table_predictor(batch, batch_size=min(batch_size, len(batch)))
+
+    return TABLE_BATCHER.run(images, _pixels(images), run)
+
+
+def recognize_lines(images, polygons):
+    """Run recognition on known line polygons (detection is skipped).
+
+    With the line memo on, lines whose crop is already known reuse its text and
+    confidence, and each novel crop is recognized once per call; results keep
+    one line per polygon in order.
+    """
+    if LINE_MEMO is None:
+        return _recognize(images, polygons)
+
+    keys = [[line_crop_key(img, polygon) for polygon in page_polygons]
+            for img, page_polygons in zip(images, polygons)]
+    known = LINE_MEMO.get_many({key for page_keys in keys for key in page_keys if key is not None})
+    # First occurrence of each novel crop is sent; empty crops always are
+    pending, novel = set(), [[] for _ in images]
+    for page, page_keys in enumerate(keys):
+        for line, key in enumerate(page_keys):
+            if key is None or (key not in known and key not in pending):
+                novel[page].append(line)
+                if key is not None:
+                    pending.add(key)
+
+    pages = [page for page, lines in enumerate(novel) if lines]
+    recognized = [[None] * len(page_polygons) for page_polygons in polygons]
+    image_bboxes = [[0, 0, img.size[0], img.size[1]] for img in images]
+    if pages:
+        predictions = _recognize([images[page] for page in pages],
+                                 [[polygons[page][line] for line in novel[page]] for page in pages])
+        for page, pred in zip(pages, predictions):
+            image_bboxes[page] = getattr(pred, 'image_bbox', image_bboxes[page])
+            for line, text_line in zip(novel[page], pred.text_lines):
+                recognized[page][line] = text_line
+                key = keys[page][line]
+                if key is not None:
+                    known[key] = (text_line.text, text_line.confidence)
+                    LINE_MEMO.put(key, text_line.text, text_line.confidence)
+
+    sent = sum(len(lines) for lines in novel)
+    LINE_MEMO.record(sum(len(page_keys) for page_keys in keys) - sent, sent)
+    results = []
+    for page, page_polygons in enumerate(polygons):
+        text_lines = []
+        for line, polygon in enumerate(page_polygons):
+            text_line = recognized[page][line]
+            if text_line is None:
+                text, confidence = known[keys[page][line]]
+                xs = [x for x, _ in polygon]
+                ys = [y for _, y in polygon]
+                text_line = SimpleNamespace(text=text, confidence=confidence, polygon=polygon,
+                                            bbox=[min(xs), min(ys), max(xs), max(ys)])
+            text_lines.append(text_line)
+        results.append(SimpleNamespace(text_lines=text_lines, image_bbox=image_bboxes[page]))
+    return results
+
+
+def _recognize(images, polygons):
+    recognition_predictor = get_model("recognition")
+
+    def run(batch, batch_size):
+        batch_images = [img for img, _ in batch]
+        batch_polygons = [page_polygons for _, page_polygons in batch]
+        line_count = sum(len(page_polygons) for page_polygons in batch_polygons)
+        return recognition_predictor(batch_images, polygons=batch_polygons,
+                                     recognition_batch_size=max(1, min(batch_size, line_count)))
+
+    return RECOGNITION_BATCHER.run(list(zip(images, polygons)), [max(1, len(p)) for p in polygons], run)
+
+
+OUTPUT_FORMATS = ("full", "lean", "columnar")
+ENVELOPES = ("none", "gzip", "msgpack")
+
+
+def _int_box(bbox):
+    return [int(round(v)) for v in bbox] if bbox is not None else None
+
+
+def encode_page(result, output_format):
+    """Re-shape a full page result into the requested output format.
+
+    lean: text, confidence rounded to 3 places and integer bbox per line.
+    columnar: per-page parallel arrays text[], confidence[], bbox[].
+    Lines of named regions keep their "region" (a region[] array in columnar).
+    Results without text lines (detect, layout, table) are returned as is.
+    """
+    if output_format == "full" or "text_lines" not in result:
+        return result
+    page = {key: value for key, value in result.items() if key != "text_lines"}
+    page["image_bbox"] = _int_box(result.get("image_bbox"))
+    lines = result["text_lines"]
+    if output_format == "lean":
+        page["text_lines"] = []
+        for line in lines:
+            lean = {
+                "text": line["text"],
+                "confidence": round(line["confidence"], 3) if line["confidence"] is not None else None,
+                "bbox": _int_box(line["bbox"])
+            }
+            if "region" in line:
+                lean["region"] = line["region"]
+            page["text_lines"].append(lean)
+    else:
+        page["text"] = [line["text"] for line in lines]
+        page["confidence"] = [round(line["confidence"], 3) if line["confidence"] is not None else None
+                              for line in lines]
+        page["bbox"] = [_int_box(line["bbox"]) for line in lines]
+        if any("region" in line for line in lines):
+            page["region"] = [line.get("region") for line in lines]
+    return page
+
+
+def wrap_envelope(body, envelope):
+    """Pack a response body as gzip'd JSON or msgpack, base64 encoded"""
+    if envelope == "gzip":
+        raw = gzip.compress(json.dumps(body, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), compresslevel=6)
+        encoding = "gzip+json"
+    else:
+        import msgpack
+        raw = msgpack.packb(body, use_bin_type=True)
+        encoding = "msgpack"
+    return {"success": True, "encoding": encoding, "payload": base64.b64encode(raw).decode("ascii")}
+
+
+# Layout labels whose regions are cropped and sent to table recognition in "full"
+TABLE_LABELS = ("Table", "TableOfContents")
+
+
+def _tables_on_page(images, layouts):
+    """Recognize every table region found by layout, in page coordinates"""
+    crops, owners = [], []
+    for i, (img, layout) in enumerate(zip(images, layouts)):
+        for box in layout.bboxes:
+            if box.label in TABLE_LABELS:
+                x0, y0, x1, y1 = [int(round(v)) for v in box.bbox]
+                if x1 > x0 and y1 > y0:
+                    crops.append(img.crop((x0, y0, x1, y1)))
+                    owners.append((i, x0, y0))
+    tables = [[] for _ in images]
+    if crops:
+        for (i, x0, y0), pred in zip(owners, recognize_tables(crops)):
+            table = _map_coords(format_table(pred), lambda x, dx=x0: x + dx, lambda y, dy=y0: y + dy)
+            table["bbox"] = table.pop("image_bbox")
+            tables[i].append(table)
+    return tables
+
+
+def _full_first(images):
+    return list(zip(detect_lines(images), layout_pages(images)))
+
+
+def _full_second(images, first):
+    predictions = recognize_lines(images, [polygons for polygons, _ in first])
+    tables = _tables_on_page(images, [layout for _, layout in first])
+    return list(zip(predictions, tables))
+
+
+def _format_full(first, second):
+    _, layout = first
+    pred, tables = second
+    page = format_prediction(pred)
+    page["layout"] = format_layout(layout)["layout"]
+    page["tables"] = tables
+    return page
+
+
+class Operation:
+    """One job type: the models it needs and its two pipeline stages.
+
+    first(images) runs on the pipeline's detect thread, second(images, first)
+    on its recognize thread (None to skip), and fmt(first, second) turns one
+    page's outputs into its JSON result. Operations with regions=True get
+    the client-supplied polygons (or None) per image as first's second
+    argument. empty is the result of a page with nothing on it.
+    """
+
+    def __init__(self, models, first, second, fmt, empty, regions=False):
+        self.models = models
+        self.empty = empty
+        self.first = first
+        self.second = second
+        self.fmt = fmt
+        self.regions = regions
+
+    def predict(self, images, regions=None):
+        """Run both stages on PIL images and return formatted page results"""
+        first = self.first(images, regions) if self.regions else self.first(images)
+        second = self.second(images, first) if self.second else [None] * len(images)
+        return [self.fmt(f, s) for f, s in zip(first, second)]
+
+
+OPERATIONS = {
+    "ocr": Operation(("detection", "recognition"), detect_lines, recognize_lines,
+                     lambda polygons, pred: format_prediction(pred), {"text_lines": [], "page": 0}, regions=True),
+    "detect": Operation(("detection",), detect_pages, None, lambda pred, _: format_detection(pred), {"bboxes": []}),
+    "layout": Operation(("layout",), layout_pages, None, lambda pred, _: format_layout(pred), {"layout": []}),
+    "table": Operation(("table",), recognize_tables, None, lambda pred, _: format_table(pred),
+                       {"cells": [], "rows": [], "cols": []}),
+    "full": Operation(("detection", "recognition", "layout", "table"), _full_first, _full_second, _format_full,
+                      {"text_lines": [], "page": 0, "layout": [], "tables": []}),
+}
+
+
+def predict_pages(images, operation="ocr", regions=None):
+    """Run an operation on PIL images and return formatted page results"""
+    return OPERATIONS[operation].predict(images, regions)
+
+
+class JobInputError(ValueError):
+    """Invalid job input, reported back as an unsuccessful response"""
+
+
+def _chunk_size(job_input, key, default):
+    """Read a positive integer chunk size from the job input"""
+    value = job_input.get(key, default)
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise JobInputError(f"{key} must be an integer, got {value!r}")
+    if size < 1:
+        raise JobInputError(f"{key} must be an integer >= 1, got {value!r}")
+    return size
+
+
+def _as_polygon(shape):
+    """Accept [x0, y0, x1, y1] or [[x, y], ...] and return a polygon"""
+    if len(shape) == 4 and all(isinstance(v, (int, float)) for v in shape):
+        x0, y0, x1, y1 = map(float, shape)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"empty box {shape!r}")
+        return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+    if len(shape) >= 3 and all(len(point) == 2 for point in shape):
+        return [[float(x), float(y)] for x, y in shape]
+    raise ValueError(f"expected [x0, y0, x1, y1] or a list of [x, y] points, got {shape!r}")
+
+
+def parse_regions(source):
+    """Return (names, polygons) of the text regions an image entry supplies, or None.
+
+    Dict entries may carry "bboxes" ([x0, y0, x1, y1] each), "polygons"
+    ([[x, y], ...] each) or named "regions" ({"name": bbox or polygon}), in
+    original image coordinates. names is None unless regions are named.
+    """
+    if not isinstance(source, dict):
+        return None
+    given = [key for key in ("bboxes", "polygons", "regions") if key in source]
+    if not given:
+        return None
+    if len(given) > 1:
+        raise ValueError("use only one of 'bboxes', 'polygons' or 'regions'")
+    if given[0] == "regions":
+        if not isinstance(source["regions"], dict):
+            raise ValueError("'regions' must map names to boxes or polygons")
+        names, shapes = list(source["regions"]), list(source["regions"].values())
+    else:
+        names, shapes = None, source[given[0]]
+        if not isinstance(shapes, list):
+            raise ValueError(f"'{given[0]}' must be a list")
+    return names, [_as_polygon(shape) for shape in shapes]
+
+
+class OCRJob:
+    """Input images of one job, decoded on demand and checked against the cache"""
+
+    def __init__(self, job_input, streaming=False):
+        images = job_input.get("images", [])
+
+        # Note: Surya auto-detects languages - no language parameter needed
+        # The 'languages' input is accepted for API compatibility but not used
+
+        if not images:
+            raise JobInputError("No images provided")
+
+        # Handle single image string or reference
+        if isinstance(images, (str, dict)):
+            images = [images]
+
+        self.output_format = job_input.get("output_format", "full")
+        if self.output_format not in OUTPUT_FORMATS:
+            raise JobInputError(f"output_format must be one of {', '.join(OUTPUT_FORMATS)}")
+        self.envelope = job_input.get("envelope", "none")
+        if self.envelope not in ENVELOPES:
+            raise JobInputError(f"envelope must be one of {', '.join(ENVELOPES)}")
+        if self.envelope == "msgpack":
+            try:
+                import msgpack  # noqa: F401
+            except ImportError:
+                raise JobInputError("msgpack envelope requested but msgpack is not installed")
+
+        self.operation = job_input.get("operation", "ocr")
+        if self.operation not in OPERATIONS:
+            raise JobInputError(f"operation must be one of {', '.join(OPERATIONS)}")
+
+        # Tiling keeps large pages at full resolution; only line detection is tiled
+        self.tiling = bool(job_input.get("tiling", TILING))
+        if self.operation not in ("ocr", "full"):
+            if job_input.get("tiling"):
+                raise JobInputError("tiling is only supported with operations 'ocr' and 'full'")
+            self.tiling = False
+
+        # Client-supplied line regions: recognition runs on them and detection is skipped
+        self.regions = []
+        for idx, source in enumerate(images):
+            try:
+                self.regions.append(parse_regions(source))
+            except (TypeError, ValueError) as e:
+                raise JobInputError(f"Image {idx+1} regions invalid: {e}")
+        if self.operation != "ocr" and any(self.regions):
+            raise JobInputError("bboxes, polygons and regions are only supported with operation 'ocr'")
+        self.models = OPERATIONS[self.operation].models
+        if self.operation == "ocr" and all(regions is not None for regions in self.regions):
+            self.models = ("recognition",)
+        self.polygons = [None] * len(images)  # supplied regions in decoded image coordinates
+
+        # Pre-filter: blank pages are answered directly, duplicates copy their original
+        self.skip_blank = BLANK_INK_RATIO > 0 and bool(job_input.get("skip_blank", SKIP_BLANK_PAGES))
+        self.page_index = PageIndex(DUPLICATE_MAX_DISTANCE) if job_input.get("dedupe", DEDUPE_PAGES) else None
+        self.duplicate_of = [None] * len(images)
+        self.sizes = [None] * len(images)  # original image size, to map copied coordinates
+        # Streaming jobs only hold finished originals that still have duplicates to copy
+        self.streaming = streaming
+        self._finished = {}
+        self._pending_copies = {}  # original index -> duplicates not copied yet
+        self._originals_by_key = {}  # cache key -> first page with it, while it can be copied
+        self._exact_copies = set()  # pages identical to an earlier one: copied without "duplicate_of"
+        self._dedupe_lock = threading.Lock()
+
+        self.sources = images
+        self.use_cache = job_input.get("use_cache", True)
+        self.keys = [None] * len(images)
+        self.hits = 0
+        self.misses = 0
+        # Summed across decode threads; merged into the job timings
+        self.stage_times = {"b64_decode": 0.0, "fetch": 0.0, "image_decode": 0.0}
+        self.counts = {"images": len(images), "pixels": 0, "lines": 0, "blank": 0, "duplicates": 0}
+        self._stats_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sources)
+
+    def load(self, start=0, end=None):
+        """Decode images[start:end] on the thread pool.
+
+        Returns (hits, misses): hits is a list of (index, result) for cached
+        and blank pages and misses is (indices, images, scales) for the images
+        that need OCR. Duplicates are in neither; see copy_duplicates. Pages
+        with the same cache key as an earlier page of the job are copied from
+        it and count as cache hits; blank pages count as neither hit nor miss.
+        """
+        end = len(self.sources) if end is None else end
+        loaded = DECODE_POOL.map(self._load_image, range(start, end), self.sources[start:end])
+        hits, indices, images, scales = [], [], [], []
+        for idx, (key, cached, img, scale, signature) in zip(range(start, end), loaded):
+            self.keys[idx] = key
+            if cached is not None:
+                self.hits += 1
+                hits.append((idx, cached))
+                continue
+            if signature is not None and self.skip_blank and signature[0] < BLANK_INK_RATIO:
+                self.counts["blank"] += 1
+                log(f"✓ Image {idx+1} is blank (ink {signature[0]:.6f})", "debug")
+                hits.append((idx, self._blank_result(idx)))
+                continue
+            if key is not None and self._copy_exact(idx, key):
+                self.hits += 1
+                log(f"✓ Image {idx+1} is identical to image {self.duplicate_of[idx]+1}", "debug")
+                continue
+            self.misses += 1
+            if signature is not None:
+                _, bits = signature
+                if self.page_index is not None:
+                    with self._dedupe_lock:
+                        original = self.page_index.match(idx, bits)
+                        if original is not None:
+                            self._pending_copies[original] = self._pending_copies.get(original, 0) + 1
+                    self.duplicate_of[idx] = original
+                    if original is not None:
+                        self.counts["duplicates"] += 1
+                        log(f"✓ Image {idx+1} duplicates image {self.duplicate_of[idx]+1}", "debug")
+                        continue
+            indices.append(idx)
+            images.append(img)
+            scales.append(scale)
+        return hits, (indices, images, scales)
+
+    def _copy_exact(self, idx, key):
+        """Mark idx as a copy of the job's earlier page with the same cache key; False if it is the first"""
+        with self._dedupe_lock:
+            original = self._originals_by_key.setdefault(key, idx)
+            if original == idx:
+                return False
+            if self.duplicate_of[original] is not None:
+                # The earlier page is itself copied from a look-alike: copy that one instead,
+                # unless a streaming job has already dropped it
+                original = self.duplicate_of[original]
+                if original not in self.page_index:
+                    return False
+            else:
+                self._exact_copies.add(idx)
+            self._pending_copies[original] = self._pending_copies.get(original, 0) + 1
+        self.duplicate_of[idx] = original
+        return True
+
+    def _blank_result(self, idx):
+        width, height = self.sizes[idx]
+        return {**copy.deepcopy(OPERATIONS[self.operation].empty),
+                "image_bbox": [0, 0, width, height], "blank": True}
+
+    def copy_duplicates(self, indices, results, start=0, end=None):
+        """Return (indices, results) of the duplicate pages in images[start:end].
+
+        indices/results are pages finished so far. Originals always come
+        before their duplicates, so they are finished by the time the range
+        holding a duplicate is. Copies of look-alikes get "duplicate_of"
+        (original's index) and coordinates scaled to the duplicate's image
+        size; copies of identical images are returned as is.
+
+        When streaming, an original is only kept while it has duplicates still
+        to copy. Once dropped it leaves the page index too, so a later
+        look-alike is processed normally rather than copied.
+        """
+        if self.page_index is None and not self.use_cache:
+            return [], []
+        end = len(self.sources) if end is None else min(end, len(self.sources))
+        dup_indices = [idx for idx in range(start, end) if self.duplicate_of[idx] is not None]
+        with self._dedupe_lock:
+            for idx, result in zip(indices, results):
+                if not self.streaming or self._pending_copies.get(idx):
+                    self._finished[idx] = result
+                else:
+                    self._forget_original(idx)
+            originals = [self._take_original(self.duplicate_of[idx]) for idx in dup_indices]
+        dup_results = []
+        for idx, original, source in zip(dup_indices, (self.duplicate_of[i] for i in dup_indices), originals):
+            result = copy.deepcopy(source)
+            (ow, oh), (width, height) = self.sizes[original], self.sizes[idx]
+            if (ow, oh) != (width, height):
+                _map_coords(result, lambda x: x * width / ow, lambda y: y * height / oh)
+            if idx not in self._exact_copies:
+                result["duplicate_of"] = original
+            dup_results.append(result)
+        return dup_indices, dup_results
+
+    def _take_original(self, original):
+        """Finished result of an original for one copy; drops it after its last copy when streaming"""
+        result = self._finished[original]
+        self._pending_copies[original] -= 1
+        if self.streaming and not self._pending_copies[original]:
+            del self._pending_copies[original]
+            del self._finished[original]
+            self._forget_original(original)
+        return result
+
+    def _forget_original(self, idx):
+        """Stop matching later pages against a page whose result is no longer kept"""
+        if self.page_index is not None and idx in self.page_index:
+            self.page_index.remove(idx)
+        if self._originals_by_key.get(self.keys[idx]) == idx:
+            del self._originals_by_key[self.keys[idx]]
+
+    def _load_image(self, idx, source):
+        """Return (cache_key, cached_result, image, scale, signature) for one input image"""
+        try:
+            upload_scale = float(source.get("scale", 1)) if isinstance(source, dict) else 1.0
+            key = None
+            if isinstance(source, dict) and "image" in source:
+                # PIL image handed over in-process (local_runner.py): nothing to read or cache
+                started = time.perf_counter()
+                img, scale = prepare_image(source["image"], 0 if self.tiling else DECODE_TARGET_PIXELS)
+                self._add_time("image_decode", time.perf_counter() - started)
+                return self._decoded(idx, key, img, scale, upload_scale)
+
+            started = time.perf_counter()
+            img_bytes = read_image_source(source)
+            is_reference = isinstance(source, dict) and ("url" in source or "path" in source)
+            self._add_time("fetch" if is_reference else "b64_decode", time.perf_counter() - started)
+            if self.use_cache:
+                extra = f"op={self.operation};scale={upload_scale}"
+                if self.tiling:
+                    extra += ";tiled"
+                if self.regions[idx] is not None:
+                    extra += f";regions={json.dumps(self.regions[idx])}"
+                key = cache_key(img_bytes, extra)
+                cached = RESULT_CACHE.get(key)
+                if cached is not None:
+                    log(f"✓ Image {idx+1} served from cache", "debug")
+                    return key, cached, None, (1, 1), None
+
+            started = time.perf_counter()
+            img, scale = decode_image(img_bytes, 0 if self.tiling else DECODE_TARGET_PIXELS)
+            self._add_time("image_decode", time.perf_counter() - started)
+            return self._decoded(idx, key, img, scale, upload_scale)
+        except Exception as e:
+            log(f"✗ Image {idx+1} decode failed: {e}", "warning")
+            raise JobInputError(f"Image {idx+1} decode failed: {str(e)}")
+
+    def _decoded(self, idx, key, img, scale, upload_scale):
+        """Record a decoded image's size and regions; returns _load_image's tuple"""
+        with self._stats_lock:
+            self.counts["pixels"] += img.size[0] * img.size[1]
+        scale = (scale[0] * upload_scale, scale[1] * upload_scale)
+        self.sizes[idx] = (img.size[0] * scale[0], img.size[1] * scale[1])
+        signature = None
+        if self.regions[idx] is None and (self.skip_blank or self.page_index is not None):
+            signature = page_signature(img)
+        if self.tiling:
+            img.info["tiling"] = True
+        if self.regions[idx] is not None:
+            sx, sy = scale
+            width, height = img.size
+            self.polygons[idx] = [[[min(max(x / sx, 0), width), min(max(y / sy, 0), height)] for x, y in polygon]
+                                  for polygon in self.regions[idx][1]]
+        log(f"✓ Image {idx+1} decoded: {img.size} (scale {scale[0]:.2f})", "debug")
+        return key, None, img, scale, signature
+
+    def _add_time(self, stage, seconds):
+        with self._stats_lock:
+            self.stage_times[stage] += seconds
+
+    def complete(self, indices, scales, page_results):
+        """Map fresh page results to original coordinates and cache them"""
+        final = []
+        for idx, scale, result in zip(indices, scales, page_results):
+            self.counts["lines"] += len(result.get("text_lines", ()))
+            names = self.regions[idx][0] if self.regions[idx] is not None else None
+            if names is not None and len(names) == len(result["text_lines"]):
+                for name, line in zip(names, result["text_lines"]):
+                    line["region"] = name
+            result = rescale_page_result(result, scale)
+            if self.keys[idx] is not None:
+                RESULT_CACHE.put(self.keys[idx], result)
+            final.append(result)
+        return final
+
+    def response(self, results, timings=None):
+        cache_stats = {"hits": self.hits, "misses": self.misses}
+        results = [encode_page(result, self.output_format) for result in results]
+        response = {"success": True, "results": results, "cache": cache_stats}
+        if self.output_format != "full":
+            response["format"] = self.output_format
+        if timings is not None:
+            response["timings"] = {name: round(value, 4) for name, value in timings.items()}
+            response["counts"] = dict(self.counts)
+        if self.envelope != "none":
+            return wrap_envelope(response, self.envelope)
+        return response
+
+
+_STAGE_DONE = object()
+
+
+def iter_pipeline(ocr_job, chunk_size=None, timings=None):
+    """Run a job through overlapped decode → detect → recognize → format stages.
+
+    Decode, detection and recognition each run on their own thread and hand
+    chunks of chunk_size images to the next stage through bounded queues, so
+    chunk N+1 is decoded and detected while chunk N is in recognition and
+    chunk N-1 is being formatted on the calling thread. Yields
+    (indices, page_results) per chunk. Per-stage busy time and the wall time
+    are written into timings, if given. For operations other than "ocr" the
+    detect and recognize threads run the operation's first and second stage.
+    """
+    chunk_size = max(1, chunk_size or PIPELINE_CHUNK_SIZE)
+    operation = OPERATIONS[ocr_job.operation]
+    busy = {"decode": 0.0, "detect": 0.0, "recognize": 0.0, "format": 0.0}
+    stop = threading.Event()
+    wall_start = time.perf_counter()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def drain(q):
+        while not stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _STAGE_DONE:
+                return
+            yield item
+
+    def run_stage(name, source, q_out, fn):
+        try:
+            for item in source:
+                if not isinstance(item, Exception):
+                    started = time.perf_counter()
+                    try:
+                        item = fn(item)
+                    except Exception as e:
+                        item = e
+                    busy[name] += time.perf_counter() - started
+                if not put(q_out, item):
+                    return
+        except Exception as e:
+            put(q_out, e)
+        put(q_out, _STAGE_DONE)
+
+    def decode(start):
+        hits, (indices, images, scales) = ocr_job.load(start, start + chunk_size)
+        return {"hits": hits, "indices": indices, "images": images, "scales": scales,
+                "range": (start, start + chunk_size)}
+
+    def detect(chunk):
+        if chunk["images"]:
+            if operation.regions:
+                chunk["first"] = operation.first(chunk["images"], [ocr_job.polygons[idx] for idx in chunk["indices"]])
+            else:
+                chunk["first"] = operation.first(chunk["images"])
+        return chunk
+
+    def recognize(chunk):
+        if chunk["images"]:
+            chunk["second"] = (operation.second(chunk["images"], chunk["first"]) if operation.second
+                               else [None] * len(chunk["images"]))
+        chunk["images"] = None
+        return chunk
+
+    q_detect = queue.Queue(PIPELINE_QUEUE_DEPTH)
+    q_recognize = queue.Queue(PIPELINE_QUEUE_DEPTH)
+    q_format = queue.Queue(PIPELINE_QUEUE_DEPTH)
+    threads = [
+        threading.Thread(target=run_stage, name="pipeline-decode", daemon=True,
+                         args=("decode", range(0, len(ocr_job), chunk_size), q_detect, decode)),
+        threading.Thread(target=run_stage, name="pipeline-detect", daemon=True,
+                         args=("detect", drain(q_detect), q_recognize, detect)),
+        threading.Thread(target=run_stage, name="pipeline-recognize", daemon=True,
+                         args=("recognize", drain(q_recognize), q_format, recognize)),
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for chunk in drain(q_format):
+            if isinstance(chunk, Exception):
+                raise chunk
+            started = time.perf_counter()
+            page_results = [operation.fmt(first, second)
+                            for first, second in zip(chunk.get("first", []), chunk.get("second", []))]
+            final = ocr_job.complete(chunk["indices"], chunk["scales"], page_results)
+            indices = [idx for idx, _ in chunk["hits"]] + chunk["indices"]
+            results = [result for _, result in chunk["hits"]] + final
+            dup_indices, dup_results = ocr_job.copy_duplicates(indices, results, *chunk["range"])
+            indices, results = indices + dup_indices, results + dup_results
+            busy["format"] += time.perf_counter() - started
+            yield indices, results
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if timings is not None:
+            timings.update(busy)
+            timings["wall"] = time.perf_counter() - wall_start
+
+
+def _error_response(e):
+    if isinstance(e, JobInputError):
+        return {"success": False, "error": str(e)}
+    import traceback
+    error_trace = traceback.format_exc()
+    log(f"✗ Handler error: {e}\n{error_trace}", "error")
+    return {"success": False, "error": str(e), "traceback": error_trace}
+
 
 def handler(job):
-    print(f"Received job: {job.get('id', 'unknown')}", flush=True)
+    log(f"Received job: {job.get('id', 'unknown')}")
+    job_start = time.perf_counter()
     
     try:
-        # Initialize models on first request
-        recognition_predictor, detection_predictor = initialize_models()
+        job_input = job.get("input", {})
+        ocr_job = OCRJob(job_input)
+        timings = {}
+
+        # Load the operation's models on first use
+        initialize_models(ocr_job.operation, ocr_job.models)
 
-        # Get input
+        # Run OCR on cache misses only - Surya automatically detects languages
+        # Batch sizes controlled by RECOGNITION_BATCH_SIZE env var in Dockerfile
+        log(f"Processing {len(ocr_job)} image(s), operation={ocr_job.operation}")
+        results = [None] * len(ocr_job)
+        chunk_size = _chunk_size(job_input, "pipeline_chunk_size", PIPELINE_CHUNK_SIZE)
+        for indices, page_results in iter_pipeline(ocr_job, chunk_size, timings):
+            for idx, result in zip(indices, page_results):
+                results[idx] = result
+        timings.update(ocr_job.stage_times)
+        log(f"✓ OCR completed ({ocr_job.hits} cached, {ocr_job.counts['lines']} lines, "
+            f"{timings['wall']:.2f}s)")
+
+        response = ocr_job.response(results, timings if job_input.get("return_timings") else None)
+        METRICS.record_job("success", ocr_job, timings, time.perf_counter() - job_start)
+        return response
+
+    except Exception as e:
+        METRICS.record_job("error", elapsed=time.perf_counter() - job_start)
+        return _error_response(e)
+
+
+def stream_handler(job):
+    """Generator handler: yields one item per page as each sub-batch completes.
+
+    Pages flow through the stage pipeline in chunks of STREAM_CHUNK_SIZE and
+    are dropped once yielded, so response memory is bounded by the chunks in
+    flight regardless of job size.
+    """
+    log(f"Received streaming job: {job.get('id', 'unknown')}")
+    job_start = time.perf_counter()
+
+    try:
         job_input = job.get("input", {})
-        images_b64 = job_input.get("images", [])
-        
-        # Note: Surya auto-detects languages - no language parameter needed
-        # The 'languages' input is accepted for API compatibility but not used
+        ocr_job = OCRJob(job_input, streaming=True)
+        if ocr_job.envelope != "none":
+            raise JobInputError("envelope is not supported in stream mode; pages are streamed one item each")
+        chunk_size = _chunk_size(job_input, "stream_chunk_size", STREAM_CHUNK_SIZE)
+        initialize_models(ocr_job.operation, ocr_job.models)
+        timings = {}
+
+        for indices, page_results in iter_pipeline(ocr_job, chunk_size, timings):
+            for idx, result in sorted(zip(indices, page_results), key=lambda item: item[0]):
+                yield {"index": idx, **encode_page(result, ocr_job.output_format)}
+            log(f"✓ Streamed {len(indices)} page(s) of {len(ocr_job)}", "debug")
+        timings.update(ocr_job.stage_times)
+        METRICS.record_job("success", ocr_job, timings, time.perf_counter() - job_start)
+
+    except Exception as e:
+        METRICS.record_job("error", elapsed=time.perf_counter() - job_start)
+        yield _error_response(e)
+
+
+class MicroBatcher:
+    """Coalesces images from concurrent jobs into shared predictor calls.
+
+    A flush happens when max_batch images are queued or when the oldest queued
+    image has waited max_wait_ms, whichever comes first. Predictor calls run
+    one at a time on an executor thread so the event loop keeps accepting jobs.
+    """
+
+    def __init__(self, predict_fn=predict_pages, max_batch=MICROBATCH_MAX_BATCH,
+                 max_wait_ms=MICROBATCH_MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []  # (image, future, enqueued_at)
+        self._wakeup = None
+        self._worker = None
+        self.flushes = 0
+
+    async def submit(self, images):
+        """Queue images (items passed to predict_fn) and wait for their page results"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+        now = loop.time()
+        futures = [loop.create_future() for _ in images]
+        self._pending.extend((img, fut, now) for img, fut in zip(images, futures))
+        self._wakeup.set()
+        return await asyncio.gather(*futures)
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        while not self._pending:
+            self._wakeup.clear()
+            await self._wakeup.wait()
 
-        if not images_b64:
-            return {"success": False, "error": "No images provided"}
+        deadline = self._pending[0][2] + self.max_wait
+        while len(self._pending) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
 
-        # Handle single image string
-        if isinstance(images_b64, str):
-            images_b64 = [images_b64]
+        batch = self._pending[:self.max_batch]
+        self._pending = self._pending[self.max_batch:]
+        return batch
 
-        # Decode images
-        images = []
-        for idx, img_b64 in enumerate(images_b64):
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            images = [img for img, _, _ in batch]
+            self.flushes += 1
+            log(f"Micro-batch flush #{self.flushes}: {len(images)} image(s), {len(self._pending)} still queued", "debug")
             try:
-                # Remove data URL prefix if present
-                if img_b64.startswith("data:"):
-                    img_b64 = img_b64.split(",")[1]
-
-                # Decode and convert
-                img_bytes = base64.b64decode(img_b64)
-                img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-                images.append(img)
-                print(f"✓ Image {idx+1} decoded: {img.size}", flush=True)
+                page_results = await loop.run_in_executor(None, self.predict_fn, images)
             except Exception as e:
-                print(f"✗ Image {idx+1} decode failed: {e}", flush=True)
-                return {"success": False, "error": f"Image {idx+1} decode failed: {str(e)}"}
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut, _), result in zip(batch, page_results):
+                if not fut.done():
+                    fut.set_result(result)
 
-        # Run OCR - Surya automatically detects languages
-        # Batch sizes controlled by RECOGNITION_BATCH_SIZE env var in Dockerfile
-        print(f"Processing {len(images)} image(s) with auto language detection", flush=True)
-        predictions = recognition_predictor(
-            images,
-            det_predictor=detection_predictor
-        )
-        print(f"✓ OCR completed", flush=True)
 
-        # Format results
-        results = []
-        for pred in predictions:
-            text_lines = []
-            for line in pred.text_lines:
-                text_lines.append({
-                    "text": line.text,
-                    "confidence": line.confidence,
-                    "bbox": line.bbox,
-                    "polygon": line.polygon
-                })
-            
-            results.append({
-                "text_lines": text_lines,
-                "page": getattr(pred, 'page', 0),
-                "image_bbox": getattr(pred, 'image_bbox', None)
-            })
-
-        return {"success": True, "results": results}
+# One queue per operation: only jobs of the same operation share predictor calls
+# Items are (image, supplied polygons or None) pairs
+MICRO_BATCHERS = {name: MicroBatcher(lambda items, name=name: predict_pages([img for img, _ in items], name,
+                                                                            [polygons for _, polygons in items]))
+                  for name in OPERATIONS}
+
+
+async def batch_handler(job):
+    """Async handler that shares predictor calls with other in-flight jobs"""
+    log(f"Received job: {job.get('id', 'unknown')}")
+    loop = asyncio.get_running_loop()
+    job_start = time.perf_counter()
+
+    try:
+        job_input = job.get("input", {})
+        ocr_job = OCRJob(job_input)
+        await loop.run_in_executor(None, initialize_models, ocr_job.operation, ocr_job.models)
+        hits, (indices, images, scales) = await loop.run_in_executor(None, ocr_job.load)
+        timings = {"decode": time.perf_counter() - job_start}
+
+        results = [None] * len(ocr_job)
+        for idx, result in hits:
+            results[idx] = result
+        if images:
+            started = time.perf_counter()
+            items = list(zip(images, [ocr_job.polygons[idx] for idx in indices]))
+            page_results = await MICRO_BATCHERS[ocr_job.operation].submit(items)
+            # Includes time spent waiting for the shared micro-batch to fill
+            timings["inference"] = time.perf_counter() - started
+            for idx, result in zip(indices, ocr_job.complete(indices, scales, page_results)):
+                results[idx] = result
+        for idx, result in zip(*ocr_job.copy_duplicates(range(len(results)), results)):
+            results[idx] = result
+        timings.update(ocr_job.stage_times)
+        timings["wall"] = time.perf_counter() - job_start
+
+        response = ocr_job.response(results, timings if job_input.get("return_timings") else None)
+        METRICS.record_job("success", ocr_job, timings, timings["wall"])
+        return response
 
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"✗ Handler error: {e}\n{error_trace}", flush=True)
-        return {"success": False, "error": str(e), "traceback": error_trace}
+        METRICS.record_job("error", elapsed=time.perf_counter() - job_start)
+        return _error_response(e)
+
+
+def preload_models(operations):
+    """Load the models of the given operations concurrently.
+
+    Each model loads on its own thread; recognition pulls in foundation
+    itself, so the foundation → recognition chain overlaps with detection
+    (and layout/table, if preloaded).
+    """
+    names = []
+    for operation in operations:
+        names.extend(name for name in OPERATIONS[operation].models if name not in names)
+    if not names:
+        return
+    with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="model-load") as pool:
+        for future in [pool.submit(get_model, name) for name in names]:
+            future.result()
+
+
+def _warmup_page():
+    """Synthetic page with a few lines of text"""
+    from PIL import ImageDraw
+    img = Image.new("RGB", (1280, 960), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(12):
+        draw.text((64, 64 + i * 64), f"Warmup line {i}: The quick brown fox jumps over 0123456789", fill="black")
+    return img
+
+
+def boot(operations=None, warmup=None):
+    """Load models and run a warmup page per operation before accepting jobs.
+
+    Returns the readiness breakdown (seconds): import time, per-model load
+    time, load wall time, per-operation warmup time and total.
+    """
+    operations = PRELOAD_OPERATIONS if operations is None else operations
+    for operation in [op for op in operations if op not in OPERATIONS]:
+        log(f"✗ Unknown operation in PRELOAD_OPERATIONS: {operation}", "warning")
+    operations = [op for op in operations if op in OPERATIONS]
+    warmup = WARMUP if warmup is None else warmup
+    readiness = {"imports": time.perf_counter() - _BOOT_START}
+
+    started = time.perf_counter()
+    try:
+        preload_models(operations)
+    except Exception as e:
+        # Jobs retry the load lazily and report the error to the caller
+        log(f"✗ Model preload failed: {e}", "error")
+        operations = []
+    readiness["models"] = dict(MODEL_LOAD_TIMINGS)
+    readiness["load_wall"] = time.perf_counter() - started
+
+    readiness["warmup"] = {}
+    if warmup and operations:
+        page = _warmup_page()
+        for operation in operations:
+            started = time.perf_counter()
+            try:
+                predict_pages([page], operation)
+            except Exception as e:
+                log(f"✗ Warmup of {operation} failed: {e}", "warning")
+            readiness["warmup"][operation] = time.perf_counter() - started
+
+    readiness["total"] = time.perf_counter() - _BOOT_START
+    for phase in ("imports", "load_wall", "total"):
+        METRICS.set("ocr_ready_seconds", readiness[phase], phase=phase)
+    METRICS.set("ocr_ready_seconds", sum(readiness["warmup"].values()), phase="warmup")
+    METRICS.export()
+
+    models = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in readiness["models"].items())
+    warmups = ", ".join(f"{op}={seconds:.2f}s" for op, seconds in readiness["warmup"].items())
+    print(f"✓ Worker ready in {readiness['total']:.2f}s (imports {readiness['imports']:.2f}s, "
+          f"models {readiness['load_wall']:.2f}s wall [{models or 'none'}], warmup [{warmups or 'none'}])",
+          flush=True)
+    print(json.dumps({"readiness": readiness}, separators=(",", ":")), flush=True)
+    return readiness
+
+
+def concurrency_modifier(current_concurrency):
+    """Let RunPod hand this worker up to MAX_CONCURRENCY jobs at once"""
+    return MAX_CONCURRENCY
+
+
+if __name__ == "__main__":
+    import runpod
+
+    # Load and warm up before the worker reports ready, not on the first job
+    boot()
 
-print("Starting RunPod serverless handler...", flush=True)
-runpod.serverless.start({"handler": handler})
\ No newline at end of file
+    print(f"Starting RunPod serverless handler (mode={HANDLER_MODE})...", flush=True)
+    if HANDLER_MODE == "batch":
+        runpod.serverless.start({
+            "handler": batch_handler,
+            "concurrency_modifier": concurrency_modifier
+        })
+    elif HANDLER_MODE == "stream":
+        runpod.serverless.start({
+            "handler": stream_handler,
+            "return_aggregate_stream": True
+        })
+    else:
+        runpod.serverless.start({"handler": handler})
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Run OCR jobs in-process on your own GPU box, without RunPod
+Jobs go straight to the worker's batch handler: no queue, no HTTP, and files
+are handed over as PIL images instead of base64, with pages of concurrent jobs
+sharing predictor calls.
+
+    python local_runner.py jobs.jsonl --output results.jsonl
+    python local_runner.py scans/ --pages-per-job 8 --output results.jsonl
+    python local_runner.py scans/ --stub          # CPU smoke test with stub predictors
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+FLUSH_EVERY = 64
+
+
+def iter_job_lines(path):
+    """Yield jobs from a JSONL file of RunPod-style {"id", "input"} objects or bare inputs"""
+    with open(path, encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            if "input" not in job:
+                job = {"input": job}
+            job.setdefault("id", f"line-{line_num}")
+            yield job
+
+
+def iter_file_jobs(inputs, job_input, pages_per_job, dpi):
+    """Yield one job per pages_per_job pages of the given files, with pages as PIL images"""
+    import batch_ocr
+
+    for path in batch_ocr.expand_inputs(inputs):
+        _, pages = batch_ocr.extract_images(path, dpi=dpi)
+        group = []
+        for page in pages:
+            group.append(page)
+            if len(group) == pages_per_job:
+                yield _file_job(path, group, job_input)
+                group = []
+        if group:
+            yield _file_job(path, group, job_input)
+
+
+def _file_job(path, group, job_input):
+    page_nums = [page_num for page_num, _ in group]
+    return {"id": f"{path}#{page_nums[0]}" if len(group) == 1 else f"{path}#{page_nums[0]}-{page_nums[-1]}",
+            "file": str(path), "pages": page_nums,
+            "input": {**job_input, "images": [{"image": image} for _, image in group]}}
+
+
+async def run_jobs(jobs, handler, on_result, max_concurrency):
+    """Run jobs through the async handler with up to max_concurrency in flight.
+
+    jobs is only advanced when a slot is free, so lazily rasterized pages are
+    never read far ahead. on_result(job, output) is called as each job finishes.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max_concurrency)
+    tasks = set()
+
+    async def run(job):
+        try:
+            on_result(job, await handler(job))
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-reader") as reader:
+        while True:
+            await slots.acquire()
+            job = await loop.run_in_executor(reader, next, jobs, None)
+            if job is None:
+                slots.release()
+                break
+            task = asyncio.ensure_future(run(job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run SuryaOCR jobs in-process, without RunPod")
+    parser.add_argument("inputs", nargs="+", metavar="input",
+                        help="A JSONL file of jobs, or PDF/image files, directories and globs")
+    parser.add_argument("--output", default="local_results.jsonl",
+                        help="JSONL file, one {\"id\", \"output\"} line per job (default: local_results.jsonl)")
+    parser.add_argument("--operation", default="ocr", help="Operation for file inputs (default: ocr)")
+    parser.add_argument("--output-format", choices=["full", "lean", "columnar"], default="full",
+                        help="Result layout for file inputs (default: full)")
+    parser.add_argument("--pages-per-job", type=int, default=1, help="Pages per job for file inputs (default: 1)")
+    parser.add_argument("--dpi", type=int, default=200, help="PDF rasterization resolution (default: 200)")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="Jobs in flight at once (default: 32)")
+    parser.add_argument("--max-batch", type=int, default=64,
+                        help="Images per shared predictor call across jobs (default: 64)")
+    parser.add_argument("--path-root", action="append", default=[],
+                        help="Directory that {\"path\": ...} image entries may read from "
+                             "(repeatable; default: the JSONL's directory and the current directory)")
+    parser.add_argument("--stub", action="store_true", help="Use benchmark.py's stub predictors (CPU, no models)")
+    parser.add_argument("--stub-lines", type=int, default=20, help="Text lines per page with --stub (default: 20)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the worker's per-job log lines")
+    args = parser.parse_args()
+
+    jsonl = len(args.inputs) == 1 and args.inputs[0].endswith(".jsonl")
+    path_roots = args.path_root or ([str(Path(args.inputs[0]).resolve().parent)] if jsonl else []) + [os.getcwd()]
+
+    # The worker reads its configuration at import time
+    os.environ["MICROBATCH_MAX_BATCH"] = str(args.max_batch)
+    os.environ["FETCH_PATH_ROOTS"] = ":".join(path_roots)
+    os.environ.setdefault("LOG_LEVEL", "info" if args.verbose else "warning")
+    import handler_final
+    if args.stub:
+        import benchmark
+        benchmark.install_stub_models(lines_per_page=args.stub_lines)
+
+    if jsonl:
+        jobs = iter_job_lines(args.inputs[0])
+        operations = ["ocr"]
+    else:
+        if args.operation not in handler_final.OPERATIONS:
+            parser.error(f"--operation must be one of {', '.join(handler_final.OPERATIONS)}")
+        jobs = iter_file_jobs(args.inputs, {"operation": args.operation, "output_format": args.output_format},
+                              max(1, args.pages_per_job), args.dpi)
+        operations = [args.operation]
+    handler_final.boot(operations, warmup=False)
+
+    stats = {"jobs": 0, "failed": 0, "pages": 0}
+    with open(args.output, "a", encoding="utf-8") as out:
+        def on_result(job, output):
+            line = {"id": job["id"], "output": output}
+            if "file" in job:
+                line.update(file=job["file"], pages=job["pages"])
+            out.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n")
+            stats["jobs"] += 1
+            if isinstance(output, dict) and output.get("success"):
+                stats["pages"] += len(output.get("results", []))
+            else:
+                stats["failed"] += 1
+                print(f"  ✗ {job['id']}: {output.get('error') if isinstance(output, dict) else output}")
+            if stats["jobs"] % FLUSH_EVERY == 0:
+                out.flush()
+                print(f"  ✓ {stats['jobs']} job(s), {stats['pages']} page(s)")
+
+        started = time.perf_counter()
+        asyncio.run(run_jobs(jobs, handler_final.batch_handler, on_result, max(1, args.max_concurrency)))
+        elapsed = time.perf_counter() - started
+
+    flushes = sum(batcher.flushes for batcher in handler_final.MICRO_BATCHERS.values())
+    print("=" * 60)
+    print(f"Jobs:             {stats['jobs']} ({stats['failed']} failed)")
+    print(f"Pages:            {stats['pages']}")
+    print(f"Predictor calls:  {flushes} (shared across jobs)")
+    print(f"Time:             {elapsed:.2f}s ({stats['pages'] / elapsed if elapsed else 0:.1f} pages/s)")
+    print(f"Results:          {args.output}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
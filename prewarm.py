@@ -1,6 +1,16 @@
 #!/usr/bin/env python3
 """Pre-warm Surya models and compile CUDA kernels at Docker build time"""
 import os
+import time
+
+# DEVICE=cpu builds the CPU image: set threads and surya's device before torch/surya load
+DEVICE = os.getenv('DEVICE', 'cuda')
+CPU_THREADS = int(os.getenv('CPU_THREADS', os.cpu_count() or 4))
+if DEVICE == 'cpu':
+    os.environ['OMP_NUM_THREADS'] = str(CPU_THREADS)
+    os.environ['MKL_NUM_THREADS'] = str(CPU_THREADS)
+os.environ.setdefault('TORCH_DEVICE', DEVICE)
+
 import torch
 from surya.foundation import FoundationPredictor
 from surya.recognition import RecognitionPredictor
@@ -8,41 +18,62 @@ from surya.detection import DetectionPredictor
 from PIL import Image
 import numpy as np
 
-print('🚀 Optimizing for H100...', flush=True)
+print('🚀 Optimizing for H100...' if DEVICE == 'cuda' else f'🚀 Preparing CPU image ({CPU_THREADS} threads)...', flush=True)
 print(f'ENV: RECOGNITION_BATCH_SIZE={os.getenv("RECOGNITION_BATCH_SIZE", "not set")}', flush=True)
 print(f'ENV: DETECTOR_BATCH_SIZE={os.getenv("DETECTOR_BATCH_SIZE", "not set")}', flush=True)
 
-# Set batch sizes programmatically (fallback + override)
+# Batch sizes are ceilings: the handler picks per-call sizes from pixel/line
+# budgets and halves them on out-of-memory (see AdaptiveBatcher)
 from surya import settings
-settings.RECOGNITION_BATCH_SIZE = int(os.getenv('RECOGNITION_BATCH_SIZE', 1024))
-settings.DETECTOR_BATCH_SIZE = int(os.getenv('DETECTOR_BATCH_SIZE', 128))
+if DEVICE == 'cpu':
+    settings.RECOGNITION_BATCH_SIZE = int(os.getenv('CPU_RECOGNITION_BATCH_SIZE', 32))
+    settings.DETECTOR_BATCH_SIZE = int(os.getenv('CPU_DETECTOR_BATCH_SIZE', 4))
+else:
+    settings.RECOGNITION_BATCH_SIZE = int(os.getenv('RECOGNITION_BATCH_SIZE', 1024))
+    settings.DETECTOR_BATCH_SIZE = int(os.getenv('DETECTOR_BATCH_SIZE', 128))
 print(f'✓ Batch sizes set: RECOGNITION={settings.RECOGNITION_BATCH_SIZE}, DETECTOR={settings.DETECTOR_BATCH_SIZE}', flush=True)
 
 # Enable all optimizations
-torch.set_float32_matmul_precision('high')
-torch.backends.cudnn.benchmark = True
-torch.backends.cuda.matmul.allow_tf32 = True
+if DEVICE == 'cuda':
+    torch.set_float32_matmul_precision('high')
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+else:
+    torch.set_num_threads(CPU_THREADS)
 
 # Load models
 print('📥 Downloading Foundation model...', flush=True)
 fp = FoundationPredictor()
 
-print('📥 Downloading Recognition model...', flush=True)
-rp = RecognitionPredictor(fp)
-
 print('📥 Downloading Detection model...', flush=True)
 dp = DetectionPredictor()
 
+if DEVICE == 'cpu':
+    # Same int8 dynamic quantization the handler applies on CPU workers; checked
+    # here so an incompatible Surya upgrade fails the build, not the first job
+    for name, predictor in (('foundation', fp), ('detection', dp)):
+        predictor.model = torch.ao.quantization.quantize_dynamic(predictor.model, {torch.nn.Linear}, dtype=torch.qint8)
+        print(f'✓ {name.capitalize()} model quantizes to int8', flush=True)
+
+print('📥 Downloading Recognition model...', flush=True)
+rp = RecognitionPredictor(fp)
+
 print('✅ All models cached!', flush=True)
 
 # Pre-warm with dummy inference to compile CUDA kernels
-print('🔥 Pre-warming CUDA kernels...', flush=True)
+print('🔥 Pre-warming CUDA kernels...' if DEVICE == 'cuda' else '🔥 Test inference on CPU...', flush=True)
 dummy = Image.fromarray(np.random.randint(0, 255, (512, 512, 3), dtype=np.uint8))
 
 try:
+    # Same call shapes as the handler: detection, then recognition on known polygons
+    started = time.perf_counter()
     with torch.inference_mode():
-        _ = rp([dummy], det_predictor=dp)
-    print('✅ CUDA kernels pre-compiled!', flush=True)
+        polygons = [[box.polygon for box in pred.bboxes] for pred in dp([dummy], batch_size=1)]
+        _ = rp([dummy], polygons=polygons, recognition_batch_size=max(1, len(polygons[0])))
+    if DEVICE == 'cuda':
+        print('✅ CUDA kernels pre-compiled!', flush=True)
+    else:
+        print(f'✅ CPU inference OK ({time.perf_counter() - started:.1f}s for one page)', flush=True)
 except Exception as e:
     print(f'⚠️  Pre-warming skipped: {e}', flush=True)
     print('(Kernels will compile on first request)', flush=True)
@@ -88,6 +88,68 @@ def test_batch_ocr(image_paths: list):
     return result
 
 
+def test_ocr_image_urls(image_urls: list):
+    """Test OCR on images the worker fetches itself (no base64 upload)"""
+    print(f"\n=== Testing OCR on {len(image_urls)} image URL(s) ===")
+
+    # Create endpoint
+    endpoint = runpod.Endpoint(ENDPOINT_ID)
+
+    # Run inference
+    start_time = time.time()
+
+    run_request = endpoint.run({
+        "input": {
+            "images": [{"url": url} for url in image_urls],
+            "operation": "ocr",
+            "languages": ["en"]
+        }
+    })
+
+    # Wait for result
+    result = run_request.output()
+
+    elapsed = time.time() - start_time
+
+    print(f"\nProcessing time: {elapsed:.2f} seconds")
+    print(f"\nResults:")
+    print(json.dumps(result, indent=2))
+
+    return result
+
+
+def test_text_detection(image_path: str):
+    """Test text line detection only (no recognition model needed)"""
+    print(f"\n=== Testing Text Detection on {image_path} ===")
+
+    # Encode image
+    image_b64 = encode_image_to_base64(image_path)
+
+    # Create endpoint
+    endpoint = runpod.Endpoint(ENDPOINT_ID)
+
+    # Run inference
+    start_time = time.time()
+
+    run_request = endpoint.run({
+        "input": {
+            "images": [image_b64],
+            "operation": "detect"
+        }
+    })
+
+    # Wait for result
+    result = run_request.output()
+
+    elapsed = time.time() - start_time
+
+    print(f"\nProcessing time: {elapsed:.2f} seconds")
+    print(f"\nResults:")
+    print(json.dumps(result, indent=2))
+
+    return result
+
+
 def test_full_pipeline(image_path: str):
     """Test full OCR pipeline (detection, layout, OCR, tables, reading order)"""
     print(f"\n=== Testing Full Pipeline on {image_path} ===")
@@ -200,6 +262,15 @@ if __name__ == "__main__":
     #     "path/to/image3.jpg"
     # ])
 
+    # Test OCR on image URLs (worker downloads them)
+    # test_ocr_image_urls([
+    #     "https://example.com/page1.png",
+    #     "https://example.com/page2.png"
+    # ])
+
+    # Test text detection only
+    # test_text_detection("path/to/your/document.jpg")
+
     # Test full pipeline
     # test_full_pipeline("path/to/your/document.jpg")
 
@@ -0,0 +1,6 @@
+"""Tests run the handler in-process with benchmark.py's stub predictors (no GPU, no Surya)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "error")
@@ -0,0 +1,64 @@
+import asyncio
+import base64
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import benchmark
+import handler_final
+
+
+@pytest.fixture
+def detected(monkeypatch):
+    """Fresh result cache and stub models; returns the list of images each detection call got"""
+    monkeypatch.setattr(handler_final, "RESULT_CACHE", handler_final.ResultCache(64 * 1024 * 1024))
+    benchmark.install_stub_models(lines_per_page=3)
+    calls = []
+    detect = benchmark.StubDetectionPredictor.__call__
+    monkeypatch.setattr(benchmark.StubDetectionPredictor, "__call__",
+                        lambda self, images, *args, **kwargs: calls.append(len(images)) or
+                        detect(self, images, *args, **kwargs))
+    return calls
+
+
+def blank_page():
+    buffer = BytesIO()
+    Image.new("RGB", (400, 500), "white").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def job(images, **options):
+    return {"id": "cache", "input": {"images": images, **options}}
+
+
+def test_repeated_image_is_recognized_once(detected):
+    p0, p1 = benchmark.make_page((400, 500), seed=0), benchmark.make_page((400, 500), seed=1)
+    output = handler_final.handler(job([p0, p1, p0]))
+    assert output["success"], output
+    assert output["cache"] == {"hits": 1, "misses": 2}
+    assert sum(detected) == 2
+    assert output["results"][2] == output["results"][0]
+    assert "duplicate_of" not in output["results"][2]
+
+
+def test_repeated_image_is_copied_in_batch_and_stream_modes(detected, monkeypatch):
+    p0, p1 = benchmark.make_page((400, 500), seed=0), benchmark.make_page((400, 500), seed=1)
+    output = asyncio.run(handler_final.batch_handler(job([p0, p0, p1])))
+    assert output["cache"] == {"hits": 1, "misses": 2}
+    assert output["results"][1] == output["results"][0]
+
+    monkeypatch.setattr(handler_final, "RESULT_CACHE", handler_final.ResultCache(64 * 1024 * 1024))
+    items = list(handler_final.stream_handler(job([p1, p0, p1], stream_chunk_size=1)))
+    pages = {item.pop("index"): item for item in items}
+    assert sorted(pages) == [0, 1, 2]
+    assert pages[2] == pages[0]
+
+
+def test_blank_pages_are_neither_hits_nor_misses(detected):
+    page = benchmark.make_page((400, 500))
+    output = handler_final.handler(job([blank_page(), page, blank_page()], skip_blank=True, return_timings=True))
+    assert output["success"], output
+    assert output["cache"] == {"hits": 0, "misses": 1}
+    assert output["counts"]["blank"] == 2
+    assert [page.get("blank", False) for page in output["results"]] == [True, False, True]
@@ -0,0 +1,35 @@
+import pytest
+
+import benchmark
+import handler_final
+
+
+def job(**options):
+    return {"id": "chunks", "input": {"images": [benchmark.make_page((400, 500))] * 3,
+                                      "use_cache": False, **options}}
+
+
+@pytest.mark.parametrize("value", [0, -4, "abc", None, [2]])
+def test_bad_pipeline_chunk_size_is_rejected(value):
+    benchmark.install_stub_models(lines_per_page=3)
+    output = handler_final.handler(job(pipeline_chunk_size=value))
+    assert not output["success"]
+    assert "pipeline_chunk_size" in output["error"]
+    assert "traceback" not in output
+
+
+@pytest.mark.parametrize("value", [0, "x"])
+def test_bad_stream_chunk_size_is_rejected(value):
+    benchmark.install_stub_models(lines_per_page=3)
+    items = list(handler_final.stream_handler(job(stream_chunk_size=value)))
+    assert len(items) == 1 and not items[0]["success"]
+    assert "stream_chunk_size" in items[0]["error"]
+
+
+def test_chunk_sizes_are_cast_to_int():
+    benchmark.install_stub_models(lines_per_page=3)
+    output = handler_final.handler(job(pipeline_chunk_size="2"))
+    assert output["success"], output
+    assert len(output["results"]) == 3
+    items = list(handler_final.stream_handler(job(stream_chunk_size="1")))
+    assert sorted(item["index"] for item in items) == [0, 1, 2]
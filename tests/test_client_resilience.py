@@ -0,0 +1,61 @@
+"""batch_ocr's client against benchmark.py's local endpoint with injected faults"""
+import asyncio
+import base64
+import random
+from io import BytesIO
+
+from PIL import Image
+
+import batch_ocr
+import benchmark
+
+
+def stats():
+    return {"completed": 0, "failed": 0, "skipped": 0, "total_conversion_time": 0, "total_submit_time": 0,
+            "total_wait_time": 0, "total_processing_time": 0}
+
+
+def run(server, page_count, pages_per_job=1):
+    page = Image.open(BytesIO(base64.b64decode(benchmark.make_page((400, 500))))).convert("RGB")
+    pages = [(page_num, page.copy()) for page_num in range(1, page_count + 1)]
+    client = batch_ocr.RunPodClient(api_key="test", endpoint_id="local", api_base=server.api_base,
+                                    retry=batch_ocr.RetryPolicy(attempts=8, base_delay=0.05, max_delay=1.0,
+                                                                job_timeouts=4),
+                                    breaker=batch_ocr.CircuitBreaker(cooldown=0.5),
+                                    hedger=batch_ocr.Hedger(min_delay=0.5, default_delay=1.5))
+    job_stats = stats()
+    records = asyncio.run(batch_ocr.run_pages(pages, ["en"], job_stats, {"use_cache": False}, max_in_flight=8,
+                                              client=client, pages_per_job=pages_per_job))
+    return records, job_stats, client
+
+
+def assert_complete(records, job_stats, page_count):
+    assert job_stats["failed"] == 0, [record for record in records if "error" in record]
+    assert job_stats["completed"] == page_count
+    assert sorted(record["page"] for record in records) == list(range(1, page_count + 1))
+    for record in records:
+        assert record["result"]["success"]
+        assert len(record["result"]["results"]) == 1
+        assert record["result"]["results"][0]["text_lines"]
+
+
+def test_all_pages_complete_through_errors_throttling_and_stalls():
+    random.seed(6)
+    benchmark.install_stub_models(lines_per_page=3)
+    with benchmark.LocalRunPodServer(workers=4, error_rate=0.2, throttle_rate=0.1,
+                                     stall_rate=0.1, stall_seconds=3.0) as server:
+        records, job_stats, client = run(server, 24)
+        faults = dict(server.faults)
+    assert_complete(records, job_stats, 24)
+    assert faults["errors"] and faults["throttled"]
+    assert client.retry.retries
+
+
+def test_packed_pages_complete_through_an_outage():
+    random.seed(6)
+    benchmark.install_stub_models(lines_per_page=3)
+    with benchmark.LocalRunPodServer(workers=2, error_rate=0.1, outage=(0.2, 1.5)) as server:
+        records, job_stats, client = run(server, 16, pages_per_job=4)
+        faults = dict(server.faults)
+    assert_complete(records, job_stats, 16)
+    assert faults["outage"]
@@ -0,0 +1,93 @@
+"""{"url": ...} and {"path": ...} image references against a local HTTP server"""
+import base64
+import http.server
+import threading
+
+import pytest
+
+import benchmark
+import handler_final
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    page = b""
+
+    def do_GET(self):
+        if self.path == "/page.png":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(self.page)))
+            self.end_headers()
+            self.wfile.write(self.page)
+        elif self.path.startswith("/redirect"):
+            self.send_response(302)
+            self.send_header("Location", self.path.split("?to=", 1)[1])
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    PageHandler.page = base64.b64decode(benchmark.make_page((400, 500)))
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(handler_final, "FETCH_URL_HOSTS", ["127.0.0.1"])
+    benchmark.install_stub_models(lines_per_page=3)
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def ocr(*images):
+    return handler_final.handler({"id": "fetch", "input": {"images": list(images), "use_cache": False}})
+
+
+def test_url_images_are_fetched(server):
+    output = ocr({"url": f"{server}/page.png"}, {"url": f"{server}/page.png"})
+    assert output["success"], output
+    assert [len(page["text_lines"]) for page in output["results"]] == [3, 3]
+
+
+def test_missing_url_fails_the_job(server):
+    output = ocr({"url": f"{server}/missing.png"})
+    assert not output["success"]
+    assert "404" in output["error"]
+
+
+def test_fetch_max_bytes_is_enforced(server, monkeypatch):
+    monkeypatch.setattr(handler_final, "FETCH_MAX_BYTES", len(PageHandler.page) - 1)
+    output = ocr({"url": f"{server}/page.png"})
+    assert not output["success"]
+    assert "exceeds" in output["error"]
+
+
+def test_private_addresses_are_refused_without_an_allowlist(server, monkeypatch):
+    monkeypatch.setattr(handler_final, "FETCH_URL_HOSTS", [])
+    for url in (f"{server}/page.png", "http://169.254.169.254/latest/meta-data/"):
+        output = ocr({"url": url})
+        assert not output["success"]
+        assert "non-public address" in output["error"]
+
+
+def test_redirects_are_checked(server):
+    output = ocr({"url": f"{server}/redirect?to=http://localhost:1/page.png"})
+    assert not output["success"]
+    assert "FETCH_URL_HOSTS" in output["error"]
+    output = ocr({"url": f"{server}/redirect?to={server}/page.png"})
+    assert output["success"], output
+
+
+def test_paths_must_be_under_fetch_path_roots(tmp_path, monkeypatch):
+    benchmark.install_stub_models(lines_per_page=3)
+    monkeypatch.setattr(handler_final, "FETCH_PATH_ROOTS", [str(tmp_path)])
+    (tmp_path / "page.png").write_bytes(base64.b64decode(benchmark.make_page((400, 500))))
+    output = ocr({"path": str(tmp_path / "page.png")})
+    assert output["success"], output
+    for path in ("/etc/passwd", str(tmp_path / ".." / "elsewhere.png")):
+        output = ocr({"path": path})
+        assert not output["success"]
+        assert "outside the allowed roots" in output["error"]
@@ -0,0 +1,46 @@
+import json
+
+import batch_ocr
+
+
+def result(page):
+    return {"page": page, "job_id": f"job-{page}", "result": {"success": True, "results": [{"text": str(page)}]}}
+
+
+def test_completions_are_synced_in_batches(tmp_path, monkeypatch):
+    fsyncs = []
+    monkeypatch.setattr(batch_ocr.os, "fsync", fsyncs.append)
+    manifest = batch_ocr.CorpusManifest(tmp_path, sync_every=4, sync_interval=3600)
+    for page in range(1, 11):
+        manifest.record_submit("a.pdf", "hash", page, f"job-{page}", 0)
+        manifest.record_result("a.pdf", "hash", page, result(page))
+    assert len(fsyncs) == 2
+    manifest.close()
+    assert len(fsyncs) == 3
+
+    replayed = batch_ocr.CorpusManifest(tmp_path)
+    assert replayed.completed_pages("hash") == set(range(1, 11))
+    offsets = [replayed.state[("hash", page)]["offset"] for page in range(1, 11)]
+    assert [record["page"] for record in batch_ocr.iter_records(replayed.results_path, offsets)] == list(range(1, 11))
+    replayed.close()
+
+
+def test_unsynced_completions_replay_as_in_flight(tmp_path):
+    manifest = batch_ocr.CorpusManifest(tmp_path, sync_every=4, sync_interval=3600)
+    for page in range(1, 7):
+        manifest.record_submit("a.pdf", "hash", page, f"job-{page}", 0)
+        manifest.record_result("a.pdf", "hash", page, result(page))
+    manifest.record_submit("a.pdf", "hash", 7, "job-7", 0)
+    manifest.record_result("a.pdf", "hash", 7, {"page": 7, "job_id": "job-7", "error": "boom"})
+    # Simulate a crash: the last two completions never reach the manifest, submits and failures do
+    manifest._manifest.close()
+    manifest._results.close()
+
+    with open(tmp_path / "manifest.jsonl", encoding="utf-8") as f:
+        statuses = [json.loads(line)["status"] for line in f]
+    assert statuses.count("completed") == 4
+    replayed = batch_ocr.CorpusManifest(tmp_path)
+    assert replayed.completed_pages("hash") == {1, 2, 3, 4}
+    assert sorted(entry["page"] for entry in replayed.in_flight()) == [5, 6]
+    assert replayed.status("hash", 7) == "failed"
+    replayed.close()
@@ -0,0 +1,82 @@
+import pytest
+
+import benchmark
+import handler_final
+
+
+def oom():
+    return RuntimeError("CUDA out of memory")
+
+
+@pytest.fixture
+def recognition(monkeypatch):
+    batcher = handler_final.AdaptiveBatcher("recognition", 1024, 100_000, lines=True)
+    monkeypatch.setattr(handler_final, "RECOGNITION_BATCHER", batcher)
+    return batcher
+
+
+def test_dense_page_retries_at_a_lower_line_batch_size(recognition):
+    benchmark.install_stub_models(lines_per_page=40, oom_lines=16)
+    output = handler_final.handler({"id": "oom", "input": {
+        "images": [benchmark.make_page((800, 1000))], "use_cache": False}})
+    assert output["success"], output
+    assert len(output["results"][0]["text_lines"]) == 40
+    # 40 lines at once, then 20, both over the limit; 10 fits
+    assert recognition.ooms == 2
+    assert recognition.batch_size == 10
+    assert recognition.budget == 100_000
+
+
+def test_line_batch_size_counts_lines_not_pages(recognition):
+    benchmark.install_stub_models(lines_per_page=40, oom_lines=200)
+    output = handler_final.handler({"id": "oom", "input": {
+        "images": [benchmark.make_page((800, 1000), seed=seed) for seed in range(8)], "use_cache": False}})
+    assert output["success"], output
+    # 320 lines OOM, 160 fit: the ceiling must not collapse to a page count
+    assert recognition.ooms == 1
+    assert recognition.batch_size == 160
+
+
+def test_pages_are_split_once_line_batching_is_exhausted():
+    batcher = handler_final.AdaptiveBatcher("recognition", 8, 100, lines=True)
+    calls = []
+
+    def run(items, batch_size):
+        calls.append((len(items), batch_size))
+        if len(items) > 1:
+            raise oom()
+        return items
+
+    assert batcher.run(["a", "b", "c"], [2, 2, 2], run) == ["a", "b", "c"]
+    assert calls[:3] == [(3, 8), (3, 3), (3, 1)]
+    assert batcher.batch_size == 1
+    assert batcher.budget == 25  # split twice: [a] [b c], then [b] [c]
+
+
+def test_single_page_that_never_fits_fails():
+    batcher = handler_final.AdaptiveBatcher("recognition", 8, 100, lines=True)
+
+    def run(items, batch_size):
+        raise oom()
+
+    with pytest.raises(RuntimeError):
+        batcher.run(["a"], [4], run)
+    assert batcher.batch_size == 1
+
+
+def test_item_batchers_split_items_and_leave_single_items_alone():
+    batcher = handler_final.AdaptiveBatcher("detection", 8, 100)
+    calls = []
+
+    def run(items, batch_size):
+        calls.append((len(items), batch_size))
+        if len(items) > 2 or items == ["big"]:
+            raise oom()
+        return items
+
+    assert batcher.run(list("abcd"), [1] * 4, run) == list("abcd")
+    assert calls == [(4, 8), (2, 2), (2, 2)]
+    assert batcher.batch_size == 2
+    with pytest.raises(RuntimeError):
+        batcher.run(["big"], [1], run)
+    assert batcher.batch_size == 2
@@ -0,0 +1,28 @@
+import pytest
+
+import batch_ocr
+import benchmark
+import handler_final
+
+
+def ocr(output_format):
+    benchmark.install_stub_models(lines_per_page=3)
+    return handler_final.handler({"id": "formats", "input": {"output_format": output_format, "use_cache": False,
+                                                             "images": [{"data": benchmark.make_page((800, 600)),
+                                                                         "regions": {"name": [10, 10, 300, 60],
+                                                                                     "date": [400, 10, 700, 60]}}]}})
+
+
+@pytest.mark.parametrize("output_format", ["lean", "columnar"])
+def test_named_regions_survive_compact_formats(output_format):
+    output = batch_ocr.decode_output(ocr(output_format))
+    assert output["success"], output
+    assert [line["region"] for line in output["results"][0]["text_lines"]] == ["name", "date"]
+
+
+def test_decoded_columnar_output_is_row_shaped_and_decodes_again():
+    output = batch_ocr.decode_output(ocr("columnar"))
+    assert "format" not in output
+    lines = output["results"][0]["text_lines"]
+    assert [set(line) for line in lines] == [{"text", "confidence", "bbox", "region"}] * 2
+    assert batch_ocr.decode_output(output) == output
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from PIL import Image
+
+import batch_ocr
+
+
+def test_page_runs_group_consecutive_pages():
+    assert batch_ocr._page_runs([1, 2, 3, 5, 6, 9], 8) == [(1, 3), (5, 6), (9, 9)]
+    assert batch_ocr._page_runs(list(range(1, 8)), 3) == [(1, 3), (4, 6), (7, 7)]
+    assert batch_ocr._page_runs([], 8) == []
+
+
+def test_resumed_pdf_renders_only_pending_pages(tmp_path, monkeypatch):
+    rendered = []
+
+    def convert_from_path(path, dpi, first_page, last_page):
+        rendered.extend(range(first_page, last_page + 1))
+        return [Image.new("RGB", (10, 10), "white") for _ in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(batch_ocr, "PDF_SUPPORT", True)
+    monkeypatch.setattr(batch_ocr, "pdf2image", SimpleNamespace(
+        pdfinfo_from_path=lambda path: {"Pages": 10}, convert_from_path=convert_from_path), raising=False)
+    (tmp_path / "doc.pdf").write_bytes(b"%PDF-1.4")
+
+    page_count, pages = batch_ocr.extract_images(tmp_path / "doc.pdf", raster_workers=2,
+                                                 skip_pages={1, 2, 3, 4, 6, 7, 10})
+    assert page_count == 10
+    assert sorted(page for page, _ in pages) == [5, 8, 9]
+    assert sorted(rendered) == [5, 8, 9]
+
+
+def test_done_image_file_is_not_loaded(tmp_path, monkeypatch):
+    Image.new("RGB", (10, 10), "white").save(tmp_path / "page.png")
+    opened = []
+    monkeypatch.setattr(batch_ocr.Image, "open", lambda *args: opened.append(args) or Image.new("RGB", (1, 1)))
+    page_count, pages = batch_ocr.extract_images(tmp_path / "page.png", skip_pages={1})
+    assert page_count == 1
+    assert list(pages) == []
+    assert opened == []
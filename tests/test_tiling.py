@@ -0,0 +1,29 @@
+import benchmark
+import handler_final
+
+
+def run_job(monkeypatch, tiling):
+    """OCR one 3000x3000 page with small tiles; returns (result, number of tiled detections)"""
+    benchmark.install_stub_models(lines_per_page=10)
+    monkeypatch.setattr(handler_final, "TILE_SIZE", 1024)
+    monkeypatch.setattr(handler_final, "TILE_MIN_PIXELS", 1_000_000)
+    monkeypatch.setattr(handler_final, "DECODE_TARGET_PIXELS", 0)  # keep full resolution either way
+    tiled = []
+    detect_tiled = handler_final.detect_tiled
+    monkeypatch.setattr(handler_final, "detect_tiled", lambda img: tiled.append(img.size) or detect_tiled(img))
+    output = handler_final.handler({"id": "tiling", "input": {
+        "images": [benchmark.make_page((3000, 3000))], "tiling": tiling, "use_cache": False}})
+    assert output["success"], output
+    return output["results"][0], len(tiled)
+
+
+def test_tiling_on_detects_large_pages_in_tiles(monkeypatch):
+    result, tiled = run_job(monkeypatch, tiling=True)
+    assert tiled == 1
+    assert result["text_lines"]
+
+
+def test_tiling_off_never_tiles(monkeypatch):
+    result, tiled = run_job(monkeypatch, tiling=False)
+    assert tiled == 0
+    assert result["text_lines"]